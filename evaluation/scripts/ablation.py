@@ -0,0 +1,277 @@
+"""
+Module for searching the combination of opaque functions and axiomatizations with which a program verifies fastest.
+
+Starting from the program as it is (the baseline), every toggle is tried on its own: making a pure function opaque or
+transparent (the opaque annotation in Gobra, @opaque() in Viper), and disabling the axiomatization of set operations.
+The search then runs in two stages:
+1. Screening: all variants are profiled with a few iterations in parallel. Variants that do not verify are discarded,
+   and variants whose median execution time is clearly worse than the best one are pruned (except for the baseline).
+2. Final: the remaining variants, and one combining all toggles that were faster than the baseline, are profiled with
+   the full number of iterations.
+The results of all variants are written to a table, and the variant with the lowest median execution time (and median
+total number of instantiations, on ties) is reported.
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import argparse
+import logging
+import re
+from concurrent.futures import as_completed
+from pathlib import Path
+
+import profile
+from suite import summarize
+
+# Declarations of pure functions, whose opaqueness can be toggled.
+GOBRA_FUNCTION = re.compile(r"^\s*pure\s+func\s+(?:\([^)]*\)\s*)?(\w+)")
+VIPER_FUNCTION = re.compile(r"^\s*function\s+(\w+)\s*\(")
+
+TOGGLE_SET_AXIOMATIZATION = "no_set_axiom"
+
+
+def main():
+    """Main function of the ablation search."""
+    # Set up logging.
+    logging.basicConfig(level=logging.DEBUG)
+
+    args, profile_args = parse_args()
+    lines = args.program_path.read_text().splitlines(keepends=True)
+    functions = toggleable_functions(lines, args.program_path.suffix)
+    if args.functions is not None:
+        unknown = set(args.functions) - set(functions)
+        if unknown:
+            logging.error(f"No pure functions named {', '.join(sorted(unknown))} in {args.program_path}.")
+            raise ValueError(f"No pure functions named {', '.join(sorted(unknown))} in {args.program_path}.")
+        functions = {name: functions[name] for name in args.functions}
+    logging.info(f"Toggling the opaqueness of {len(functions)} functions: {', '.join(functions)}.")
+
+    toggles = list(functions)
+    if "--disableSetAxiomatization" not in profile_args:
+        toggles.append(TOGGLE_SET_AXIOMATIZATION)
+    variants = {"baseline": []} | {toggle_name(toggle, functions): [toggle] for toggle in toggles}
+
+    summaries = {}
+    try:
+        # Stage 1: screening.
+        screening = profile_variants(args, profile_args, lines, functions, variants, args.screening_iterations)
+        verified = {name: summary for name, summary in screening.items() if summary["status"] == "ok"}
+        if "baseline" not in verified:
+            logging.error("The baseline does not verify.")
+            raise RuntimeError("The baseline does not verify.")
+
+        best_time = min(summary["median_execution_time"] for summary in verified.values())
+        # The baseline is never pruned, as the other variants are compared to it.
+        survivors = {name: variants[name] for name in verified
+                     if name == "baseline" or verified[name]["median_execution_time"] <= args.prune_factor * best_time}
+        for name, summary in screening.items():
+            summaries[name] = summary | {"stage": "screening"}
+            if summary["status"] == "ok" and name not in survivors:
+                summaries[name]["status"] = "pruned"
+        logging.info(f"{len(survivors)} of {len(variants)} variants survived the screening.")
+
+        # Combine all toggles that were faster than the baseline on their own.
+        baseline_time = verified["baseline"]["median_execution_time"]
+        improvements = [variants[name][0] for name in survivors
+                        if name != "baseline" and verified[name]["median_execution_time"] < baseline_time]
+        if len(improvements) > 1:
+            survivors["combined"] = improvements
+            variants["combined"] = improvements
+
+        # Stage 2: profile the survivors with all iterations.
+        final = profile_variants(args, profile_args, lines, functions, survivors, args.iterations)
+        for name, summary in final.items():
+            summaries[name] = summary | {"stage": "final"}
+    finally:
+        remove_variant_programs(args.program_path, variants)
+
+    for name, summary in summaries.items():
+        summary["toggles"] = " ".join(variants[name])
+    profile.write_to_csv([{"variant": name} | summary for name, summary in summaries.items()],
+                         args.output_dir / f"{args.program_path.stem}-ablation.csv")
+
+    candidates = [name for name, summary in summaries.items()
+                  if summary["stage"] == "final" and summary["status"] == "ok"]
+    if not candidates:
+        logging.error("No variant verified in the final stage.")
+        raise RuntimeError("No variant verified in the final stage.")
+    best = min(candidates, key=lambda name: (summaries[name]["median_execution_time"],
+                                             summaries[name]["median_qi_total"]))
+    logging.info(f"Best variant: {best} ({summaries[best]['toggles'] or 'no toggles'}), "
+                 f"{summaries[best]['median_execution_time']} s, {summaries[best]['median_qi_total']} instantiations "
+                 f"(baseline: {summaries['baseline']['median_execution_time']} s, "
+                 f"{summaries['baseline']['median_qi_total']} instantiations).")
+
+
+def toggleable_functions(lines, suffix):
+    """Returns a dictionary that maps the names of the pure functions of a program to the index of their declaration
+    and the index of their opaque annotation (None if they are not opaque).
+
+    The annotation is searched for in the specification block above the declaration (see specification).
+    """
+    declaration = GOBRA_FUNCTION if suffix == ".gobra" else VIPER_FUNCTION
+    annotation = "opaque" if suffix == ".gobra" else "@opaque()"
+
+    functions = {}
+    for i, line in enumerate(lines):
+        match = declaration.match(line)
+        if match is None:
+            continue
+
+        opaque = None
+        for j, code in specification(lines, i):
+            if code == annotation:
+                opaque = j
+        functions.setdefault(match[1], (i, opaque))
+    return functions
+
+
+def specification(lines, declaration):
+    """Yields the indices and the code (without comments) of the lines in the specification block above the
+    declaration, from the bottom up.
+
+    The block ends at an empty line or the end of the previous declaration. Comment lines are skipped, and comments at
+    the end of a line (e.g., opaque // TODO ...) are removed from its code.
+    """
+    j = declaration - 1
+    while j >= 0 and lines[j].strip():
+        code = lines[j].split("//", 1)[0].strip()
+        if code.startswith("}"):
+            return
+        if code:
+            yield j, code
+        j -= 1
+
+
+def toggle_name(toggle, functions):
+    """Returns the name of the variant with a single toggle, e.g., "opaque_Union" or "transparent_Union"."""
+    if toggle == TOGGLE_SET_AXIOMATIZATION:
+        return "without_set_axioms"
+    _, opaque = functions[toggle]
+    return f"{'transparent' if opaque is not None else 'opaque'}_{toggle}"
+
+
+def variant_lines(lines, suffix, functions, toggles):
+    """Returns the lines of the program with the opaqueness of the given functions toggled."""
+    lines = list(lines)
+    # Edit from the bottom, so that the indices of the remaining functions stay valid.
+    edits = sorted((functions[toggle] for toggle in toggles if toggle != TOGGLE_SET_AXIOMATIZATION), reverse=True)
+    for declaration, opaque in edits:
+        if opaque is not None:
+            del lines[opaque]
+            continue
+
+        indentation = lines[declaration][:len(lines[declaration]) - len(lines[declaration].lstrip())]
+        if suffix == ".gobra":
+            # Put the annotation right after "ghost", as done in the library.
+            position = declaration
+            for j, code in specification(lines, declaration):
+                if code == "ghost":
+                    position = j + 1
+            lines.insert(position, f"{indentation}opaque\n")
+        else:
+            lines.insert(declaration, f"{indentation}@opaque()\n")
+    return lines
+
+
+def variant_path(program_path, name):
+    """Returns the path of the program of a variant. It is next to the program, so that relative includes still work."""
+    return program_path.with_name(f"{program_path.stem}_ablation_{name}{program_path.suffix}")
+
+
+def profile_variants(args, profile_args, lines, functions, variants, iterations):
+    """Profile the variants with args.jobs workers (see profile.job_pool) and return a dictionary that maps their names
+    to their summaries.
+
+    The summaries are in the format of suite.summarize; variants that do not verify have the status "failed".
+    """
+    jobs = {}
+    for name, toggles in variants.items():
+        path = variant_path(args.program_path, name)
+        path.write_text("".join(variant_lines(lines, args.program_path.suffix, functions, toggles)))
+        argv = [str(path), "--iterations", str(iterations), "--output_dir", str(args.output_dir)] + profile_args
+        if TOGGLE_SET_AXIOMATIZATION in toggles:
+            argv.append("--disableSetAxiomatization")
+        jobs[name] = argv
+        # Check the command line before profiling anything.
+        profile.parse_args(argv)
+
+    summaries = {}
+    logging.info(f"Profiling {len(jobs)} variants with {iterations} iterations on {args.jobs} workers.")
+    with profile.job_pool(args.jobs) as executor:
+        futures = {executor.submit(run_variant, argv): name for name, argv in jobs.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                csv_path = future.result()
+            except (RuntimeError, ValueError) as e:
+                logging.warning(f"Variant {name} does not verify: {e}")
+                summaries[name] = {"status": "failed"}
+                continue
+            summaries[name] = summarize(name, csv_path, args.output_dir, 1)
+            del summaries[name]["package"]
+            logging.info(f"Variant {name}: {summaries[name]['median_execution_time']} s, "
+                         f"{summaries[name]['median_qi_total']} instantiations.")
+
+    # Killed iterations count as not verifying.
+    for summary in summaries.values():
+        if summary["status"] == "killed":
+            summary["status"] = "failed"
+    return summaries
+
+
+def run_variant(argv):
+    """Profile a variant in the current worker process and return the path to the CSV file."""
+    return profile.profile_program(profile.parse_args(argv))
+
+
+def remove_variant_programs(program_path, variants):
+    """Remove the programs of the variants and their translations."""
+    for name in variants:
+        path = variant_path(program_path, name)
+        path.unlink(missing_ok=True)
+        path.with_suffix(".gobra.vpr").unlink(missing_ok=True)
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns the parsed arguments and the remaining arguments, which are passed to profile.py for every variant.
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, allow_abbrev=False,
+                                     epilog=("All other arguments (e.g., --silicon_path or --z3RandomizeSeeds) are "
+                                             "passed to profile.py for every variant."))
+    parser.add_argument("program_path", type=ablation_program_path,
+                        help="Gobra or Viper program whose variants are profiled")
+    parser.add_argument("--functions", type=str, nargs="+", required=False,
+                        help="pure functions whose opaqueness is toggled (defaults to all pure functions)")
+    parser.add_argument("--output_dir", type=Path, required=False,
+                        help="directory of the CSV files and the results table (defaults to <program>-ablation)")
+    parser.add_argument("--screening_iterations", type=profile.positive, required=False, default=3,
+                        help="number of iterations with which every variant is screened")
+    parser.add_argument("--iterations", type=profile.positive, required=False, default=10,
+                        help="number of iterations with which the variants surviving the screening are profiled")
+    parser.add_argument("--prune_factor", type=profile.positive_float, required=False, default=1.5,
+                        help=("variants whose median execution time in the screening exceeds the best one by more "
+                              "than this factor are pruned"))
+    parser.add_argument("--jobs", type=profile.positive, required=False, default=1,
+                        help="number of variants profiled in parallel, each pinned to its own core if more than one")
+    args, profile_args = parser.parse_known_args()
+    if args.output_dir is None:
+        args.output_dir = args.program_path.parent / f"{args.program_path.stem}-ablation"
+    return args, profile_args
+
+
+def ablation_program_path(string):
+    """Checks that the string is a valid path to a Gobra or Viper program (but not a package)."""
+    path = profile.program_path(string)
+    if path.is_dir():
+        raise argparse.ArgumentTypeError(f"{path} is a package; please give a single Gobra or Viper file")
+
+    return path
+
+
+if __name__ == "__main__":
+    main()
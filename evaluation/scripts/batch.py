@@ -0,0 +1,310 @@
+"""
+Module for profiling all experiments of a manifest in a single process and plotting the results.
+
+The manifest is a JSON file of the following form, in which paths are relative to the manifest:
+
+    {
+        "args": ["--z3RandomizeSeeds"],
+        "plot_args": ["--qi_size", "9", "9"],
+        "experiments": [
+            {"programs": "../experiments/synthetic_set/fully_assisted/fully_assisted.gobra",
+             "args": ["--disableSetAxiomatization"]},
+            {"programs": "../experiments/**/*.gobra"}
+        ]
+    }
+
+Every program matched by the glob pattern of an experiment is profiled with the arguments of profile.py given by the
+top-level "args", the experiment's "args" and the arguments passed to this script that it does not know itself (e.g.,
+the tool paths and the iteration policy). "plot_args" are passed to plot.py for every resulting CSV file.
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import argparse
+import functools
+import glob
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from pathlib import Path
+
+import profile
+from cache import hash_value
+from util import file_path
+
+
+def main():
+    """Main function of the batch profiler."""
+    # Set up logging.
+    logging.basicConfig(level=logging.DEBUG)
+
+    args, profile_args = parse_args()
+
+    with open(args.manifest) as manifest_file:
+        manifest = json.load(manifest_file)
+    jobs = expand_manifest(manifest, args.manifest.parent, profile_args)
+    # Check all command lines before profiling anything, so that a typo does not stop a sweep halfway through.
+    for job in jobs:
+        profile.parse_args(job["argv"])
+
+    state_path = args.state or args.manifest.with_suffix(".state.json")
+    state = load_state(state_path, args.restart)
+
+    pending = [job for job in jobs if not is_completed(state, job)]
+    logging.info(f"{len(jobs) - len(pending)} of {len(jobs)} jobs are already completed.")
+    if args.interleave:
+        failed = run_interleaved(args, pending, state, state_path)
+    else:
+        failed = run_jobs(args, schedule(pending, state), state, state_path)
+
+    if not args.skip_plots:
+        csv_paths = [Path(state["completed"][job["key"]]) for job in jobs if is_completed(state, job)]
+        render_plots(manifest.get("plot_args", []), csv_paths)
+
+    if failed:
+        logging.error(f"{len(failed)} jobs failed: {', '.join(str(job['program']) for job in failed)}.")
+        raise RuntimeError(f"{len(failed)} jobs failed.")
+
+
+def expand_manifest(manifest, base_dir, profile_args):
+    """Returns the jobs described by the manifest, one per program and experiment, in the order of the manifest.
+
+    A job is a dictionary with the program, a label naming the program and its variant flags, the command line of
+    profile.py (argv), the key identifying the job in the state file, and the key identifying the program and its
+    variant flags across sweeps (used for the run times).
+    """
+    jobs = []
+    for experiment in manifest["experiments"]:
+        pattern = os.path.join(base_dir, experiment["programs"])
+        programs = sorted(glob.glob(pattern, recursive=True))
+        if not programs:
+            logging.warning(f"No program matches {pattern}.")
+
+        for program in programs:
+            variant_args = manifest.get("args", []) + experiment.get("args", [])
+            argv = [program] + variant_args + profile_args
+            jobs.append({"program": Path(program),
+                         "label": " ".join([Path(program).name] + variant_args),
+                         "argv": argv,
+                         "key": hash_value([str(Path(program).resolve())] + argv[1:]),
+                         "runtime_key": hash_value([str(Path(program).resolve())] + variant_args)})
+    return jobs
+
+
+def load_state(state_path, restart=False):
+    """Load the state of earlier sweeps, i.e., the CSV files of completed jobs and the run times of all jobs."""
+    state = {"completed": {}, "runtimes": {}}
+    if state_path.is_file():
+        with open(state_path) as state_file:
+            state.update(json.load(state_file))
+    if restart:
+        # The run times are kept, since they are still useful for scheduling.
+        state["completed"] = {}
+    return state
+
+
+def save_state(state, state_path):
+    """Write the state atomically, so that an interrupted sweep never leaves a corrupt state file behind."""
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=state_path.parent, delete=False) as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(state_file.name, state_path)
+
+
+def is_completed(state, job):
+    """Checks whether the job has been completed in an earlier sweep and its CSV file still exists."""
+    csv_path = state["completed"].get(job["key"])
+    return csv_path is not None and os.path.isfile(csv_path)
+
+
+def schedule(jobs, state):
+    """Order the jobs longest first, based on their run times in earlier sweeps.
+
+    Jobs that have never been run are started first, largest program first, since they may take arbitrarily long.
+    Starting the longest jobs first keeps a single long job from running alone at the end of the sweep.
+    """
+    def priority(job):
+        runtime = state["runtimes"].get(job["runtime_key"])
+        if runtime is None:
+            return 1, job["program"].stat().st_size
+        return 0, runtime
+
+    return sorted(jobs, key=priority, reverse=True)
+
+
+def run_jobs(args, jobs, state, state_path):
+    """Run the jobs with args.jobs workers (see profile.job_pool) and return the failed jobs.
+
+    The state is saved after every job, so that an interrupted sweep can be resumed.
+    """
+    if not jobs:
+        return []
+
+    failed = []
+    logging.info(f"Running {len(jobs)} jobs on {args.jobs} workers.")
+    with profile.job_pool(args.jobs) as executor:
+        pending = list(jobs)
+        running = {}
+        while pending or running:
+            # Start the longest pending jobs, but never two jobs on the same program at once, since they would both
+            # write the translation of the program to the same Viper file.
+            for job in list(pending):
+                if len(running) == args.jobs:
+                    break
+                if all(job["program"] != other["program"] for other in running.values()):
+                    pending.remove(job)
+                    running[executor.submit(run_job, job["argv"])] = job
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                try:
+                    csv_path, runtime = future.result()
+                except Exception as e:
+                    logging.error(f"Profiling {job['program']} failed: {e}")
+                    failed.append(job)
+                    continue
+
+                logging.info(f"Profiled {job['program']} in {runtime} seconds.")
+                state["completed"][job["key"]] = str(csv_path.resolve())
+                state["runtimes"][job["runtime_key"]] = runtime
+                save_state(state, state_path)
+
+    return failed
+
+
+def run_interleaved(args, jobs, state, state_path):
+    """Run the iterations of all jobs interleaved in the current process and return the failed jobs.
+
+    Instead of running all iterations of one job after the other, every round runs one iteration of every job, in a
+    random order that changes from round to round. Slow drifts of the machine's speed (e.g., due to its temperature or
+    background activity) then affect all jobs alike instead of the jobs that happen to run at the time, which makes
+    small differences between variants trustworthy. Warm-up iterations (--warmup) of a job are run right before its
+    first iteration. With --cache_dir, the iterations of an interrupted sweep are taken from the cache.
+    """
+    failed = []
+    runs = []
+    for job in jobs:
+        job_args = profile.parse_args(job["argv"])
+        if job_args.jobs > 1 or job_args.viperserver_path is not None or job_args.target_precision is not None:
+            logging.error(f"{job['program']}: --interleave cannot be combined with --jobs, --viperserver_path or "
+                          f"--target_precision.")
+            raise ValueError("--interleave cannot be combined with --jobs, --viperserver_path or --target_precision.")
+        try:
+            cache, metadata, vpr_file_path = profile.prepare_program(job_args)
+        except (RuntimeError, ValueError) as e:
+            logging.error(f"Preparing {job['program']} failed: {e}")
+            failed.append(job)
+            continue
+
+        run = functools.partial(run_job_iterations, job_args, vpr_file_path)
+        if job_args.warmup:
+            run = profile.warmed_up_runner(run, job_args.warmup)
+        # Timelines are not cached, so iterations have to be rerun to get them.
+        if cache is not None and not job_args.timeline:
+            run = profile.cached_runner(run, cache, profile.results_key(job_args, metadata, vpr_file_path))
+        runs.append({"job": job, "args": job_args, "cache": cache, "metadata": metadata, "run": run, "results": [],
+                     "runtime": 0})
+
+    rng = random.Random(args.seed)
+    rounds = max((run["args"].iterations for run in runs), default=0)
+    for i in range(0, rounds):
+        order = [run for run in runs if run["job"] not in failed and i < run["args"].iterations]
+        rng.shuffle(order)
+        logging.info(f"Round {i + 1} of {rounds}: {', '.join(run['job']['label'] for run in order)}.")
+        for run in order:
+            start_time = time.time()
+            try:
+                run["results"] += run["run"]([i])
+            except RuntimeError as e:
+                logging.error(f"Profiling {run['job']['program']} failed: {e}")
+                failed.append(run["job"])
+            run["runtime"] += time.time() - start_time
+
+    for run in runs:
+        if run["job"] in failed:
+            continue
+        data = [data_point for data_point, _ in run["results"]]
+        details = [iteration_details for _, iteration_details in run["results"]]
+        csv_path = profile.write_results(run["args"], run["metadata"], data, details, cache=run["cache"])
+        logging.info(f"Profiled {run['job']['program']} in {run['runtime']} seconds.")
+        state["completed"][run["job"]["key"]] = str(csv_path.resolve())
+        state["runtimes"][run["job"]["runtime_key"]] = run["runtime"]
+        save_state(state, state_path)
+
+    return failed
+
+
+def run_job_iterations(args, vpr_file_path, indices):
+    """Run the iterations with the given indices of a job one after another in the current process."""
+    return [profile.run_iteration(args, vpr_file_path, i) for i in indices]
+
+
+def run_job(argv):
+    """Profile a program in the current worker process and return the path to the CSV file and the run time."""
+    start_time = time.time()
+    csv_path = profile.profile_program(profile.parse_args(argv))
+    return csv_path, time.time() - start_time
+
+
+def render_plots(plot_args, csv_paths):
+    """Plot every CSV file that changed since it was last plotted, all in the current process."""
+    csv_paths = [csv_path for csv_path in csv_paths if is_outdated(csv_path)]
+    if not csv_paths:
+        logging.info("All plots are up to date.")
+        return
+
+    # pandas, seaborn and matplotlib are only needed for plotting, so they are only imported once profiling is done.
+    import plot
+
+    for csv_path in csv_paths:
+        logging.info(f"Plotting {csv_path}.")
+        plot_args_of_csv = plot.parse_args(plot_args + [str(csv_path)])
+        plot.plot(plot_args_of_csv, csv_path)
+
+
+def is_outdated(csv_path):
+    """Checks whether the CSV file is newer than its plot of quantifier instantiations."""
+    pdf_path = Path(f"{csv_path.with_suffix('')}.qi.pdf")
+    return not pdf_path.is_file() or pdf_path.stat().st_mtime < csv_path.stat().st_mtime
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns the parsed arguments and the remaining arguments, which are passed to profile.py for every job.
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, allow_abbrev=False,
+                                     epilog=("All other arguments (e.g., --silicon_path or --iterations) are passed to "
+                                             "profile.py for every job."))
+    parser.add_argument("manifest", type=file_path,
+                        help="JSON file describing the experiments")
+    parser.add_argument("--jobs", type=profile.positive, required=False, default=1,
+                        help=("number of programs profiled in parallel. Each worker is pinned to its own core. Note "
+                              "that parallel jobs may disturb each other's execution times."))
+    parser.add_argument("--state", type=Path, required=False,
+                        help="file storing the completed jobs and their run times (defaults to <manifest>.state.json)")
+    parser.add_argument("--restart", action="store_true", required=False,
+                        help="profile all programs again, even those completed in an earlier sweep.")
+    parser.add_argument("--interleave", action="store_true", required=False,
+                        help=("run one iteration of every job per round, in a random order, instead of all iterations "
+                              "of one job after the other. Runs all jobs in this process, so it cannot be combined "
+                              "with --jobs."))
+    parser.add_argument("--seed", type=int, required=False,
+                        help="seed of the random order of the jobs with --interleave (defaults to a random seed)")
+    parser.add_argument("--skip_plots", action="store_true", required=False,
+                        help="do not plot the resulting CSV files.")
+    args, profile_args = parser.parse_known_args()
+    if args.interleave and args.jobs > 1:
+        parser.error("--interleave cannot be combined with --jobs")
+    return args, profile_args
+
+
+if __name__ == "__main__":
+    main()
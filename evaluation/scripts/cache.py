@@ -0,0 +1,97 @@
+"""
+Module for a content-addressed on-disk cache of tool versions, Gobra to Viper translations, and profiling results.
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+
+class Cache:
+    """A size-bounded cache that maps keys to JSON values and is stored in a directory.
+
+    Keys are arbitrary JSON-serializable values; their SHA-256 hash is the name of the file storing the value. When the
+    total size of the cache exceeds max_size bytes, the least recently used entries are evicted.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key):
+        """Returns the value stored for key, or None if there is none."""
+        path = self.path(key)
+        try:
+            with open(path) as entry:
+                value = json.load(entry)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        # The modification time is used to determine the least recently used entries.
+        path.touch()
+        return value
+
+    def put(self, key, value):
+        """Store value for key and evict entries if the cache is too large."""
+        path = self.path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Write to a temporary file first, so that no other process ever sees a partially written entry.
+        with tempfile.NamedTemporaryFile("w", dir=path.parent, delete=False) as entry:
+            json.dump(value, entry)
+        os.replace(entry.name, path)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is not larger than max_size."""
+        entries = [(entry.stat().st_mtime, entry.stat().st_size, entry) for entry in self.directory.glob("*/*")]
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, entry in sorted(entries):
+            if size <= self.max_size:
+                break
+            logging.debug(f"Evicting {entry} from the cache.")
+            entry.unlink(missing_ok=True)
+            size -= entry_size
+
+    def path(self, key):
+        digest = hash_value(key)
+        return self.directory / digest[:2] / digest
+
+
+def hash_value(value):
+    """Returns the SHA-256 hash of a JSON-serializable value."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def hash_file(path):
+    """Returns the SHA-256 hash of the contents of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_directory(path, pattern):
+    """Returns the SHA-256 hash of the names and contents of all files in a directory tree that match pattern."""
+    digest = hashlib.sha256()
+    for file in sorted(Path(path).rglob(pattern)):
+        if file.is_file():
+            digest.update(f"{file.relative_to(path)}\0{hash_file(file)}\0".encode())
+    return digest.hexdigest()
+
+
+def file_identity(path):
+    """Returns a cheap identity of a file that changes whenever the file is replaced or modified.
+
+    This is used for tools (e.g., the Gobra jar), whose versions are expensive to probe.
+    """
+    stat = os.stat(path)
+    return [str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns]
@@ -0,0 +1,335 @@
+"""
+Module for checking whether fresh profiling results are significantly worse than a baseline.
+
+The baseline and the new results are CSV files of profile.py, given either directly or as directories that are searched
+recursively (by default, the baseline is evaluation/experiments). Results are matched by experiment, i.e., by the name
+of the program and the settings encoded in the name of the CSV file (random seeds, set axiomatization, ViperServer,
+parallelism of Silicon), so runs with different tool versions or numbers of iterations can be compared.
+
+For every experiment, the execution time and the number of instantiations of every quantifier are compared with a
+two-sided Mann-Whitney U test and a bootstrap confidence interval of the ratio of the medians (new / baseline). The
+p-values of all tests are adjusted with the Holm-Bonferroni method. A column is significantly slower (or faster) if
+its adjusted p-value is below --alpha and the whole confidence interval of the ratio lies above 1 + threshold (or below
+1 / (1 + threshold)). Iterations killed by the watchdog of profile.py are excluded from the tests; new killed iterations
+where the baseline had none count as a regression.
+
+A summary with the effect sizes is printed, and the script fails if an experiment got significantly slower, so that it
+can be used as a gate in CI or before merging:
+
+    python3 compare.py --baseline ../experiments /tmp/new-results
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import argparse
+import csv
+import functools
+import logging
+import math
+import random
+import statistics
+from pathlib import Path
+
+import profile
+
+EXPERIMENTS = Path(__file__).resolve().parents[1] / "experiments"
+
+REPORT_COLUMNS = ["experiment", "column", "baseline_iterations", "new_iterations", "baseline_median", "new_median",
+                  "ratio", "ratio_lower", "ratio_upper", "cliffs_delta", "p_value", "verdict"]
+
+
+def main():
+    """Main function of the comparison."""
+    # Set up logging.
+    logging.basicConfig(level=logging.INFO)
+
+    args = parse_args()
+    if args.baseline.is_file() and args.new.is_file():
+        pairs = {experiment_key(args.new): (args.baseline, args.new)}
+    else:
+        baseline = find_results(args.baseline)
+        new = find_results(args.new)
+        for key in sorted(new.keys() - baseline.keys()):
+            logging.warning(f"No baseline for {format_key(key)} ({new[key]}).")
+        pairs = {key: (baseline[key], new[key]) for key in sorted(new.keys() & baseline.keys())}
+    if not pairs:
+        logging.error(f"No results in {args.new} match results in {args.baseline}.")
+        raise ValueError(f"No results in {args.new} match results in {args.baseline}.")
+
+    rng = random.Random(args.seed)
+    report = []
+    for key, (baseline_path, new_path) in pairs.items():
+        logging.info(f"Comparing {new_path} against {baseline_path}.")
+        baseline_metadata, new_metadata = profile.parse_metadata(baseline_path), profile.parse_metadata(new_path)
+        changed = [f"{tool} {baseline_metadata.get(tool)} -> {new_metadata.get(tool)}"
+                   for tool in ("silicon_version", "z3_version", "gobra_version")
+                   if baseline_metadata.get(tool) != new_metadata.get(tool)]
+        if changed:
+            logging.info(f"Tool versions changed: {', '.join(changed)}.")
+        report += compare_experiment(args, format_key(key), load_results(baseline_path), load_results(new_path), rng)
+
+    # Correct for testing many columns of many experiments at once.
+    tested = [row for row in report if row["p_value"] != ""]
+    for row, p_value in zip(tested, holm([row["p_value"] for row in tested])):
+        row["p_value"] = p_value
+        row["verdict"] = verdict(args, row)
+
+    print_report(report)
+    if args.output is not None:
+        profile.write_to_csv(report, args.output)
+
+    regressions = [row for row in report if row["verdict"] == "killed"
+                   or (row["verdict"] == "slower" and (row["column"] == "execution_time" or args.fail_on_qi))]
+    if regressions:
+        names = [f"{row['experiment']} ({row['column']})" for row in regressions]
+        logging.error(f"{len(regressions)} regressions: {', '.join(names)}.")
+        raise RuntimeError(f"{len(regressions)} regressions.")
+    logging.info(f"No regressions in {len(pairs)} experiments.")
+
+
+def find_results(path):
+    """Returns a dictionary that maps the experiment keys to the CSV files of profile.py at path (a file or directory).
+
+    Other CSV files (e.g., the .members.csv files or the tables of suite.py) are skipped. Raises ValueError if two files
+    belong to the same experiment, since it would be unclear which one to compare.
+    """
+    csv_paths = [path] if path.is_file() else sorted(path.rglob("*.csv"))
+    results = {}
+    for csv_path in csv_paths:
+        if profile.parse_metadata(csv_path) is None:
+            continue
+        key = experiment_key(csv_path)
+        if key in results:
+            logging.error(f"Both {results[key]} and {csv_path} are results of {format_key(key)}.")
+            raise ValueError(f"Multiple results of {format_key(key)} in {path}.")
+        results[key] = csv_path
+    return results
+
+
+def experiment_key(csv_path):
+    """Returns the program and the settings of the CSV file of profile.py that determine what is measured."""
+    metadata = profile.parse_metadata(csv_path)
+    if metadata is None:
+        logging.error(f"{csv_path} was not written by profile.py.")
+        raise ValueError(f"{csv_path} was not written by profile.py.")
+
+    # Iterations pinned to a core (--jobs, or a pinned worker of batch.py) are not comparable with unpinned ones.
+    return (metadata["program_path"].name, metadata["z3RandomizeSeeds"], metadata["disableSetAxiomatization"],
+            metadata["viperserver"], metadata["jobs"], metadata["pinned"], metadata["parallel_verifiers"],
+            metadata["parallelize_branches"])
+
+
+def format_key(key):
+    """Returns a readable name of an experiment key, e.g., "fully_assisted (rand, no_set_axiom)"."""
+    (program, z3_randomize_seeds, disable_set_axiomatization, viperserver, jobs, pinned, parallel_verifiers,
+     parallelize_branches) = key
+    settings = [name for name, enabled in (("rand", z3_randomize_seeds), ("no_set_axiom", disable_set_axiomatization),
+                                           ("server", viperserver), (f"jobs_{jobs}", jobs > 1),
+                                           ("pinned", pinned and jobs == 1),
+                                           (f"par_{parallel_verifiers}", parallel_verifiers > 1),
+                                           ("branches", parallelize_branches)) if enabled]
+    return f"{program} ({', '.join(settings)})" if settings else program
+
+
+def load_results(csv_path):
+    """Returns the rows of the completed iterations of a CSV file of profile.py and the number of killed iterations."""
+    with open(csv_path, newline="") as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    completed = [row for row in rows if not row.get("censored")]
+    return completed, len(rows) - len(completed)
+
+
+def compare_experiment(args, experiment, baseline, new, rng):
+    """Compare the execution time and the instantiations of every quantifier of an experiment.
+
+    baseline and new are the results of load_results. Returns one row of the report per compared column; their
+    p-values are not yet adjusted for multiple testing.
+    """
+    (baseline_rows, baseline_killed), (new_rows, new_killed) = baseline, new
+    row = dict.fromkeys(REPORT_COLUMNS, "") | {"experiment": experiment, "baseline_iterations": len(baseline_rows),
+                                                "new_iterations": len(new_rows)}
+    if new_killed and not baseline_killed:
+        logging.warning(f"{experiment}: {new_killed} new iterations were killed, but none of the baseline.")
+        return [row | {"column": "execution_time", "verdict": "killed"}]
+    if len(baseline_rows) < 2 or len(new_rows) < 2:
+        logging.warning(f"{experiment}: too few completed iterations to compare.")
+        return [row | {"column": "execution_time", "verdict": "insufficient"}]
+
+    quantifiers = sorted({key for rows in (baseline_rows, new_rows) for key in rows[0] if key.startswith("qi-")})
+    report = []
+    for column in ["execution_time"] + quantifiers:
+        # Quantifiers missing from a CSV file have not been instantiated.
+        x = [float(baseline_row.get(column) or 0) for baseline_row in baseline_rows]
+        y = [float(new_row.get(column) or 0) for new_row in new_rows]
+        if column != "execution_time" and max(statistics.median(x), statistics.median(y)) < args.min_instantiations:
+            continue
+
+        u, p_value = mann_whitney_u(x, y)
+        lower, upper = bootstrap_ratio(x, y, args.resamples, args.confidence, rng)
+        report.append(row | {"column": column,
+                             "baseline_median": statistics.median(x),
+                             "new_median": statistics.median(y),
+                             "ratio": median_ratio(x, y),
+                             "ratio_lower": lower,
+                             "ratio_upper": upper,
+                             "cliffs_delta": 2 * u / (len(x) * len(y)) - 1,
+                             "p_value": p_value})
+    return report
+
+
+def verdict(args, row):
+    """Returns whether a column of the report is significantly "slower", "faster", or the "same"."""
+    threshold = args.threshold if row["column"] == "execution_time" else args.qi_threshold
+    if row["p_value"] < args.alpha and row["ratio_lower"] > 1 + threshold:
+        return "slower"
+    if row["p_value"] < args.alpha and row["ratio_upper"] < 1 / (1 + threshold):
+        return "faster"
+    return "same"
+
+
+def median_ratio(x, y):
+    """Returns the ratio of the median of y to the median of x."""
+    median_x, median_y = statistics.median(x), statistics.median(y)
+    if median_x == 0:
+        return 1.0 if median_y == 0 else math.inf
+    return median_y / median_x
+
+
+def bootstrap_ratio(x, y, resamples, confidence, rng):
+    """Percentile bootstrap confidence interval of the ratio of the median of y to the median of x.
+
+    Both samples are resampled independently, as they come from independent runs.
+    """
+    ratios = sorted(median_ratio(rng.choices(x, k=len(x)), rng.choices(y, k=len(y))) for _ in range(resamples))
+    tail = (1 - confidence) / 2
+    return ratios[int(tail * (resamples - 1))], ratios[math.ceil((1 - tail) * (resamples - 1))]
+
+
+def mann_whitney_u(x, y):
+    """Two-sided Mann-Whitney U test of whether the values of y tend to be larger or smaller than those of x.
+
+    Returns U, i.e., the number of pairs in which the value of y is larger than the value of x (ties count half), and
+    the p-value. The p-value is exact for small samples without ties and otherwise based on the normal approximation
+    with tie and continuity corrections.
+    """
+    n_x, n_y = len(x), len(y)
+    values = sorted([(value, 0) for value in x] + [(value, 1) for value in y])
+
+    # Assign average ranks to ties.
+    rank_sum_y = 0
+    tie_correction = 0
+    i = 0
+    while i < len(values):
+        j = i
+        while j < len(values) and values[j][0] == values[i][0]:
+            j += 1
+        rank = (i + 1 + j) / 2
+        rank_sum_y += rank * sum(group for _, group in values[i:j])
+        tie_correction += (j - i) ** 3 - (j - i)
+        i = j
+    u = rank_sum_y - n_y * (n_y + 1) / 2
+
+    if tie_correction == 0 and min(n_x, n_y) <= 10:
+        distribution = u_distribution(min(n_x, n_y), max(n_x, n_y))
+        total = sum(distribution)
+        # The distribution is symmetric, so it does not matter which sample is the smaller one.
+        lower = sum(distribution[:int(u) + 1]) / total
+        upper = sum(distribution[int(u):]) / total
+        return u, min(1.0, 2 * min(lower, upper))
+
+    n = n_x + n_y
+    mean = n_x * n_y / 2
+    variance = n_x * n_y / 12 * ((n + 1) - tie_correction / (n * (n - 1)))
+    if variance == 0:
+        # All values are equal.
+        return u, 1.0
+    z = max(abs(u - mean) - 0.5, 0) / math.sqrt(variance)
+    return u, math.erfc(z / math.sqrt(2))
+
+
+@functools.lru_cache(maxsize=None)
+def u_distribution(m, n):
+    """Returns the number of arrangements of samples of sizes m and n without ties for every value of U."""
+    if m == 0 or n == 0:
+        return (1,)
+
+    # The largest value belongs either to the first sample, which adds n to U, or to the second one.
+    counts = [0] * (m * n + 1)
+    for u, count in enumerate(u_distribution(m - 1, n)):
+        counts[u + n] += count
+    for u, count in enumerate(u_distribution(m, n - 1)):
+        counts[u] += count
+    return tuple(counts)
+
+
+def holm(p_values):
+    """Returns the p-values adjusted with the Holm-Bonferroni method, in the given order."""
+    order = sorted(range(len(p_values)), key=lambda i: p_values[i])
+    adjusted = [0.0] * len(p_values)
+    running_max = 0.0
+    for rank, i in enumerate(order):
+        running_max = max(running_max, min(1.0, (len(p_values) - rank) * p_values[i]))
+        adjusted[i] = running_max
+    return adjusted
+
+
+def print_report(report):
+    """Print the report as a table with aligned columns."""
+    header = ["experiment", "column", "baseline", "new", "ratio (CI)", "cliff's d", "p", "verdict"]
+    lines = [header]
+    for row in report:
+        if row["p_value"] == "":
+            lines.append([row["experiment"], row["column"], "", "", "", "", "", row["verdict"]])
+            continue
+        lines.append([row["experiment"], row["column"].removeprefix("qi-"),
+                      f"{row['baseline_median']:.4g}", f"{row['new_median']:.4g}",
+                      f"{row['ratio']:.3f} ({row['ratio_lower']:.3f}-{row['ratio_upper']:.3f})",
+                      f"{row['cliffs_delta']:+.2f}", f"{row['p_value']:.3g}", row["verdict"]])
+
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    for line in lines:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip())
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("new", type=existing_path,
+                        help="CSV file of profile.py or directory containing such files with the new results")
+    parser.add_argument("--baseline", type=existing_path, required=False, default=EXPERIMENTS,
+                        help="CSV file of profile.py or directory containing such files with the baseline results")
+    parser.add_argument("--alpha", type=profile.positive_float, required=False, default=0.05,
+                        help="significance level, applied to the p-values adjusted for multiple testing")
+    parser.add_argument("--threshold", type=float, required=False, default=0.1,
+                        help=("minimum relative change of the median execution time that is considered meaningful, "
+                              "e.g., 0.1 for 10%%"))
+    parser.add_argument("--qi_threshold", type=float, required=False, default=0.1,
+                        help="minimum relative change of the median number of instantiations that is meaningful")
+    parser.add_argument("--min_instantiations", type=float, required=False, default=100,
+                        help="quantifiers with fewer median instantiations in both results are not compared")
+    parser.add_argument("--fail_on_qi", action="store_true", required=False,
+                        help="also fail if the number of instantiations of a quantifier increased significantly.")
+    parser.add_argument("--confidence", type=profile.positive_float, required=False, default=0.95,
+                        help="confidence level of the bootstrap confidence intervals")
+    parser.add_argument("--resamples", type=profile.positive, required=False, default=2000,
+                        help="number of bootstrap resamples")
+    parser.add_argument("--seed", type=int, required=False, default=0,
+                        help="seed of the bootstrap, so that repeated comparisons give the same result")
+    parser.add_argument("--output", type=Path, required=False,
+                        help="CSV file to which the report is written")
+    return parser.parse_args()
+
+
+def existing_path(string):
+    """Checks that the string is the path of an existing file or directory."""
+    path = Path(string)
+    if not path.exists():
+        raise argparse.ArgumentTypeError(f"{path} does not exist")
+
+    return path
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Module for verifying only the packages of gobra-libs that are affected by a change.
+
+The dependency graph of the packages is built from the import clauses of their Gobra files. Every package is identified
+by a hash of its own sources and the hashes of the packages it imports, so the hash of a package changes exactly when
+it or one of its transitive dependencies changes. Packages whose hash has been verified successfully before (by the
+same version of Gobra with the same options) are taken from the cache; all others are verified with Gobra, in
+parallel, but never before the packages they import.
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import argparse
+import logging
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from cache import Cache, hash_file, hash_value
+from profile import cached_version, gobra_version, positive, time_checked_command
+from suite import LIBRARY_ROOT, library_packages
+from util import directory_path, file_path
+
+# Import declarations, e.g., 'import "util"', 'import . "util"' or 'import (\n s "sets"\n "util"\n)'.
+IMPORT_DECLARATION = re.compile(r'^\s*import\s*(?:\((?P<block>[^)]*)\)|(?:[\w.]+\s+)?"(?P<path>[^"]+)")', re.MULTILINE)
+IMPORT_PATH = re.compile(r'"([^"]+)"')
+
+
+def main():
+    """Main function of the incremental verifier."""
+    # Set up logging.
+    logging.basicConfig(level=logging.DEBUG)
+
+    args, gobra_args = parse_args()
+
+    if args.z3_path is not None:
+        os.environ["Z3_EXE"] = str(args.z3_path)
+
+    cache = Cache(args.cache_dir, args.cache_max_size * 1024 * 1024)
+    # The graph always covers all packages, so that changes to packages that are not verified are noticed, too.
+    packages = library_packages(args.library_root)
+    targets = args.packages or packages
+    unknown = set(targets) - set(packages)
+    if unknown:
+        logging.error(f"Unknown packages: {', '.join(sorted(unknown))}.")
+        raise ValueError(f"Unknown packages: {', '.join(sorted(unknown))}.")
+    graph = dependency_graph(args.library_root, packages)
+    order = topological_order(graph)
+
+    version = cached_version(cache, args.gobra_path, gobra_version)
+    keys = {}
+    for package in order:
+        keys[package] = package_hash(args.library_root / package, [keys[dependency] for dependency in graph[package]])
+    cache_keys = {package: ["verification", keys[package], version, gobra_args] for package in order}
+
+    affected = [package for package in order if package in targets and cache.get(cache_keys[package]) is None]
+    logging.info(f"{len(affected)} of {len(targets)} packages are affected: {', '.join(affected) or 'none'}.")
+    if args.dry_run:
+        return
+
+    results = verify_packages(args, gobra_args, graph, affected)
+    for package, result in results.items():
+        if result == "verified":
+            cache.put(cache_keys[package], result)
+
+    failed = [package for package, result in results.items() if result != "verified"]
+    for package in order:
+        if package in targets:
+            logging.info(f"{package}: {results.get(package, 'cached')}")
+    if failed:
+        logging.error(f"{len(failed)} packages were not verified: {', '.join(failed)}.")
+        raise RuntimeError(f"{len(failed)} packages were not verified.")
+
+
+def dependency_graph(library_root, packages):
+    """Returns a dictionary that maps every package to the sorted list of the given packages it imports.
+
+    Imports of other packages (e.g., "sync") are ignored, as they are not part of the library.
+    """
+    graph = {}
+    for package in packages:
+        imports = set()
+        for file in sorted((library_root / package).glob("*.gobra")):
+            with open(file) as gobra_file:
+                for match in IMPORT_DECLARATION.finditer(gobra_file.read()):
+                    if match["block"] is not None:
+                        imports.update(IMPORT_PATH.findall(match["block"]))
+                    else:
+                        imports.add(match["path"])
+        graph[package] = sorted(imports.intersection(packages) - {package})
+        logging.debug(f"{package} imports {graph[package]}.")
+    return graph
+
+
+def topological_order(graph):
+    """Returns the packages of the graph such that every package comes after the packages it imports."""
+    order = []
+    visiting = set()
+
+    def visit(package, path):
+        if package in order:
+            return
+        if package in visiting:
+            logging.error(f"Import cycle: {' -> '.join(path + [package])}.")
+            raise ValueError(f"Import cycle: {' -> '.join(path + [package])}.")
+        visiting.add(package)
+        for dependency in graph[package]:
+            visit(dependency, path + [package])
+        visiting.remove(package)
+        order.append(package)
+
+    for package in sorted(graph):
+        visit(package, [])
+    return order
+
+
+def package_hash(package_path, dependency_hashes):
+    """Returns the hash of the sources of a package and the hashes of the packages it imports."""
+    sources = [[file.name, hash_file(file)] for file in sorted(package_path.glob("*.gobra"))]
+    return hash_value([sources, dependency_hashes])
+
+
+def verify_packages(args, gobra_args, graph, affected):
+    """Verify the affected packages with args.jobs Gobra processes in parallel and return their results.
+
+    A package is only started once the affected packages it imports have been verified; if one of them was not
+    verified, the package is not verified either ("blocked"). Returns a dictionary that maps every affected package to
+    "verified", "failed" or "blocked".
+    """
+    results = {}
+    pending = list(affected)
+    running = {}
+    # The work happens in the Gobra processes, so threads are enough to keep args.jobs of them busy.
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        while pending or running:
+            for package in list(pending):
+                dependencies = [dependency for dependency in graph[package] if dependency in affected]
+                if any(results.get(dependency) in ("failed", "blocked") for dependency in dependencies):
+                    logging.warning(f"Not verifying {package}, as an imported package was not verified.")
+                    results[package] = "blocked"
+                    pending.remove(package)
+                elif len(running) < args.jobs and all(dependency in results for dependency in dependencies):
+                    pending.remove(package)
+                    running[executor.submit(verify_package, args, gobra_args, package)] = package
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                package = running.pop(future)
+                try:
+                    execution_time = future.result()
+                except RuntimeError:
+                    results[package] = "failed"
+                    continue
+                logging.info(f"Verified {package} in {execution_time} seconds.")
+                results[package] = "verified"
+    return results
+
+
+def verify_package(args, gobra_args, package):
+    """Verify a package with Gobra and return the time it took. Raises RuntimeError if the verification fails."""
+    command = (["java", "-Xss128m", "-jar", str(args.gobra_path), "-p", str(args.library_root / package),
+                "-I", str(args.library_root)] + gobra_args)
+    logging.info(f"Verifying {package}.")
+    _, execution_time = time_checked_command(command)
+    return execution_time
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns the parsed arguments and the remaining arguments, which are passed to Gobra for every package.
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, allow_abbrev=False,
+                                     epilog=("All other arguments (e.g., --checkConsistency) are passed to Gobra for "
+                                             "every package; they are part of the cache key."))
+    parser.add_argument("--gobra_path", type=file_path, required=True,
+                        help="path to Gobra jar")
+    parser.add_argument("--z3_path", type=file_path, required=False,
+                        help="path to Z3 binary (defaults to Z3_EXE)")
+    parser.add_argument("--packages", type=str, nargs="+", required=False,
+                        help="packages to verify if affected (defaults to all packages of the library)")
+    parser.add_argument("--library_root", type=directory_path, required=False, default=LIBRARY_ROOT,
+                        help="root directory of gobra-libs")
+    parser.add_argument("--jobs", type=positive, required=False, default=os.cpu_count(),
+                        help="number of packages verified in parallel")
+    parser.add_argument("--cache_dir", type=Path, required=False,
+                        default=Path.home() / ".cache" / "gobra-libs-verification",
+                        help="directory of the cache of successfully verified packages")
+    parser.add_argument("--cache_max_size", type=positive, required=False, default=64,
+                        help="maximum size of the cache in MiB")
+    parser.add_argument("--dry_run", action="store_true", required=False,
+                        help="only list the affected packages.")
+    return parser.parse_known_args()
+
+
+if __name__ == "__main__":
+    main()
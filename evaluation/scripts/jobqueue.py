@@ -0,0 +1,432 @@
+"""
+Module for distributing the iterations of the experiments of a manifest over worker processes on several machines.
+
+The queue is a SQLite database, so no service has to be run. It has three commands:
+- submit: expands a manifest (see batch.py) into experiments and adds one task per iteration of every experiment.
+  Submitting again adds new experiments and puts failed tasks back on the queue.
+- work: claims tasks one at a time and runs them with profile.py, until all tasks are done. Any number of workers can
+  be started, on one or several machines. A worker holds a lease on its task, which it renews while Silicon runs. If
+  a worker crashes or is killed, its lease expires and another worker claims the task again. A task that failed
+  --max_attempts times is marked as failed.
+- collect: writes the results of every experiment whose tasks are all done to a CSV file, as profile.py would, and
+  reports the progress of the others.
+
+For several machines, the database, the programs and the output directories have to be on a shared filesystem with
+working file locks (e.g., NFS v4), under the same paths on all machines. The tool paths may differ per machine; they
+are given to every worker and override those given to submit. Iterations of the same experiment run on different
+machines are only combined if they were run with the same tool versions. The fingerprints of all machines that ran an
+experiment are written next to its CSV file.
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import profile
+from batch import expand_manifest
+from cache import hash_value
+from util import file_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    label TEXT NOT NULL,
+    argv TEXT NOT NULL,
+    iterations INTEGER NOT NULL,
+    max_attempts INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    experiment INTEGER NOT NULL REFERENCES experiments(id),
+    iteration INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (experiment, iteration)
+);
+CREATE TABLE IF NOT EXISTS preparations (
+    experiment INTEGER NOT NULL REFERENCES experiments(id),
+    worker TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    PRIMARY KEY (experiment, worker)
+);
+"""
+
+# Tool versions that have to agree between the iterations of an experiment.
+VERSION_KEYS = ("silicon_version", "z3_version", "gobra_version")
+
+
+def main():
+    """Main function of the job queue."""
+    # Set up logging.
+    logging.basicConfig(level=logging.DEBUG)
+
+    args, profile_args = parse_args()
+    if args.command == "submit":
+        submit(args, profile_args)
+    elif args.command == "work":
+        work(args, profile_args)
+    else:
+        collect(args)
+
+
+def connect(database_path):
+    """Open the database in autocommit mode, so that transactions are started explicitly, and create its tables.
+
+    The rollback journal is kept (instead of WAL), as WAL does not work on network filesystems.
+    """
+    connection = sqlite3.connect(database_path, timeout=60, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+
+@contextlib.contextmanager
+def transaction(connection):
+    """Run the statements of the block in a transaction that holds the write lock of the database from its start."""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+def submit(args, profile_args):
+    """Add the experiments of the manifest and their tasks to the queue, and put failed tasks back on it."""
+    with open(args.manifest) as manifest_file:
+        manifest = json.load(manifest_file)
+    jobs = expand_manifest(manifest, args.manifest.parent, profile_args)
+
+    experiments = []
+    for job in jobs:
+        # Check all command lines before submitting anything, so that workers do not fail on a typo.
+        job_args = profile.parse_args(job["argv"])
+        if (job_args.jobs > 1 or job_args.viperserver_path is not None or job_args.target_precision is not None
+                or job_args.timeline or job_args.store is not None):
+            logging.error(f"{job['program']}: the job queue cannot be combined with --jobs, --viperserver_path, "
+                          f"--target_precision, --timeline or --store.")
+            raise ValueError("The job queue cannot be combined with --jobs, --viperserver_path, --target_precision, "
+                             "--timeline or --store.")
+        # Workers may run on other machines, so paths are stored as absolute paths.
+        argv = [str(Path(job["program"]).resolve())] + absolute_paths(job["argv"][1:])
+        experiments.append((job["key"], job["label"], argv, job_args.iterations))
+
+    connection = connect(args.database)
+    with transaction(connection):
+        added = 0
+        for key, label, argv, iterations in experiments:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO experiments (key, label, argv, iterations, max_attempts) VALUES (?, ?, ?, ?, ?)",
+                (key, label, json.dumps(argv), iterations, args.max_attempts))
+            added += cursor.rowcount
+            experiment = connection.execute("SELECT id FROM experiments WHERE key = ?", (key,)).fetchone()["id"]
+            connection.executemany("INSERT OR IGNORE INTO tasks (experiment, iteration) VALUES (?, ?)",
+                                   [(experiment, i) for i in range(0, iterations)])
+        retried = connection.execute("UPDATE tasks SET state = 'pending', attempts = 0, worker = NULL "
+                                     "WHERE state = 'failed'").rowcount
+    logging.info(f"Submitted {added} new experiments ({len(experiments) - added} were already queued); "
+                 f"{retried} failed tasks are pending again.")
+    log_progress(connection)
+
+
+def absolute_paths(argv):
+    """Returns the command line with the values of the path options of profile.py made absolute."""
+    options = {"--silicon_path", "--z3_path", "--gobra_path", "--include_path", "--output_dir", "--cache_dir"}
+    return [str(Path(argument).resolve()) if i > 0 and argv[i - 1] in options else argument
+            for i, argument in enumerate(argv)]
+
+
+def work(args, worker_args):
+    """Claim and run tasks until no task is left.
+
+    Experiments are prepared (tool versions, translation) once per worker, while holding a lock on the program, so
+    that workers do not write the translation of the same program at the same time. Every worker then runs Silicon on
+    its own copy of the translation.
+    """
+    connection = connect(args.database)
+    worker = args.worker or f"{platform.node()}-{os.getpid()}"
+    # The worker column of the CSV files records the machine and process that ran an iteration.
+    profile.worker_id = worker
+
+    # Check the command lines of all experiments with the arguments of this worker before claiming anything.
+    experiments = {row["id"]: row for row in connection.execute("SELECT * FROM experiments")}
+    for experiment in experiments.values():
+        profile.parse_args(json.loads(experiment["argv"]) + worker_args)
+
+    logging.info(f"Worker {worker} started.")
+    prepared = {}
+    with tempfile.TemporaryDirectory(prefix="jobqueue-") as work_dir:
+        while True:
+            task = claim(connection, worker, args.lease)
+            if task is None:
+                remaining = connection.execute("SELECT COUNT(*) FROM tasks WHERE state IN ('pending', 'running')")
+                if remaining.fetchone()[0] == 0:
+                    break
+                # Tasks of other workers may still be put back on the queue if their leases expire.
+                time.sleep(args.poll_interval)
+                continue
+
+            experiment, i = task["experiment"], task["iteration"]
+            if experiment not in experiments:
+                experiments[experiment] = connection.execute("SELECT * FROM experiments WHERE id = ?",
+                                                             (experiment,)).fetchone()
+            try:
+                # Preparing an experiment (e.g., waiting for the translation of another worker) may take longer than
+                # the lease, so the lease is also renewed while preparing.
+                with lease_renewal(args.database, worker, task, args.lease):
+                    if experiment not in prepared:
+                        prepared[experiment] = prepare(connection, args.database, worker, experiments[experiment],
+                                                       worker_args, Path(work_dir))
+                    job_args, run = prepared[experiment]
+                    [(data_point, _)] = run([i])
+            except (RuntimeError, ValueError) as e:
+                logging.error(f"Iteration {i + 1} of {experiments[experiment]['label']} failed: {e}")
+                release(connection, worker, task, experiments[experiment]["max_attempts"], str(e))
+                continue
+            except BaseException:
+                # E.g., the worker is interrupted; the task does not count as attempted.
+                release(connection, worker, task, None, "interrupted")
+                raise
+
+            complete(connection, worker, task, data_point)
+    logging.info(f"Worker {worker} finished: no tasks left.")
+
+
+def claim(connection, worker, lease):
+    """Claim a pending task, or a task whose lease has expired, and return it (None if there is none).
+
+    Tasks are claimed iteration by iteration across all experiments, so that slow drifts of the machines affect all
+    experiments alike.
+    """
+    now = time.time()
+    with transaction(connection):
+        # A task whose lease expired in its last attempt has failed.
+        connection.execute("UPDATE tasks SET state = 'failed', error = 'lease expired', worker = NULL "
+                           "WHERE state = 'running' AND lease_expires < ? AND attempts >= "
+                           "(SELECT max_attempts FROM experiments WHERE id = tasks.experiment)", (now,))
+        task = connection.execute("SELECT * FROM tasks WHERE state = 'pending' OR (state = 'running' "
+                                  "AND lease_expires < ?) ORDER BY iteration, experiment LIMIT 1", (now,)).fetchone()
+        if task is None:
+            return None
+        if task["state"] == "running":
+            logging.warning(f"The lease of worker {task['worker']} on iteration {task['iteration'] + 1} of experiment "
+                            f"{task['experiment']} expired; claiming it again.")
+        connection.execute("UPDATE tasks SET state = 'running', worker = ?, lease_expires = ?, "
+                           "attempts = attempts + 1 WHERE experiment = ? AND iteration = ?",
+                           (worker, now + lease, task["experiment"], task["iteration"]))
+    return task
+
+
+@contextlib.contextmanager
+def lease_renewal(database_path, worker, task, lease):
+    """Renew the lease of the worker on the task every third of the lease while the block runs."""
+    stopped = threading.Event()
+
+    def renew():
+        # Connections cannot be shared between threads.
+        connection = connect(database_path)
+        while not stopped.wait(lease / 3):
+            try:
+                connection.execute("UPDATE tasks SET lease_expires = ? WHERE experiment = ? AND iteration = ? "
+                                   "AND worker = ? AND state = 'running'",
+                                   (time.time() + lease, task["experiment"], task["iteration"], worker))
+            except sqlite3.OperationalError as e:
+                # E.g., the database is locked by other workers for longer than the timeout; retry at the next renewal.
+                logging.error(f"Failed to renew the lease on iteration {task['iteration'] + 1} of experiment "
+                              f"{task['experiment']}: {e}")
+        connection.close()
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def prepare(connection, database_path, worker, experiment, worker_args, work_dir):
+    """Prepare an experiment in this worker and return its arguments and a function running its iterations.
+
+    The metadata (with the tool versions of this machine) and the fingerprint of this machine are stored in the
+    database for collect.
+    """
+    args = profile.parse_args(json.loads(experiment["argv"]) + worker_args)
+    # Only workers preparing the same program wait for each other.
+    lock_path = f"{database_path}.{hash_value(str(args.program_path.resolve()))[:16]}.lock"
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        cache, metadata, vpr_file_path = profile.prepare_program(args)
+        if profile.is_gobra(args.program_path):
+            vpr_file_path = Path(shutil.copy(vpr_file_path, work_dir / f"{experiment['id']}-{vpr_file_path.name}"))
+
+    fingerprint = profile.environment_fingerprint(args, metadata, cache)
+    output_dir = args.output_dir or metadata["program_path"].parent
+    with transaction(connection):
+        connection.execute("INSERT OR REPLACE INTO preparations "
+                           "(experiment, worker, metadata, fingerprint, output_dir) VALUES (?, ?, ?, ?, ?)",
+                           (experiment["id"], worker, json.dumps(metadata, default=str), json.dumps(fingerprint),
+                            str(output_dir.resolve())))
+
+    def run(indices):
+        return [profile.run_iteration(args, vpr_file_path, i) for i in indices]
+
+    if args.warmup:
+        run = profile.warmed_up_runner(run, args.warmup)
+    return args, run
+
+
+def complete(connection, worker, task, data_point):
+    """Store the result of a task, unless the worker has lost its lease on the task in the meantime."""
+    with transaction(connection):
+        updated = connection.execute("UPDATE tasks SET state = 'done', result = ?, lease_expires = NULL, error = NULL "
+                                     "WHERE experiment = ? AND iteration = ? AND worker = ? AND state = 'running'",
+                                     (json.dumps(data_point), task["experiment"], task["iteration"], worker)).rowcount
+    if not updated:
+        logging.warning(f"Worker {worker} lost its lease on iteration {task['iteration'] + 1} of experiment "
+                        f"{task['experiment']}; its result is discarded.")
+
+
+def release(connection, worker, task, max_attempts, error):
+    """Put a task that the worker could not complete back on the queue, or mark it as failed after max_attempts.
+
+    If max_attempts is None, the attempt is not counted.
+    """
+    with transaction(connection):
+        if max_attempts is None:
+            connection.execute("UPDATE tasks SET state = 'pending', attempts = attempts - 1, worker = NULL, error = ? "
+                               "WHERE experiment = ? AND iteration = ? AND worker = ? AND state = 'running'",
+                               (error, task["experiment"], task["iteration"], worker))
+        else:
+            connection.execute("UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                               "worker = NULL, error = ? "
+                               "WHERE experiment = ? AND iteration = ? AND worker = ? AND state = 'running'",
+                               (max_attempts, error, task["experiment"], task["iteration"], worker))
+
+
+def collect(args):
+    """Write the CSV file of every experiment whose tasks are all done and report the progress of the others."""
+    connection = connect(args.database)
+    log_progress(connection)
+
+    failed = 0
+    for experiment in connection.execute("SELECT * FROM experiments ORDER BY id").fetchall():
+        tasks = connection.execute("SELECT * FROM tasks WHERE experiment = ? ORDER BY iteration",
+                                   (experiment["id"],)).fetchall()
+        for task in tasks:
+            if task["state"] == "failed":
+                logging.error(f"Iteration {task['iteration'] + 1} of {experiment['label']} failed after "
+                              f"{task['attempts']} attempts: {task['error']}")
+                failed += 1
+        if any(task["state"] != "done" for task in tasks):
+            continue
+
+        preparations = {row["worker"]: row for row in connection.execute(
+            "SELECT * FROM preparations WHERE experiment = ?", (experiment["id"],))}
+        workers = sorted({task["worker"] for task in tasks})
+        metadatas = [json.loads(preparations[worker]["metadata"]) for worker in workers]
+        versions = {tuple(metadata.get(key) for key in VERSION_KEYS) for metadata in metadatas}
+        if len(versions) > 1:
+            logging.error(f"The iterations of {experiment['label']} were run with different tool versions: "
+                          f"{', '.join('/'.join(str(version) for version in key) for key in sorted(versions))}.")
+            failed += 1
+            continue
+
+        metadata = metadatas[0]
+        metadata["program_path"] = Path(metadata["program_path"])
+        output_dir = args.output_dir or Path(preparations[workers[0]]["output_dir"])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        csv_path = (output_dir / profile.format_metadata(metadata)).with_suffix(".csv")
+        profile.write_to_csv([json.loads(task["result"]) for task in tasks], csv_path)
+        profile.write_fingerprint({worker: json.loads(preparations[worker]["fingerprint"]) for worker in workers},
+                                  csv_path.with_suffix(".env.json"))
+
+    if failed:
+        logging.error(f"{failed} tasks or experiments failed; submit the manifest again to retry the failed tasks.")
+        raise RuntimeError(f"{failed} tasks or experiments failed.")
+
+
+def log_progress(connection):
+    """Log the number of tasks in every state, per experiment."""
+    rows = connection.execute("SELECT label, state, COUNT(*) AS count FROM experiments "
+                              "JOIN tasks ON tasks.experiment = experiments.id GROUP BY id, state ORDER BY id")
+    progress = {}
+    for row in rows:
+        progress.setdefault(row["label"], {})[row["state"]] = row["count"]
+    for label, states in progress.items():
+        logging.info(f"{label}: {', '.join(f'{count} {state}' for state, count in sorted(states.items()))}.")
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns the parsed arguments and the remaining arguments, which are passed to profile.py (by submit for every job,
+    by work for every experiment).
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, allow_abbrev=False)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = commands.add_parser(
+        "submit", formatter_class=argparse.ArgumentDefaultsHelpFormatter, allow_abbrev=False,
+        help="add the experiments of a manifest to the queue",
+        epilog=("All other arguments (e.g., --silicon_path or --iterations) are passed to profile.py for every job; "
+                "they are checked as given here."))
+    submit_parser.add_argument("database", type=Path,
+                               help="SQLite database of the queue (created if it does not exist)")
+    submit_parser.add_argument("manifest", type=file_path,
+                               help="JSON file describing the experiments (see batch.py)")
+    submit_parser.add_argument("--max_attempts", type=profile.positive, required=False, default=3,
+                               help="number of attempts after which a task is marked as failed")
+
+    work_parser = commands.add_parser(
+        "work", formatter_class=argparse.ArgumentDefaultsHelpFormatter, allow_abbrev=False,
+        help="run tasks of the queue until none are left",
+        epilog=("All other arguments (e.g., the tool paths of this machine or --cache_dir) are passed to profile.py "
+                "for every experiment, after those given to submit."))
+    work_parser.add_argument("database", type=file_path,
+                             help="SQLite database of the queue")
+    work_parser.add_argument("--worker", type=str, required=False,
+                             help="name of the worker (defaults to <hostname>-<pid>)")
+    work_parser.add_argument("--lease", type=profile.positive_float, required=False, default=300,
+                             help=("seconds after which a task is claimed again if the worker running it stops "
+                                   "renewing its lease"))
+    work_parser.add_argument("--poll_interval", type=profile.positive_float, required=False, default=30,
+                             help="seconds to wait for tasks of other workers to be put back on the queue")
+
+    collect_parser = commands.add_parser(
+        "collect", formatter_class=argparse.ArgumentDefaultsHelpFormatter, allow_abbrev=False,
+        help="write the CSV files of the completed experiments")
+    collect_parser.add_argument("database", type=file_path,
+                                help="SQLite database of the queue")
+    collect_parser.add_argument("--output_dir", type=Path, required=False,
+                                help="directory of the CSV files (defaults to the output directory of profile.py)")
+
+    args, profile_args = parser.parse_known_args()
+    if args.command == "collect" and profile_args:
+        parser.error(f"unrecognized arguments: {' '.join(profile_args)}")
+    return args, profile_args
+
+
+if __name__ == "__main__":
+    main()
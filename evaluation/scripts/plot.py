@@ -1,24 +1,62 @@
 """
 Module for plotting the results of profile.py.
 
+With --spec, all plots of a report are rendered in a single process (or a pool of worker processes started after the
+CSV files have been read), so that the libraries are imported and every CSV file is read and summarized only once.
+
 This file is part of gobra-libs which is released under the MIT license.
 See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
 for full license details.
 """
 
 import argparse
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shlex
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 import seaborn as sns
+import matplotlib
+# The plots are only saved to files, so the non-interactive backend suffices; it is also safe in forked workers.
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+from pathlib import Path
 
+from profile import positive
 from util import file_path
 
+# Columns of the CSV files of profile.py measuring the resources used by an iteration (see profile.ResourceMonitor).
+TIME_COLUMNS = ['execution_time', 'wall_time', 'user_time', 'system_time', 'jvm_cpu_time', 'z3_cpu_time']
+MEMORY_COLUMNS = ['jvm_peak_rss', 'z3_peak_rss']
+
+# Code spans of Markdown files that run plot.py, e.g., `python ../scripts/plot.py a.csv --top 3`.
+PLOT_COMMAND = re.compile(r'`([^`]*plot\.py[^`]*)`')
+
+# The datasets read in this process, by the resolved paths of their CSV files (see read_dataset).
+datasets = {}
 
-def parse_args():
-    """Parse command line arguments."""
+
+def parse_args(argv=None):
+    """Parse command line arguments (argv, or sys.argv if argv is None)."""
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument("csv_path", type=program_path, nargs="+", help="CSV files to be analyzed")
+    parser.add_argument("csv_path", type=program_path, nargs="*", help="CSV files to be analyzed")
+    parser.add_argument("--spec", type=file_path, required=False,
+                        help=("Render all plots listed in this file, one command line of plot.py per line, in a single "
+                              "process. In Markdown files (e.g., selected_plots/used_commands.md), the commands in "
+                              "code spans are used. Paths are relative to the directory of the spec file."))
+    parser.add_argument("--jobs", type=positive, required=False, default=1,
+                        help="Number of worker processes rendering the plots of --spec.")
+    parser.add_argument("--store", type=Path, required=False,
+                        help=("Analyze the runs in this store (see store.py) instead of CSV files. Each run is plotted "
+                              "like a CSV file named after the run. Requires pyarrow."))
+    parser.add_argument("--where", type=column_value, action="append", default=[], required=False,
+                        help=("Only analyze the runs in the store whose metadata column has the given value, e.g., "
+                              "z3_version=4_8_7 (can be repeated)."))
     parser.add_argument("--filter_anonymous", action="store_true", required=False,
                         help="filter out anonymous quantifier instantiations like quant-u-17 and k!512.")
     parser.add_argument("--name", type=str, required=False,
@@ -31,12 +69,24 @@ def parse_args():
                         help="Size of the quantifier instantiation plot (width height)")
     parser.add_argument("--execution_time_size", type=int, nargs=2, required=False, default=[6, 4],
                         help="Size of the execution time plot (width height)")
+    parser.add_argument("--resources_size", type=int, nargs=2, required=False, default=[9, 4],
+                        help="Size of the plot of the CPU times and memory (width height)")
+    parser.add_argument("--timeline", action="store_true", required=False,
+                        help=("Plot the cumulative number of instantiations over time from the .timeline.jsonl.gz file "
+                              "written by profile.py --timeline (only works with a single CSV file)."))
+    parser.add_argument("--timeline_size", type=int, nargs=2, required=False, default=[6, 4],
+                        help="Size of the timeline plot (width height)")
+    parser.add_argument("--members", type=int, required=False,
+                        help=("Plot the verification times of the n slowest members from the .members.csv file written "
+                              "by profile.py --members (only works with a single CSV file)."))
+    parser.add_argument("--members_size", type=int, nargs=2, required=False, default=[9, 6],
+                        help="Size of the members plot (width height)")
     parser.add_argument("--start_at_zero_qi", action="store_true", required=False,
                         help="Start the axis for the number of quantifier instantiations at zero.")
     parser.add_argument("--start_at_zero_execution_time", action="store_true", required=False,
                         help="Start the axis for execution time at zero.")
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 def main():
@@ -44,39 +94,116 @@ def main():
     # Parse arguments
     args = parse_args()
 
-    if (args.variants is not None) and (len(args.csv_path) != len(args.variants)):
+    if args.spec is not None:
+        if args.csv_path or args.store is not None:
+            raise argparse.ArgumentTypeError(f"CSV files and --store cannot be combined with --spec")
+        plot_spec(args.spec, args.jobs)
+    else:
+        render(args)
+
+
+def render(args):
+    """Render the plots of one command line of plot.py."""
+    if args.store is not None:
+        if args.csv_path:
+            raise argparse.ArgumentTypeError(f"CSV files cannot be combined with --store")
+        if args.timeline or args.members:
+            raise argparse.ArgumentTypeError(f"Timelines and members cannot be plotted from a store")
+
+        # pyarrow is only required when using the store.
+        import store
+        runs = store.load_runs(args.store, dict(args.where))
+        if not runs:
+            raise argparse.ArgumentTypeError(f"No run in {args.store} matches {args.where}")
+        # The labels of the runs take the place of the names of the CSV files.
+        csv_paths = [Path(label).with_suffix(".csv") for label, _ in runs]
+        dfs = [df for _, df in runs]
+    elif not args.csv_path:
+        raise argparse.ArgumentTypeError(f"Either CSV files or --store are required")
+    else:
+        csv_paths = args.csv_path
+        dfs = None
+
+    if (args.variants is not None) and (len(csv_paths) != len(args.variants)):
         raise argparse.ArgumentTypeError(f"Number of variants must match the number of CSV files")
 
-    if len(args.csv_path) == 1:
-        plot(args, args.csv_path[0])
-    else:
-        plot_multiple(args, args.csv_path)
+    if args.timeline and len(csv_paths) != 1:
+        raise argparse.ArgumentTypeError(f"Timelines can only be plotted for a single CSV file")
 
+    if args.members and len(csv_paths) != 1:
+        raise argparse.ArgumentTypeError(f"Members can only be plotted for a single CSV file")
 
-def plot(args, csv_path):
-    """Plot a single CSV file."""
+    if len(csv_paths) == 1:
+        plot(args, csv_paths[0], None if dfs is None else dfs[0])
+    else:
+        plot_multiple(args, csv_paths, dfs)
+
+
+def plot_spec(spec_path, jobs):
+    """Render all plots of a spec file (see read_spec), in this process or in a pool of jobs worker processes.
+
+    Relative paths of the spec file are resolved from its directory. Every CSV file is read and summarized once,
+    before the workers are forked, so that the workers share the datasets instead of reading them again.
+    """
+    commands = read_spec(spec_path)
+    os.chdir(spec_path.parent)
+    all_args = [parse_args(argv) for argv in commands]
+    for args in all_args:
+        if args.spec is not None:
+            raise argparse.ArgumentTypeError(f"Spec files cannot be nested")
+        for csv_path in args.csv_path:
+            read_dataset(csv_path)
+
+    if jobs == 1:
+        for args in all_args:
+            render(args)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork')) as executor:
+        # Consume the results to raise the errors of the workers.
+        list(executor.map(render, all_args))
+
+
+def read_spec(spec_path):
+    """Returns the command lines of plot.py listed in a spec file, without "python plot.py".
+
+    Every line of a spec file is one command line; empty lines and lines starting with "#" are ignored. In Markdown
+    files, only the code spans that run plot.py are used, so the list of commands of a report is its spec.
+    """
+    commands = []
+    with open(spec_path) as spec_file:
+        for line in spec_file:
+            if spec_path.suffix == ".md":
+                commands += PLOT_COMMAND.findall(line)
+            elif line.strip() and not line.lstrip().startswith("#"):
+                commands.append(line)
+
+    argvs = []
+    for command in commands:
+        argv = shlex.split(command)
+        if argv and Path(argv[0]).name.startswith("python"):
+            argv.pop(0)
+        if argv and argv[0].endswith("plot.py"):
+            argv.pop(0)
+        argvs.append(argv)
+    return argvs
+
+
+def plot(args, csv_path, df=None):
+    """Plot a single CSV file.
+
+    If df is given (e.g., a run loaded from a store), it is plotted instead of the contents of csv_path.
+    """
     if args.name is None:
         args.name = csv_path.with_suffix("")
 
-    # Read CSV file using pandas.
-    df = pd.read_csv(csv_path)
-
-    # Remove "qi-" from column names that start with it.
-    df.columns = df.columns.str.replace('qi-', '')
-
-    # Remove columns that start with "quant-u" or "k!".
-    if args.filter_anonymous:
-        df = df.filter(regex='^(?!quant-u|k!).*$', axis=1)
-
-    # Split the DataFrame into two DataFrames: one with only the 'execution_time' column and one with all other columns.
-    execution_time_df = df[['execution_time']]
-    qi_df = df.drop(columns=['execution_time'])
-
-    # Determine Top Quantifiers if needed
-    if args.top is not None:
-        top_quantifiers = qi_df.median(numeric_only=True).nlargest(args.top).index
-        qi_df = qi_df.loc[:, list(top_quantifiers)]
+    dataset = read_dataset(csv_path) if df is None else Dataset(df)
+    df = dataset.df
+    execution_time_df = dataset.execution_time_df
+    censored = dataset.censored
 
+    # Remove anonymous quantifiers and determine the top quantifiers if needed.
+    qi_df = dataset.qi_df.loc[:, list(dataset.quantifiers(args.filter_anonymous, args.top))]
     qi_df = qi_df.sort_values(by=qi_df.index[0], ascending=False, axis=1)
 
     sns.set_theme(rc={'figure.figsize': args.qi_size})
@@ -89,6 +216,11 @@ def plot(args, csv_path):
     else:
         sns.boxplot(qi_df, orient='h')
 
+    # Mark the counts of runs killed by the watchdog of profile.py; they are lower bounds.
+    if censored.any():
+        sns.stripplot(qi_df[censored], orient='h', marker='X', color='red', size=6)
+        plt.title(f'{censored.sum()} of {len(df)} runs killed ({", ".join(killed_by(df, censored))}), marked with X')
+
     if args.start_at_zero_qi:
         plt.xlim(0, None)
 
@@ -96,15 +228,26 @@ def plot(args, csv_path):
     plt.savefig((str(args.name) + ".qi.pdf"), dpi=600)
     plt.close()
 
+    if args.timeline:
+        plot_timeline(args, csv_path.with_suffix(".timeline.jsonl.gz"), list(qi_df.columns))
+
+    if args.members:
+        plot_members(args, csv_path.with_suffix(".members.csv"))
+
+    plot_resources(args, [df], [None])
+
     # Generate plot for execution time if we have more than one measurement
     sns.set_theme(rc={'figure.figsize': args.execution_time_size})
     if len(df) > 1:
         plt.figure()
 
-        # Calculate median, quartiles, and IQR
-        median = execution_time_df['execution_time'].median()
-        quartile1 = execution_time_df['execution_time'].quantile(0.25)
-        quartile3 = execution_time_df['execution_time'].quantile(0.75)
+        # The execution times of censored runs are lower bounds, so they are plotted separately and excluded from the
+        # statistics.
+        censored_execution_time_df = execution_time_df[censored]
+        execution_time_df = execution_time_df[~censored]
+
+        # Median, quartiles, and IQR
+        quartile1, median, quartile3 = dataset.execution_time_quartiles
         iqr = quartile3 - quartile1
 
         # Identify outliers
@@ -122,6 +265,10 @@ def plot(args, csv_path):
         # Plot the outliers as individual points
         plt.scatter(outliers['execution_time'], np.zeros(len(outliers)), color='orange', s=30, label='Outliers')
 
+        if censored.any():
+            plt.scatter(censored_execution_time_df['execution_time'], np.zeros(len(censored_execution_time_df)),
+                        color='red', marker='X', s=40, label='Killed (censored)')
+
         plt.title('Histogram of Execution Times with Quartiles and Median')
 
         if args.start_at_zero_execution_time:
@@ -134,64 +281,35 @@ def plot(args, csv_path):
         plt.close()
 
 
-def plot_multiple(args, csv_paths):
-    """Plot multiple CSV files on the same graph."""
+def plot_multiple(args, csv_paths, dfs=None):
+    """Plot multiple CSV files on the same graph.
+
+    If dfs is given (e.g., runs loaded from a store), they are plotted instead of the contents of csv_paths.
+    """
     # Default value for variant name
     if args.variants is None:
         args.variants = [csv_path.stem.split("-")[0] for csv_path in csv_paths]
 
     # Load csv files and set the variant name
-    # Note that zip won't ignore extra elements in the longer list since they have the same length (checked in main)
-    dfs = []
-    for csv_path, variant in zip(csv_paths, args.variants):
-        df = pd.read_csv(csv_path)
-        df['Variant'] = variant
-        dfs.append(df)
-
-    # Remove "qi-" from column names that start with it.
-    for df in dfs:
-        df.columns = df.columns.str.replace('qi-', '')
-
-    if args.filter_anonymous:
-        # Remove columns that start with "quant-u" or "k!".
-        dfs = [df.filter(regex='^(?!quant-u|k!).*$', axis=1) for df in dfs]
-
-    # Split the DataFrames into two DataFrames: one with only the 'execution_time' column and one with all other
-    # columns.
-    execution_time_dfs = [df[['execution_time']] for df in dfs]
-    qi_dfs = [df.drop(columns=['execution_time']) for df in dfs]
-
+    # Note that zip won't ignore extra elements in the longer list since they have the same length (checked in render)
+    # Variants with runs killed by the watchdog of profile.py are labeled with the number of such runs.
+    datasets_of_variants = [read_dataset(csv_path) if dfs is None else Dataset(dfs[i])
+                            for i, csv_path in enumerate(csv_paths)]
+    labels = [f"{variant} ({dataset.censored.sum()} killed)" if dataset.censored.any() else variant
+              for dataset, variant in zip(datasets_of_variants, args.variants)]
+
+    # Remove anonymous quantifiers if needed, and plot the union of the top quantifiers of every variant.
+    quantifiers = [dataset.quantifiers(args.filter_anonymous, args.top) for dataset in datasets_of_variants]
     if args.top is not None:
-        # Determine Top Quantifiers for Each DataFrame
-        top_quantifiers_sets = []
-        for df in qi_dfs:
-            top_quantifiers = df.median(numeric_only=True).nlargest(args.top).index
-            top_quantifiers_sets.append(set(top_quantifiers))
-
-        # Take the Union of Top Quantifiers
-        union_top_quantifiers = set.union(*top_quantifiers_sets)
-
-        # Filter Each DataFrame on the Union of Top Quantifiers
-        qi_dfs_filtered = []
-        for df in qi_dfs:
-            # Keep 'Variant' column and any quantifier in the union of top quantifiers
-            columns_to_keep = ['Variant'] + list(union_top_quantifiers.intersection(df.columns))
-            qi_dfs_filtered.append(df.loc[:, columns_to_keep])
-
-        # Now qi_dfs_filtered contains the DataFrames filtered to include only the union of top quantifiers
-        qi_dfs = qi_dfs_filtered
-
-    # Sort each DataFrame in qi_dfs by the median number of instantiations
-    sorted_qi_dfs = []
-    for df in qi_dfs:
-        # Calculate the median of each column
-        medians = df.median(numeric_only=True).sort_values(ascending=False)
-        # Sort the DataFrame based on the calculated medians
-        sorted_df = df.loc[:, df.columns.intersection(['Variant']).append(medians.index)]
-        sorted_qi_dfs.append(sorted_df)
-
-    # Now, sorted_qi_dfs contains the sorted DataFrames
-    qi_dfs = sorted_qi_dfs
+        union_top_quantifiers = set().union(*quantifiers)
+        quantifiers = [columns[columns.isin(union_top_quantifiers)]
+                       for columns in (dataset.quantifiers(args.filter_anonymous) for dataset in datasets_of_variants)]
+
+    # Sort the quantifiers of each variant by their median number of instantiations
+    qi_dfs = []
+    for dataset, label, columns in zip(datasets_of_variants, labels, quantifiers):
+        medians = dataset.qi_medians[columns].sort_values(ascending=False)
+        qi_dfs.append(dataset.qi_df[medians.index].assign(Variant=label)[["Variant"] + list(medians.index)])
 
     # Combine the DataFrames into a single DataFrame for plotting
     qi_cdf = pd.concat(qi_dfs)
@@ -221,13 +339,20 @@ def plot_multiple(args, csv_paths):
     sns.set_theme(rc={'figure.figsize': args.execution_time_size})
 
     # Combine DataFrames and rename the columns to the variant names
-    execution_time_cdf = pd.concat(execution_time_dfs, axis=1)
-    execution_time_cdf.columns = args.variants
+    execution_time_cdf = pd.concat([dataset.execution_time_df for dataset in datasets_of_variants], axis=1)
+    execution_time_cdf.columns = labels
+    censored_cdf = pd.concat([dataset.censored.to_frame() for dataset in datasets_of_variants], axis=1)
+    censored_cdf = censored_cdf.fillna(False).astype(bool)
+    censored_cdf.columns = labels
 
     plt.figure()
 
     sns.boxplot(execution_time_cdf)
 
+    # Mark the execution times of censored runs; they are lower bounds.
+    if censored_cdf.any(axis=None):
+        sns.stripplot(execution_time_cdf.where(censored_cdf), marker='X', color='red', size=6)
+
     if args.start_at_zero_execution_time:
         plt.ylim(0, None)
     plt.xlabel('Variant', labelpad=15)
@@ -237,6 +362,221 @@ def plot_multiple(args, csv_paths):
     plt.savefig(f"{args.name}.execution_time.pdf", dpi=600)
     plt.close()
 
+    plot_resources(args, [dataset.df for dataset in datasets_of_variants], labels)
+
+
+def plot_resources(args, dfs, labels):
+    """Plot the CPU times and peak memory of Silicon's JVM and Z3 next to the execution time, one box per variant.
+
+    Nothing is plotted for CSV files written before profile.py measured these resources. Runs killed by the watchdog of
+    profile.py are excluded, as their measurements are lower bounds.
+    """
+    if not any('wall_time' in df.columns for df in dfs):
+        return
+
+    # Only the measured columns are concatenated, not the (many) columns of the quantifiers.
+    dfs = [df.loc[~censored_rows(df), [column for column in TIME_COLUMNS + MEMORY_COLUMNS if column in df.columns]]
+           .assign(Variant=label) for df, label in zip(dfs, labels)]
+    df = pd.concat(dfs, ignore_index=True)
+
+    sns.set_theme(rc={'figure.figsize': args.resources_size})
+    # Without sampling (profile.py --resource_interval 0), there are no memory columns.
+    memory_columns = [column for column in MEMORY_COLUMNS if column in df.columns]
+    if memory_columns:
+        fig, (time_ax, memory_ax) = plt.subplots(1, 2, gridspec_kw={'width_ratios': [3, 1]})
+    else:
+        fig, time_ax = plt.subplots()
+    hue = None if len(dfs) == 1 else 'Variant'
+
+    time_df = df.melt(id_vars='Variant', value_vars=[column for column in TIME_COLUMNS if column in df.columns],
+                      var_name='measure', value_name='seconds')
+    sns.boxplot(time_df, x='measure', y='seconds', hue=hue, ax=time_ax)
+    time_ax.set_xlabel('')
+    time_ax.set_ylabel('Time (seconds)', labelpad=15)
+    time_ax.tick_params(axis='x', labelrotation=30)
+
+    if memory_columns:
+        memory_df = df.melt(id_vars='Variant', value_vars=memory_columns, var_name='measure', value_name='MiB')
+        sns.boxplot(memory_df, x='measure', y='MiB', hue=hue, ax=memory_ax, legend=False)
+        memory_ax.set_xlabel('')
+        memory_ax.set_ylabel('Peak resident set size (MiB)', labelpad=15)
+        memory_ax.tick_params(axis='x', labelrotation=30)
+
+    if args.start_at_zero_execution_time:
+        time_ax.set_ylim(0, None)
+    fig.tight_layout()
+    fig.savefig(f"{args.name}.resources.pdf", dpi=600)
+    plt.close(fig)
+
+
+def plot_scaling(table_path, size):
+    """Plot the speedup and efficiency of the configurations in the results table of scaling.py over the number of
+    parallel verifiers, one line per setting of branch parallelization.
+
+    The plot is saved next to the table. The ideal (linear) speedup and efficiency are drawn as dashed lines.
+    """
+    df = pd.read_csv(table_path)
+    df = df[df['status'] == 'ok'].assign(
+        branches=df['parallelize_branches'].map({True: 'parallel branches', False: 'serial branches'}))
+    verifiers = sorted(df['parallel_verifiers'].unique())
+
+    sns.set_theme(rc={'figure.figsize': size})
+    fig, (speedup_ax, efficiency_ax) = plt.subplots(1, 2)
+    for ax, column, ideal in ((speedup_ax, 'speedup', verifiers), (efficiency_ax, 'efficiency', [1] * len(verifiers))):
+        sns.lineplot(df, x='parallel_verifiers', y=column, hue='branches', marker='o', ax=ax,
+                     legend=ax is speedup_ax)
+        ax.plot(verifiers, ideal, linestyle='--', color='gray', label='ideal')
+        ax.set_xscale('log', base=2)
+        ax.set_xticks(verifiers, [str(count) for count in verifiers])
+        ax.set_xlabel('Parallel verifiers', labelpad=15)
+        ax.set_ylim(0, None)
+    speedup_ax.set_ylabel('Speedup over one verifier', labelpad=15)
+    speedup_ax.legend()
+    efficiency_ax.set_ylabel('Efficiency (speedup per verifier)', labelpad=15)
+
+    fig.tight_layout()
+    fig.savefig(table_path.with_suffix('.pdf'), dpi=600)
+    plt.close(fig)
+
+
+def plot_timeline(args, timeline_path, quantifiers):
+    """Plot the cumulative number of instantiations of the given quantifiers over time.
+
+    Every iteration is drawn as a separate line, so that runs in which a quantifier runs away stand out. Nothing is
+    plotted if none of the quantifiers occurs in the timelines.
+    """
+    dfs = []
+    with gzip.open(timeline_path, "rt") as timeline_file:
+        for line in timeline_file:
+            record = json.loads(line)
+            quantifier = record["quantifier"].replace('qi-', '', 1)
+            if quantifier not in quantifiers:
+                continue
+
+            # The timelines store the differences between consecutive reports.
+            dfs.append(pd.DataFrame({
+                "time": np.cumsum(record["time_us"]) / 1_000_000,
+                "instantiations": np.cumsum(record["instantiations"]),
+                "quantifier": quantifier,
+                "iteration": record["iteration"],
+            }))
+    if not dfs:
+        logging.warning(f"None of the quantifiers {', '.join(quantifiers)} occurs in {timeline_path}.")
+        return
+
+    sns.set_theme(rc={'figure.figsize': args.timeline_size})
+    plt.figure()
+
+    sns.lineplot(pd.concat(dfs, ignore_index=True), x="time", y="instantiations", hue="quantifier",
+                 hue_order=quantifiers, units="iteration", estimator=None, drawstyle="steps-post", alpha=0.6)
+
+    plt.xlabel('Time (seconds)', labelpad=15)
+    plt.ylabel('Number of Instantiations', labelpad=15)
+    plt.tight_layout()
+    plt.savefig((str(args.name) + ".timeline.pdf"), dpi=600)
+    plt.close()
+
+
+def plot_members(args, members_path):
+    """Plot the verification times of the args.members members with the highest median time, slowest first.
+
+    Every member is labeled with its source location and its median number of instantiations, so that it is visible
+    where opaque annotations and proof assists pay off. Nothing is plotted if no member has been reported.
+    """
+    df = pd.read_csv(members_path, keep_default_na=False)
+    if df.empty:
+        return
+    df['label'] = df['member'] + df['location'].map(lambda location: f' ({location})' if location else '')
+
+    medians = df.groupby('label')[['time', 'instantiations']].median().sort_values('time', ascending=False)
+    medians = medians.head(args.members)
+    df = df[df['label'].isin(medians.index)]
+    labels = {label: f'{label}, {int(instantiations)} QIs'
+              for label, instantiations in medians['instantiations'].items()}
+
+    sns.set_theme(rc={'figure.figsize': args.members_size})
+    plt.figure()
+
+    sns.boxplot(df.assign(label=df['label'].map(labels)), x='time', y='label', orient='h',
+                order=[labels[label] for label in medians.index])
+
+    plt.xlabel('Verification time (seconds)', labelpad=15)
+    plt.ylabel('Member', labelpad=15)
+    plt.tight_layout()
+    plt.savefig((str(args.name) + ".members.pdf"), dpi=600)
+    plt.close()
+
+
+class Dataset:
+    """A CSV file of profile.py (or a run of a store) and the summaries that the plots are based on.
+
+    The summaries are computed once, for all quantifiers at once, so that plots sharing a CSV file share them, too.
+    The DataFrames must not be modified by the plots.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.execution_time_df, self.qi_df = split_columns(df)
+        self.censored = censored_rows(df)
+        self.qi_medians = self.qi_df.median()
+        # The execution times of censored runs are lower bounds, so they are excluded from the statistics.
+        self.execution_time_quartiles = self.execution_time_df['execution_time'][~self.censored].quantile(
+            [0.25, 0.5, 0.75]).tolist()
+
+    def quantifiers(self, filter_anonymous=False, top=None):
+        """Returns the quantifiers, without anonymous ones like quant-u-17 and k!512 if filter_anonymous is set, and
+        only the top ones by median number of instantiations if top is set (in descending order)."""
+        medians = self.qi_medians
+        if filter_anonymous:
+            medians = medians[~medians.index.str.match('quant-u|k!')]
+        if top is not None:
+            medians = medians.nlargest(top)
+        return medians.index
+
+
+def read_dataset(csv_path):
+    """Returns the Dataset of a CSV file, reading it only once per process."""
+    key = Path(csv_path).resolve()
+    if key not in datasets:
+        datasets[key] = Dataset(pd.read_csv(csv_path))
+    return datasets[key]
+
+
+def censored_rows(df):
+    """Returns a boolean Series that marks the runs that were killed by the watchdog of profile.py."""
+    if 'censored' not in df.columns:
+        return pd.Series(False, index=df.index)
+    return df['censored'].fillna('').astype(str) != ''
+
+
+def killed_by(df, censored):
+    """Returns a description of the reasons and culprits of the censored runs, e.g., ["2x qi_rate: prog.loop"]."""
+    reasons = df[censored].groupby(['censored', df['culprit'].fillna('')]).size()
+    return [f"{count}x {reason}: {culprit}" if culprit else f"{count}x {reason}"
+            for (reason, culprit), count in reasons.items()]
+
+
+def split_columns(df):
+    """Split a DataFrame read from a CSV file of profile.py into two DataFrames.
+
+    The first one only contains the 'execution_time' column, the second one contains the quantifier instantiations
+    with "qi-" removed from the column names. All other columns (e.g., the worker and core an iteration ran on) are
+    dropped.
+    """
+    execution_time_df = df[['execution_time']]
+    qi_df = df.filter(regex='^qi-', axis=1).copy()
+    qi_df.columns = qi_df.columns.str.replace('qi-', '', n=1)
+    return execution_time_df, qi_df
+
+
+def column_value(string):
+    """Splits a string of the form column=value."""
+    column, separator, value = string.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError(f"{string} is not of the form column=value")
+
+    return column, value
+
 
 def program_path(string):
     """Checks that the string is a valid path to a CSV file."""
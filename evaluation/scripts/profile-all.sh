@@ -34,6 +34,19 @@
 
 ITERATIONS=30
 
+# If TARGET_PRECISION is set (e.g., to 0.05), every experiment is profiled until the
+# 95% confidence interval of the median execution time is at most that fraction of
+# the median, instead of for a fixed number of ITERATIONS.
+if [ -n "$TARGET_PRECISION" ]; then
+    ITERATION_ARGS="--target_precision $TARGET_PRECISION"
+else
+    ITERATION_ARGS="--iterations $ITERATIONS"
+fi
+
+# Tool versions, translations and completed iterations are cached in CACHE_DIR, so
+# that rerunning this script only profiles experiments that changed.
+CACHE_DIR=${CACHE_DIR:-$HOME/.cache/gobra-libs-evaluation}
+
 # Check if the environment variables are unset or empty
 if [ -z "$SILICON_PATH" ]; then
     echo "Please set the environment variable SILICON_PATH to the path to silicon.sh."
@@ -48,11 +61,21 @@ if [ -z "$GOBRA_PATH" ]; then
     exit 1
 fi
 
-# profile with disabled set axioms
-python3 profile.py ../experiments/synthetic_set/fully_assisted/fully_assisted.gobra --disableSetAxiomatization --z3RandomizeSeeds --iterations $ITERATIONS --silicon_path $SILICON_PATH --z3_path $Z3_PATH --gobra $GOBRA_PATH
+# Number of programs profiled in parallel. Parallel runs may disturb each other's
+# execution times, so this defaults to 1.
+JOBS=${JOBS:-1}
 
-# profile all files "normally"
-find ../experiments -type f -name "*.gobra" -exec python3 profile.py {} --z3RandomizeSeeds --iterations $ITERATIONS --silicon_path $SILICON_PATH --z3_path $Z3_PATH --gobra $GOBRA_PATH \;
+# If BENCHMARK is set, experiments are profiled in a low-noise benchmark mode: every
+# experiment starts with a discarded warm-up iteration, every iteration waits for an
+# idle CPU (and warns about frequency scaling and battery power), the CPU time and
+# memory of Silicon and Z3 are not sampled, and the iterations of all experiments
+# are interleaved in a random order. A fingerprint of the machine
+# is written next to every CSV file in any case. BENCHMARK cannot be combined with
+# TARGET_PRECISION or JOBS.
+if [ -n "$BENCHMARK" ]; then
+    BENCHMARK_ARGS="--interleave --warmup 1 --check_environment --resource_interval 0"
+fi
 
-# generate plots for every csv
-find ../experiments -type f -name "*.csv" -exec python3 plot.py --qi_size 9 9 {} \;
+# profile every experiment in profile-all.json and plot every CSV file that changed
+# since it was last plotted. An interrupted sweep is resumed when the script is rerun.
+python3 batch.py profile-all.json --jobs $JOBS --state $CACHE_DIR/profile-all.state.json $ITERATION_ARGS $BENCHMARK_ARGS --cache_dir $CACHE_DIR --silicon_path $SILICON_PATH --z3_path $Z3_PATH --gobra $GOBRA_PATH
@@ -7,13 +7,48 @@ for full license details.
 """
 
 import argparse
+import array
+import collections
 import csv
+import functools
+import gzip
+import io
+import json
 import logging
+import math
+import multiprocessing
 import os
+import platform
+import re
+import shutil
+import signal
+import tempfile
+import threading
 import time
+import statistics
 import subprocess
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
 
-from util import file_path
+from cache import Cache, file_identity, hash_directory, hash_file
+from util import directory_path, file_path
+from viperserver import ViperServer
+
+# Worker and core of the current process. Set by init_worker in the worker processes of the pool used by --jobs; the
+# main process is worker 0 and is not pinned to a core.
+worker_id = 0
+worker_cpu = None
+# Warnings about the environment that have already been logged (see warn_once).
+environment_warnings = set()
+
+# The file names built by format_metadata.
+CSV_NAME = re.compile(r"^(?P<program>.*?)(?P<z3RandomizeSeeds>-rand)?(?P<disableSetAxiomatization>-no_set_axiom)?"
+                      r"(?P<viperserver>-server)?-iter_(?P<iterations>\d+)(_(?P<stopping_reason>[a-z_]+))?"
+                      r"-gran_(?P<granularity>\d+)(-jobs_(?P<jobs>\d+))?(?P<pinned>-pinned)?"
+                      r"(-par_(?P<parallel_verifiers>\d+))?(?P<parallelize_branches>-branches)?"
+                      r"-sil_ver_(?P<silicon_version>[^-]+)-z3_ver_(?P<z3_version>[^-]+)"
+                      r"(-gobra_ver_(?P<gobra_version>[^-]+))?$")
 
 
 def main():
@@ -22,78 +57,670 @@ def main():
     logging.basicConfig(level=logging.DEBUG)
 
     args = parse_args()
+    profile_program(args)
+
+
+def profile_program(args):
+    """Profile the program given by the parsed command line arguments and return the path to the CSV file."""
+    cache, metadata, vpr_file_path = prepare_program(args)
+    data, details, stopping_reason = run_iterations(args, vpr_file_path, metadata, cache)
+    return write_results(args, metadata, data, details, stopping_reason, cache)
+
 
-    metadata = generate_metadata(args)
+def prepare_program(args):
+    """Set up the cache, generate the metadata and translate the program if needed.
+
+    Returns the cache (None if args.cache_dir is not set), the metadata and the path to the Viper file to be profiled.
+    """
+    cache = None
+    if args.cache_dir is not None:
+        cache = Cache(args.cache_dir, args.cache_max_size * 1024 * 1024)
+
+    metadata = generate_metadata(args, cache)
 
     # Set Z3 environment for Gobra and Silicon.
     os.environ["Z3_EXE"] = str(args.z3_path)
 
     # Generate Gobra file if needed.
-    if args.program_path.suffix == '.gobra':
+    if is_gobra(args.program_path):
         if args.gobra_path is None:
             logging.error("Path to Gobra jar is required for Gobra files.")
             raise ValueError("Path to Gobra jar is required for Gobra files.")
 
-        # TODO Refactor this so we can pass it using shell=False
-        command = f"java -jar -Xss128m {args.gobra_path} --printVpr --noVerify -i {args.program_path}"
-
-        logging.info("Generating Viper file.")
-        time_checked_command(command, shell=True)
-        logging.info("Viper file generated.")
-
-        vpr_file_path = args.program_path.with_suffix(".gobra.vpr")
+        vpr_file_path = translate(args, metadata, cache)
     # Due to program_path(), this is a Viper file.
     else:
         vpr_file_path = args.program_path
 
-    data = []
-    for i in range(0, args.iterations):
-        # --useOldAxiomatization: At the time of writing, the new axiomatization has anonymous axioms, which is why
-        # we use the old one with names.
-        command = [args.silicon_path, "--useOldAxiomatization", "--numberOfParallelVerifiers", "1", "--z3Args",
-                   f'smt.qi.profile=true smt.qi.profile_freq={args.granularity}', vpr_file_path]
-        if args.z3RandomizeSeeds:
-            command.append("--z3RandomizeSeeds")
-        if args.disableSetAxiomatization:
-            # Get current directory of this file.
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            command.append("--setAxiomatizationFile")
-            command.append(os.path.join(script_dir, 'noaxioms_sets.vpr'))
-
-        logging.info(f"Running Silicon with profiling. Iteration: {i + 1} of {args.iterations}.")
-        command, execution_time = time_checked_command(command)
-        logging.info(f"Silicon finished in {execution_time} seconds.")
+    return cache, metadata, vpr_file_path
+
 
-        logging.info("Processing Silicon's profiling output")
-        data_point = process_output(command.stdout)
-        logging.info("Silicon's profiling output processed.")
-        data_point["execution_time"] = execution_time
+def write_results(args, metadata, data, details, stopping_reason=None, cache=None):
+    """Write the results of all iterations (see run_iterations) and return the path to the CSV file.
 
-        data.append(data_point)
+    Next to the CSV file, a fingerprint of the machine and its environment is written (see environment_fingerprint).
+    """
+    if stopping_reason is not None:
+        metadata["iterations"] = len(data)
+        metadata["stopping_reason"] = stopping_reason
+        logging.info(f"Stopped after {len(data)} iterations: {stopping_reason}.")
 
     # Write CSV files.
-    csv_path = (metadata["program_path"].parent / format_metadata(metadata)).with_suffix(".csv")
-    write_to_csv(data, csv_path)
+    output_dir = args.output_dir or metadata["program_path"].parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    csv_path = (output_dir / format_metadata(metadata)).with_suffix(".csv")
+    fingerprint_path = csv_path.with_suffix(".env.json")
+    # If the CSV file is unchanged (e.g., all iterations were taken from the cache), its fingerprint still describes the
+    # environment in which the iterations were run.
+    if write_to_csv(data, csv_path) or not fingerprint_path.is_file():
+        write_fingerprint(environment_fingerprint(args, metadata, cache), fingerprint_path)
+
+    if args.timeline:
+        write_timelines([iteration_details["timeline"] for iteration_details in details],
+                        csv_path.with_suffix(".timeline.jsonl.gz"))
+
+    if args.members:
+        write_members([iteration_details["members"] for iteration_details in details], member_locations(args),
+                      csv_path.with_suffix(".members.csv"))
+
+    if args.store is not None:
+        # pyarrow is only required when using the store.
+        import store
+        store.append_run(args.store, metadata, data, csv_path.stem)
+
+    return csv_path
+
+
+def translate(args, metadata, cache=None):
+    """Translate the Gobra program or package to Viper and return the path to the Viper file.
+
+    If cache is not None, the translation is reused if the same program, with the same imported packages, has been
+    translated by the same version of Gobra before.
+    """
+    if args.program_path.is_dir():
+        return translate_package(args, metadata, cache)
+
+    vpr_file_path = args.program_path.with_suffix(".gobra.vpr")
+    # The translation also depends on the imported packages, which are looked up in the include directories.
+    key = ["translation", hash_file(args.program_path),
+           [hash_directory(directory, "*.gobra") for directory in include_directories(args.program_path)],
+           metadata["gobra_version"]]
+    vpr = cache.get(key) if cache is not None else None
+    if vpr is not None:
+        logging.info("Using cached Viper file.")
+        if not vpr_file_path.is_file() or vpr_file_path.read_text() != vpr:
+            vpr_file_path.write_text(vpr)
+        return vpr_file_path
+
+    # TODO Refactor this so we can pass it using shell=False
+    command = f"java -jar -Xss128m {args.gobra_path} --printVpr --noVerify -i {args.program_path}"
+
+    logging.info("Generating Viper file.")
+    time_checked_command(command, shell=True)
+    logging.info("Viper file generated.")
+
+    if cache is not None:
+        cache.put(key, vpr_file_path.read_text())
+    return vpr_file_path
+
+
+def include_directories(program_path):
+    """Returns the directories in which Gobra looks up the packages imported by the Gobra file at program_path.
+
+    These are given in the in-file configuration of the file, e.g., // ##(-I ./..), relative to the directory of the
+    file.
+    """
+    directories = []
+    for configuration in re.findall(r"^\s*//\s*##\((.*)\)", program_path.read_text(), re.MULTILINE):
+        options = configuration.split()
+        for option, value in zip(options, options[1:]):
+            if option in ("-I", "--include"):
+                directories.append(program_path.parent / value)
+    return directories
+
+
+def translate_package(args, metadata, cache=None):
+    """Translate the Gobra package in the directory args.program_path to Viper and return the path to the Viper file.
+
+    Imported packages are looked up in args.include_path (by default, the parent directory of the package, i.e., the
+    root of gobra-libs for its packages). As the translation depends on them, the cache key covers all Gobra files in
+    the include path. The Viper file is stored as <package>.gobra.vpr in args.output_dir (by default, the parent
+    directory of the package).
+    """
+    include_path = args.include_path or args.program_path.parent
+    vpr_file_path = (args.output_dir or args.program_path.parent) / f"{args.program_path.name}.gobra.vpr"
+    key = ["translation", hash_directory(include_path, "*.gobra"), os.path.relpath(args.program_path, include_path),
+           metadata["gobra_version"]]
+    vpr = cache.get(key) if cache is not None else None
+    if vpr is not None:
+        logging.info("Using cached Viper file.")
+        if not vpr_file_path.is_file() or vpr_file_path.read_text() != vpr:
+            vpr_file_path.parent.mkdir(parents=True, exist_ok=True)
+            vpr_file_path.write_text(vpr)
+        return vpr_file_path
+
+    # TODO Refactor this so we can pass it using shell=False
+    command = (f"java -jar -Xss128m {args.gobra_path} --printVpr --noVerify -p {args.program_path} "
+               f"-I {include_path}")
+
+    logging.info("Generating Viper file.")
+    start_time = time.time()
+    time_checked_command(command, shell=True)
+    # Gobra names the Viper file of a package after one of its files, i.e., <file>.gobra.vpr.
+    generated = [path for path in args.program_path.glob("*.vpr") if path.stat().st_mtime >= start_time]
+    if len(generated) != 1:
+        logging.error(f"Expected Gobra to generate one Viper file in {args.program_path}, found {generated}.")
+        raise RuntimeError(f"Expected Gobra to generate one Viper file in {args.program_path}, found {generated}.")
+    vpr_file_path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(generated[0], vpr_file_path)
+    logging.info("Viper file generated.")
+
+    if cache is not None:
+        cache.put(key, vpr_file_path.read_text())
+    return vpr_file_path
+
+
+def run_iterations(args, vpr_file_path, metadata, cache=None):
+    """Run all iterations, either one after another or, if args.jobs > 1, in a pool of pinned worker processes.
+
+    If args.target_precision is set, iterations are run until the median is precise enough (see run_adaptively);
+    otherwise, exactly args.iterations iterations are run. If cache is not None, iterations that have already been run
+    with the same program, tools and settings are taken from it instead (see cached_runner). If args.warmup is set, that
+    many iterations are run and discarded before the first one that is not taken from the cache.
+
+    Returns the list of data points and the list of details of the iterations (see run_iteration), both in the order
+    of the iterations, regardless of the order in which they finished, and the reason for stopping (None if the number
+    of iterations was fixed).
+    """
+    with iteration_runner(args, vpr_file_path) as run:
+        if args.warmup:
+            run = warmed_up_runner(run, args.warmup)
+        # Timelines and members are not cached, so iterations have to be rerun to get them.
+        if cache is not None and not args.timeline and not args.members:
+            run = cached_runner(run, cache, results_key(args, metadata, vpr_file_path))
+
+        if args.target_precision is None:
+            results = run(range(0, args.iterations))
+            stopping_reason = None
+        else:
+            results, stopping_reason = run_adaptively(args, run)
+
+    data = [data_point for data_point, _ in results]
+    details = [iteration_details for _, iteration_details in results]
+    return data, details, stopping_reason
+
+
+@contextmanager
+def iteration_runner(args, vpr_file_path):
+    """Set up the backend and yield a function that runs the iterations with the given indices.
+
+    The function returns the results of the iterations in the order of the indices. Depending on args, the iterations
+    are run by Silicon one after another, by a pool of args.jobs worker processes each pinned to its own core, or by a
+    long-lived ViperServer process.
+    """
+    if args.viperserver_path is not None:
+        # The server is only started once an iteration is actually run, i.e., not if all iterations are cached.
+        with ExitStack() as stack:
+            servers = []
+
+            def run(indices):
+                if indices and not servers:
+                    servers.append(stack.enter_context(ViperServer(args.viperserver_path)))
+                return [run_server_iteration(args, servers[0], vpr_file_path, i) for i in indices]
+
+            yield run
+        return
+
+    if args.jobs == 1:
+        yield lambda indices: [run_iteration(args, vpr_file_path, i) for i in indices]
+        return
+
+    logging.info(f"Running iterations on {args.jobs} workers.")
+    with worker_pool(args.jobs) as executor:
+        yield lambda indices: list(executor.map(functools.partial(run_iteration, args, vpr_file_path), indices))
+
+
+def worker_pool(jobs):
+    """Returns a ProcessPoolExecutor with the given number of worker processes, each pinned to its own core."""
+    cpus = available_cpus()
+    if cpus is not None and jobs > len(cpus):
+        logging.error(f"Cannot pin {jobs} workers to {len(cpus)} available cores.")
+        raise ValueError(f"Cannot pin {jobs} workers to {len(cpus)} available cores.")
+
+    # Every worker takes exactly one id from the queue when it starts.
+    worker_ids = multiprocessing.Queue()
+    for i in range(0, jobs):
+        worker_ids.put(i)
+
+    return ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(worker_ids, cpus))
+
+
+def job_pool(jobs):
+    """Returns an executor for profiling several programs, e.g., in batch.py.
+
+    With more than one job, this is a pool of worker processes, each pinned to its own core (see worker_pool). A single
+    job runs in the current process without pinning, as profile.py does without --jobs, so that its results are
+    comparable with those of profile.py.
+    """
+    if jobs == 1:
+        return SerialExecutor()
+    return worker_pool(jobs)
+
+
+class SerialExecutor(Executor):
+    """An executor that runs every task in the current process as soon as it is submitted."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def warmed_up_runner(run, warmup):
+    """Wrap a function returned by iteration_runner, so that warmup iterations are run and discarded before the first
+    iteration that is actually run.
+
+    The first iterations are often outliers, e.g., because the files of the JVM and of the program are not yet in the
+    page cache, or, with ViperServer, because its code has not yet been compiled by the JIT compiler.
+    """
+    warmed_up = False
+
+    def run_warmed_up(indices):
+        nonlocal warmed_up
+        indices = list(indices)
+        if indices and not warmed_up:
+            logging.info(f"Running {warmup} warm-up iterations, which are discarded.")
+            run(range(0, warmup))
+            warmed_up = True
+        return run(indices)
+
+    return run_warmed_up
+
+
+def cached_runner(run, cache, key):
+    """Wrap a function returned by iteration_runner, so that iterations already stored in cache are not run again.
+
+    The data points of all iterations are stored under key after every call, so that an interrupted run can be
+    resumed. Iterations are expected to be requested in order, as done by run_iterations.
+    """
+    data = cache.get(key) or []
+    if data:
+        logging.info(f"Found {len(data)} iterations in the cache.")
+
+    def run_cached(indices):
+        indices = list(indices)
+        missing = [i for i in indices if i >= len(data)]
+        results = dict(zip(missing, run(missing))) if missing else {}
+        if missing:
+            data.extend(results[i][0] for i in missing)
+            cache.put(key, data)
+        return [results[i] if i in results else (data[i], {"timeline": None, "members": None}) for i in indices]
+
+    return run_cached
+
 
+def results_key(args, metadata, vpr_file_path):
+    """Returns the cache key of the iterations of profiling the Viper file with the given tools and settings.
 
-def process_output(output):
+    Files passed to Silicon (the program and, e.g., the set axiomatization) are identified by the hashes of their
+    contents, so that the key changes whenever one of them does.
+    """
+    arguments = [hash_file(argument) if os.path.isfile(argument) else str(argument)
+                 for argument in silicon_arguments(args, vpr_file_path)]
+    # The resource sampling and the environment checks determine which columns an iteration has.
+    return ["results", arguments, metadata["silicon_version"], metadata["z3_version"], args.jobs, metadata["pinned"],
+            args.viperserver_path is not None, args.timeout, args.max_qi_rate, args.resource_interval,
+            args.check_environment]
+
+
+def run_adaptively(args, run):
+    """Run iterations until the median execution time (and, if args.precision_qi is set, the median number of
+    instantiations of every quantifier) is precise enough.
+
+    A median is precise enough if the width of its 95% confidence interval is at most args.target_precision times the
+    median. At least args.min_iterations and at most args.max_iterations iterations are run; after the first
+    args.min_iterations, iterations are run in batches of args.jobs. Censored iterations are not taken into account.
+
+    Returns the results of the iterations and the reason for stopping ("converged" or "max_iterations").
+    """
+    results = run(range(0, args.min_iterations))
+    while True:
+        data = [data_point for data_point, _ in results if not data_point.get("censored")]
+        columns = ["execution_time"]
+        if args.precision_qi:
+            columns += sorted({key for data_point in data for key in data_point if key.startswith("qi-")})
+
+        if all(precise_enough([data_point.get(column, 0) for data_point in data], args.target_precision)
+               for column in columns):
+            return results, "converged"
+        if len(results) >= args.max_iterations:
+            return results, "max_iterations"
+
+        batch_size = min(args.jobs, args.max_iterations - len(results))
+        results += run(range(len(results), len(results) + batch_size))
+
+
+def precise_enough(values, target_precision):
+    """Checks whether the 95% confidence interval of the median of the values is narrow enough.
+
+    A median of 0 (e.g., of a quantifier that is instantiated in only a few iterations) has no relative precision, so
+    it is always precise enough once the confidence interval can be computed.
+    """
+    interval = median_confidence_interval(values)
+    if interval is None:
+        return False
+
+    median = statistics.median(values)
+    if median == 0:
+        return True
+    lower, upper = interval
+    return upper - lower <= target_precision * abs(median)
+
+
+def median_confidence_interval(values, confidence=0.95):
+    """Distribution-free confidence interval of the median, based on order statistics.
+
+    The interval between the k-th smallest and the k-th largest of n values contains the median with probability
+    1 - 2 * P(B < k), where B is binomially distributed with parameters n and 1/2. Returns the narrowest such interval
+    with at least the given confidence, or None if there are too few values to reach it.
+    """
+    n = len(values)
+    values = sorted(values)
+    # Find the largest k such that P(B < k) <= (1 - confidence) / 2.
+    k = 0
+    cumulative = 0
+    while k < n:
+        probability = math.comb(n, k) / 2 ** n
+        if cumulative + probability > (1 - confidence) / 2:
+            break
+        cumulative += probability
+        k += 1
+
+    if k == 0:
+        return None
+    return values[k - 1], values[n - k]
+
+
+def silicon_arguments(args, vpr_file_path):
+    """Returns the arguments passed to Silicon for profiling the Viper file."""
+    # --useOldAxiomatization: At the time of writing, the new axiomatization has anonymous axioms, which is why
+    # we use the old one with names.
+    arguments = ["--useOldAxiomatization", "--numberOfParallelVerifiers", str(args.parallel_verifiers), "--z3Args",
+                 f'smt.qi.profile=true smt.qi.profile_freq={args.granularity}', vpr_file_path]
+    if args.parallelize_branches:
+        arguments.append("--parallelizeBranches")
+    if args.z3RandomizeSeeds:
+        arguments.append("--z3RandomizeSeeds")
+    if args.disableSetAxiomatization:
+        # Get current directory of this file.
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        arguments.append("--setAxiomatizationFile")
+        arguments.append(os.path.join(script_dir, 'noaxioms_sets.vpr'))
+
+    return arguments
+
+
+def run_iteration(args, vpr_file_path, i):
+    """Run Silicon with profiling once and return the resulting data point and the details of the iteration.
+
+    The data point is a row of the CSV file. Besides the instantiations and the execution time, it contains the CPU
+    times and peak memory of Silicon's JVM and Z3 (see ResourceMonitor). The details are a dictionary with the data
+    that does not fit into a single row, i.e., the Timeline of the iteration if args.timeline is set. Members are only
+    reported by ViperServer (see run_server_iteration).
+    """
+    command = [args.silicon_path] + silicon_arguments(args, vpr_file_path)
+    timeline = Timeline() if args.timeline else None
+    watchdog = Watchdog(args.timeout, args.max_qi_rate) if args.timeout or args.max_qi_rate else None
+    resources = ResourceMonitor(args.resource_interval)
+    environment = check_environment(args) if args.check_environment else {}
+
+    logging.info(f"Running Silicon with profiling. Iteration: {i + 1} of {args.iterations}. Worker: {worker_id}.")
+    # Silicon's profiling output is processed while Silicon is running.
+    data_point, execution_time = time_checked_stream(
+        command, functools.partial(process_output, timeline=timeline, watchdog=watchdog), watchdog,
+        resources=resources)
+    if watchdog is not None and watchdog.reason is not None:
+        logging.warning(f"Silicon killed after {execution_time} seconds ({watchdog.reason}, {watchdog.culprit}).")
+    else:
+        logging.info(f"Silicon finished in {execution_time} seconds.")
+
+    data_point["execution_time"] = execution_time
+    data_point.update(resources.to_columns())
+    data_point.update(environment)
+    # Record where the iteration ran, so that parallel runs can be compared against serial runs.
+    data_point["worker"] = worker_id
+    data_point["cpu"] = "" if worker_cpu is None else worker_cpu
+    # Killed runs are censored: their execution time and counts are lower bounds.
+    if watchdog is not None:
+        data_point["censored"] = watchdog.reason or ""
+        data_point["culprit"] = (watchdog.culprit or "").removeprefix("qi-")
+
+    return data_point, {"timeline": timeline, "members": None}
+
+
+def run_server_iteration(args, server, vpr_file_path, i):
+    """Verify the Viper file once with the long-lived ViperServer process and return the resulting data point.
+
+    In addition to the end-to-end execution_time, the data point contains the backend_time reported by Silicon itself,
+    which excludes the time spent on sending the job to ViperServer and parsing the program. The CPU times and memory
+    are those of the ViperServer process and its Z3 processes during the iteration. If args.members is set,
+    the details of the iteration contain the results of the members (see process_messages).
+    """
+    arguments = ["silicon", "--z3Exe", args.z3_path] + silicon_arguments(args, vpr_file_path)
+    timeline = Timeline() if args.timeline else None
+    members = [] if args.members else None
+    resources = ResourceMonitor(args.resource_interval)
+    environment = check_environment(args) if args.check_environment else {}
+
+    logging.info(f"Verifying with ViperServer. Iteration: {i + 1} of {args.iterations}.")
+    start_time = time.time()
+    resources.start(server.process.pid)
+    try:
+        data_point, backend_time = process_messages(server.verify(arguments), timeline, members)
+    finally:
+        resources.stop()
+    execution_time = time.time() - start_time
+    logging.info(f"ViperServer finished in {execution_time} seconds (backend: {backend_time} seconds).")
+
+    data_point["execution_time"] = execution_time
+    data_point["backend_time"] = backend_time
+    data_point.update(resources.to_columns())
+    data_point.update(environment)
+    data_point["worker"] = worker_id
+    data_point["cpu"] = ""
+
+    return data_point, {"timeline": timeline, "members": members}
+
+
+def process_messages(messages, timeline=None, members=None):
+    """Process the messages ViperServer reports during the verification of a program.
+
+    Returns the latest number of instantiations of every quantifier (in the same format as process_output) and the
+    verification time in seconds reported by Silicon. Raises RuntimeError if the verification failed. Like in
+    process_output, every report is added to timeline if it is not None.
+
+    If members is not None, the result of every member (method, function or predicate) is appended to it as a
+    dictionary with its Viper name, type, verification time in seconds, and the instantiations attributed to it. Z3
+    only reports cumulative numbers of instantiations, so the instantiations reported since the previous member are
+    attributed to a member. This is only accurate if Silicon verifies one member at a time and Z3 reports every
+    instantiation (--granularity 1), which profile.py requires for members.
+    """
+    result = {}
+    attributed = {}
+    backend_time = None
+    for message in messages:
+        msg_type = message.get("msg_type")
+        body = message.get("msg_body", {})
+
+        if msg_type == "quantifier_instantiations_message":
+            result[f"qi-{body['quantifier']}"] = body["instantiations"]
+            if timeline is not None:
+                timeline.add(f"qi-{body['quantifier']}", body["instantiations"])
+        elif msg_type == "verification_result" and body.get("kind") == "overall":
+            if body.get("status") != "success":
+                logging.error(f"Verification failed: {body}")
+                raise RuntimeError("Verification with ViperServer failed.")
+            # ViperServer reports times in milliseconds.
+            backend_time = body["details"]["time"] / 1000
+        elif msg_type == "verification_result" and body.get("kind") == "for_entity" and members is not None:
+            entity = body["details"]["entity"]
+            members.append({"member": entity["name"],
+                            "type": entity["type"],
+                            "time": body["details"]["time"] / 1000,
+                            "instantiations": {key: count - attributed.get(key, 0) for key, count in result.items()
+                                               if count > attributed.get(key, 0)}})
+            attributed = dict(result)
+        elif msg_type in ("exception_report", "invalid_args_report"):
+            logging.error(f"ViperServer reported {msg_type}: {body}")
+            raise RuntimeError(f"ViperServer reported {msg_type}.")
+
+    if backend_time is None:
+        raise RuntimeError("ViperServer did not report an overall verification result.")
+
+    return result, backend_time
+
+
+def check_environment(args):
+    """Check that the environment is quiet before running an iteration and return the columns describing it.
+
+    Warns if the cores may change their speed (i.e., their frequency governor is not "performance") or if the machine
+    runs on battery. Waits until the core the iteration runs on (or, if it is not pinned, the whole machine) is busy
+    for at most args.max_load of the time, but at most args.load_timeout seconds. The measured load is returned as the
+    column "load".
+    """
+    cpus = None if worker_cpu is None else [worker_cpu]
+    governors = cpu_governors(cpus)
+    if governors - {"performance"}:
+        warn_once(f"The frequency governor is {', '.join(sorted(governors))} instead of performance, so the speed of "
+                  f"the cores may vary between iterations.")
+    if on_battery():
+        warn_once("The machine runs on battery, which may slow it down.")
+
+    deadline = time.monotonic() + args.load_timeout
+    while True:
+        load = cpu_load(cpus)
+        if load is None:
+            warn_once("Measuring the load is not supported on this platform.")
+            return {"load": ""}
+        if load <= args.max_load:
+            return {"load": load}
+        if time.monotonic() >= deadline:
+            logging.warning(f"The CPU is still {load:.0%} busy after waiting {args.load_timeout} seconds. Running the "
+                            f"iteration anyway.")
+            return {"load": load}
+        logging.info(f"Waiting for the CPU to become idle ({load:.0%} busy).")
+
+
+def cpu_load(cpus=None, window=0.5):
+    """Returns the fraction of the time the given cores (or all cores if cpus is None) were busy during the next window
+    seconds, or None if /proc/stat is not available."""
+    def idle_and_total():
+        times = {}
+        with open("/proc/stat") as stat_file:
+            for line in stat_file:
+                if line.startswith("cpu"):
+                    name, *fields = line.split()
+                    # The idle time consists of idle and iowait, see proc(5).
+                    times[name] = (int(fields[3]) + int(fields[4]), sum(int(field) for field in fields[:8]))
+        names = ["cpu"] if cpus is None else [f"cpu{cpu}" for cpu in cpus]
+        return sum(times[name][0] for name in names), sum(times[name][1] for name in names)
+
+    try:
+        idle_before, total_before = idle_and_total()
+        time.sleep(window)
+        idle_after, total_after = idle_and_total()
+    except OSError:
+        return None
+    if total_after == total_before:
+        return 0.0
+    return 1 - (idle_after - idle_before) / (total_after - total_before)
+
+
+def cpu_governors(cpus=None):
+    """Returns the set of frequency governors of the given cores (or all cores if cpus is None).
+
+    The set is empty if frequency scaling is not supported or not exposed (e.g., in many virtual machines).
+    """
+    if cpus is None:
+        cpus = available_cpus() or []
+    governors = set()
+    for cpu in cpus:
+        try:
+            with open(f"/sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_governor") as governor_file:
+                governors.add(governor_file.read().strip())
+        except OSError:
+            pass
+    return governors
+
+
+def on_battery():
+    """Checks whether the machine has a mains power supply that is offline."""
+    for supply in Path("/sys/class/power_supply").glob("*"):
+        try:
+            if (supply / "type").read_text().strip() == "Mains" and (supply / "online").read_text().strip() == "0":
+                return True
+        except OSError:
+            pass
+    return False
+
+
+def warn_once(message):
+    """Log a warning, unless the same warning has already been logged by this process."""
+    if message not in environment_warnings:
+        environment_warnings.add(message)
+        logging.warning(message)
+
+
+def init_worker(worker_ids, cpus):
+    """Initialize a worker process of the pool used by --jobs.
+
+    Each worker is pinned to its own core (if the platform supports it), so that the timings of iterations running
+    concurrently stay comparable. The processes started by the worker (i.e., Silicon's JVM and Z3) inherit the pinning.
+    """
+    global worker_id, worker_cpu
+    worker_id = worker_ids.get()
+    if cpus is None:
+        logging.warning("Pinning workers to cores is not supported on this platform.")
+        return
+
+    worker_cpu = cpus[worker_id]
+    os.sched_setaffinity(0, {worker_cpu})
+    logging.debug(f"Worker {worker_id} pinned to core {worker_cpu}.")
+
+
+def available_cpus():
+    """Returns the sorted list of cores this process may run on, or None if the platform does not support pinning."""
+    if not hasattr(os, "sched_setaffinity"):
+        return None
+    return sorted(os.sched_getaffinity(0))
+
+
+def process_output(lines, timeline=None, watchdog=None):
     """Process the data from Silicon's output.
 
     When we profile Silicon, based on the granularity, a quantifier instantiation may trigger the printing of how often
     that quantifier has been instantiated up until now. This function processes that output and returns a dictionary
-    which maps quantifier names to the latest number of instantiations.
-    """
-    # Drop Silicon's preamble and epilogue.
-    output = output.splitlines()
-    output = output[1:-1]
+    which maps quantifier names to the latest number of instantiations. If timeline is not None, every report is
+    additionally added to it, so that the growth of the number of instantiations is kept. If watchdog is not None,
+    every report is checked by it and processing stops as soon as the watchdog aborted the run.
 
+    lines can be any iterable of lines, in particular the stdout pipe of a running Silicon process. The lines are
+    processed one at a time, so the memory used does not depend on the size of the output.
+    """
     # Keeps track of current number of quantifier instantiations.
     result = {}
 
-    # Process the output.
+    # Process the output. Lines that do not report quantifier instantiations (e.g., Silicon's preamble and epilogue)
+    # are skipped.
     # Example of rows we are processing:
     # [quantifier_instances] $Multiset[Int]_prog.card_non_negative :   2500 :  10 : 11
-    for line in output:
+    for line in lines:
+        if not line.startswith("[quantifier_instances]"):
+            continue
+
         columns = [column.strip() for column in line.split(":")]
 
         # We don't want to include "[quantifier_instances] " in the name.
@@ -103,10 +730,351 @@ def process_output(output):
         # We prefix the name with "qi-" to indicate that it is a quantifier instantiation to avoid potential name
         # clashes with execution_time.
         result[f"qi-{name}"] = instantiations
+        if timeline is not None:
+            timeline.add(f"qi-{name}", instantiations)
+        if watchdog is not None and watchdog.check(f"qi-{name}", instantiations):
+            break
 
     return result
 
 
+class Watchdog:
+    """Aborts a run that exceeds a wall-clock budget or in which a single quantifier is instantiated too quickly.
+
+    The latter usually indicates a matching loop. The instantiation rate of every quantifier is measured over
+    consecutive windows of window seconds. When a run is aborted, reason is set to "timeout" or "qi_rate" and culprit
+    to the quantifier that exceeded the rate or, for timeouts, the one with the highest rate so far.
+    """
+
+    def __init__(self, timeout=None, max_qi_rate=None, window=1.0):
+        self.timeout = timeout
+        self.max_qi_rate = max_qi_rate
+        self.window = window
+        self.reason = None
+        self.culprit = None
+        self.kill = None
+        self.timer = None
+        self.start_time = None
+        # Maps quantifier names to the start time and number of instantiations of their current window.
+        self.windows = {}
+        # Maps quantifier names to their instantiation rate in their last complete window.
+        self.rates = {}
+        # The timer thread and the thread processing the output both access the state above.
+        self.lock = threading.Lock()
+
+    def start(self, kill):
+        """Start watching a run that is aborted by calling kill."""
+        self.kill = kill
+        self.start_time = time.monotonic()
+        if self.timeout is not None:
+            self.timer = threading.Timer(self.timeout, self.abort, args=("timeout",))
+            self.timer.daemon = True
+            self.timer.start()
+
+    def stop(self):
+        """Stop watching the run."""
+        if self.timer is not None:
+            self.timer.cancel()
+
+    def check(self, name, instantiations):
+        """Check a report of the number of instantiations of a quantifier. Returns whether the run was aborted."""
+        now = time.monotonic()
+        with self.lock:
+            window_start_time, window_start_instantiations = self.windows.get(name, (self.start_time, 0))
+            if now - window_start_time >= self.window:
+                self.rates[name] = (instantiations - window_start_instantiations) / (now - window_start_time)
+                self.windows[name] = (now, instantiations)
+                exceeded = self.max_qi_rate is not None and self.rates[name] > self.max_qi_rate
+            else:
+                exceeded = False
+
+        if exceeded:
+            self.abort("qi_rate", name)
+        return self.reason is not None
+
+    def abort(self, reason, culprit=None):
+        """Abort the run, unless it has already been aborted."""
+        with self.lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            self.culprit = culprit if culprit is not None else max(self.rates, key=self.rates.get, default=None)
+
+        self.kill()
+
+
+class Timeline:
+    """The number of instantiations of every quantifier over the course of one run.
+
+    Every report of the number of instantiations of a quantifier is a point consisting of its sequence number (i.e.,
+    the number of reports of any quantifier before it), the number of instantiations, and the time since the timeline
+    was created in microseconds. To keep timelines of long runs small, every component of a point is stored as the
+    difference to the previous point of the same quantifier in an array of integers.
+    """
+
+    def __init__(self):
+        self.start_time = time.monotonic()
+        self.sequence_number = 0
+        # Maps quantifier names to the arrays of deltas.
+        self.sequence_numbers = {}
+        self.instantiations = {}
+        self.times = {}
+        # Maps quantifier names to their last point, from which the next delta is computed.
+        self.last = {}
+
+    def add(self, name, instantiations):
+        """Add a report of the number of instantiations of a quantifier."""
+        now = int((time.monotonic() - self.start_time) * 1_000_000)
+        if name not in self.last:
+            self.sequence_numbers[name] = array.array("q")
+            self.instantiations[name] = array.array("q")
+            self.times[name] = array.array("q")
+            self.last[name] = (0, 0, 0)
+
+        last_sequence_number, last_instantiations, last_time = self.last[name]
+        self.sequence_numbers[name].append(self.sequence_number - last_sequence_number)
+        self.instantiations[name].append(instantiations - last_instantiations)
+        self.times[name].append(now - last_time)
+        self.last[name] = (self.sequence_number, instantiations, now)
+        self.sequence_number += 1
+
+    def to_records(self, iteration):
+        """Returns one JSON-serializable record per quantifier."""
+        return [{"iteration": iteration, "quantifier": name,
+                 "sequence_number": self.sequence_numbers[name].tolist(),
+                 "instantiations": self.instantiations[name].tolist(),
+                 "time_us": self.times[name].tolist()} for name in self.last]
+
+
+class ResourceMonitor:
+    """Measures the wall time, CPU time and peak memory of a process and all processes it starts.
+
+    The CPU time and memory of Silicon's JVM (and, e.g., the silicon.sh script starting it) and of Z3 are measured
+    separately by sampling /proc every interval seconds. The wall time is measured with a monotonic clock. When the
+    rusage of the process is passed to stop (see os.wait4), user_time and system_time are the exact totals of all
+    processes of the tree that were waited for; otherwise, they are sums of samples, too.
+
+    Samples only see processes that are alive, so the CPU time a process spends after its last sample is missed, i.e.,
+    jvm_cpu_time and z3_cpu_time may be up to one interval too low per process. The peak memory of a group is the
+    highest sum of the resident set sizes of its processes in any sample, or the peak resident set size of a single
+    process started while being monitored if that is higher. Sampling adds load to the machine, so it is disabled if
+    interval is 0; then, as on platforms without /proc, only the wall time and, if rusage is passed to stop, the user
+    and system time are measured.
+    """
+
+    GROUPS = ("jvm", "z3")
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.root = None
+        self.start_time = None
+        self.wall_time = None
+        self.rusage = None
+        # Maps (pid, start time) of every process seen to its group, the CPU times (user, system) in clock ticks when
+        # it was first seen (zero for processes started while being monitored), and its CPU times in the last sample.
+        self.processes = {}
+        self.known = set()
+        self.peak_rss = dict.fromkeys(self.GROUPS, 0)
+        self.supported = os.path.isdir("/proc/self")
+        self.sampling = interval > 0 and self.supported
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self, pid):
+        """Start monitoring the process with the given pid and all processes it starts."""
+        self.root = pid
+        self.start_time = time.monotonic()
+        if not self.sampling:
+            if self.interval > 0:
+                logging.warning("Measuring the CPU time and memory of processes is not supported on this platform.")
+            return
+
+        # Processes that already exist (e.g., a long-lived ViperServer) only count from now on.
+        self.sample(initial=True)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Sample the process tree until the monitor is stopped."""
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self, rusage=None):
+        """Stop monitoring. rusage is the resource usage of the root process once it has been waited for, if known."""
+        if self.wall_time is not None:
+            return
+
+        self.wall_time = time.monotonic() - self.start_time
+        self.rusage = rusage
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            # Take a last sample of the processes that are still alive (e.g., a long-lived ViperServer).
+            self.sample()
+
+    def sample(self, initial=False):
+        """Sample the CPU times and memory of the process tree. The initial sample records the existing processes."""
+        tree = process_tree(self.root)
+        if initial:
+            self.known = set(tree)
+        rss = dict.fromkeys(self.GROUPS, 0)
+        for key, (name, user, system) in tree.items():
+            group = "z3" if name.startswith("z3") else "jvm"
+            if key not in self.processes:
+                baseline = (user, system) if initial else (0, 0)
+                self.processes[key] = [group, baseline, None]
+            self.processes[key][2] = (user, system)
+
+            current, peak = process_memory(key[0])
+            rss[group] += current
+            if key not in self.known:
+                # The peak of a process that existed before monitoring started may lie before that.
+                self.peak_rss[group] = max(self.peak_rss[group], peak)
+        for group in self.GROUPS:
+            self.peak_rss[group] = max(self.peak_rss[group], rss[group])
+
+    def to_columns(self):
+        """Returns the measurements as columns of a data point; times are in seconds and memory is in MiB."""
+        columns = {"wall_time": self.wall_time}
+        if self.rusage is not None:
+            columns["user_time"] = self.rusage.ru_utime
+            columns["system_time"] = self.rusage.ru_stime
+        if not self.sampling:
+            return columns
+
+        ticks = os.sysconf("SC_CLK_TCK")
+        cpu_times = {group: [0, 0] for group in self.GROUPS}
+        for group, (baseline_user, baseline_system), (user, system) in self.processes.values():
+            cpu_times[group][0] += user - baseline_user
+            cpu_times[group][1] += system - baseline_system
+
+        if self.rusage is None:
+            columns["user_time"] = sum(user for user, _ in cpu_times.values()) / ticks
+            columns["system_time"] = sum(system for _, system in cpu_times.values()) / ticks
+        for group in self.GROUPS:
+            columns[f"{group}_cpu_time"] = sum(cpu_times[group]) / ticks
+            columns[f"{group}_peak_rss"] = self.peak_rss[group] / 1024
+        return columns
+
+
+def process_tree(root):
+    """Returns a dictionary that maps the (pid, start time) of the process root and all its descendants to their
+    names and their user and system CPU times in clock ticks, as read from /proc.
+
+    Only the processes of the tree are read, following the children that every thread of a process has started (see
+    /proc/<pid>/task/<tid>/children in proc(5)).
+    """
+    tree = {}
+    pending = [root]
+    while pending:
+        pid = pending.pop()
+        try:
+            with open(f"/proc/{pid}/stat") as stat_file:
+                stat = stat_file.read()
+            threads = os.listdir(f"/proc/{pid}/task")
+        except OSError:
+            # The process has exited in the meantime.
+            continue
+        # The name is in parentheses and may contain spaces and parentheses itself, see proc(5).
+        name = stat[stat.index("(") + 1:stat.rindex(")")]
+        fields = stat[stat.rindex(")") + 2:].split()
+        tree[pid, int(fields[19])] = (name, int(fields[11]), int(fields[12]))
+        for thread in threads:
+            try:
+                with open(f"/proc/{pid}/task/{thread}/children") as children_file:
+                    pending.extend(int(child) for child in children_file.read().split())
+            except OSError:
+                # The thread has exited in the meantime.
+                continue
+    return tree
+
+
+def process_memory(pid):
+    """Returns the current and the peak resident set size of a process in KiB (0 if it has exited)."""
+    memory = {"VmRSS": 0, "VmHWM": 0}
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                key, _, value = line.partition(":")
+                if key in memory:
+                    memory[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return memory["VmRSS"], memory["VmHWM"]
+
+
+def time_checked_stream(command, process, watchdog=None, merge_stderr=False, resources=None):
+    """Runs a command, processes its output while it is running, and returns the result and its runtime.
+
+    In contrast to time_checked_command, stdout is not captured as a whole: process is called with an iterator over the
+    lines of stdout and its return value is returned. stderr is written to a temporary file and, like the last lines
+    of stdout, only printed if the command fails. In this case, RuntimeError is raised.
+
+    The command runs in its own process group, so that it can be killed together with all processes it started
+    (e.g., Silicon's JVM and Z3). If watchdog is not None, it may do so while the command is running; a command killed
+    by the watchdog does not count as failed. If merge_stderr is set, stderr is processed together with stdout (e.g.,
+    for Z3, which prints its profiling output to stderr). If resources is not None, it is a ResourceMonitor that
+    measures the command and all processes it starts.
+    """
+    logging.debug(f"Running {command}")
+    # The last lines of stdout, which are printed if the command fails.
+    tail = collections.deque(maxlen=20)
+
+    def remember(lines):
+        for line in lines:
+            tail.append(line)
+            yield line
+
+    with tempfile.TemporaryFile(mode="w+") as stderr:
+        start_time = time.time()
+        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT if merge_stderr else stderr,
+                              text=True, start_new_session=True) as process_handle:
+            kill = functools.partial(kill_process_group, process_handle)
+            if watchdog is not None:
+                watchdog.start(kill)
+            if resources is not None:
+                resources.start(process_handle.pid)
+            try:
+                result = process(remember(process_handle.stdout))
+                # Drain the rest of stdout in case process did not consume all of it.
+                tail.extend(process_handle.stdout)
+            except BaseException:
+                kill()
+                if resources is not None:
+                    resources.stop()
+                raise
+            finally:
+                if watchdog is not None:
+                    watchdog.stop()
+            if resources is not None:
+                # Unlike Popen.wait, wait4 also returns the CPU times of the command and the processes it waited for.
+                _, status, rusage = os.wait4(process_handle.pid, 0)
+                process_handle.returncode = os.waitstatus_to_exitcode(status)
+                resources.stop(rusage)
+            returncode = process_handle.wait()
+        end_time = time.time()
+        execution_time = end_time - start_time
+
+        if returncode != 0 and (watchdog is None or watchdog.reason is None):
+            stderr.seek(0)
+            logging.error(f"Command {command} failed with return code {returncode}.")
+            logging.error(f"stdout (last lines): {''.join(tail)}")
+            logging.error(f"stderr: {stderr.read()}")
+            raise RuntimeError(f"Command {command} failed with return code {returncode}.")
+
+    logging.debug(f"Command finished in {execution_time} seconds.")
+    return result, execution_time
+
+
+def kill_process_group(process_handle):
+    """Kill the process group of a process started with start_new_session=True."""
+    try:
+        os.killpg(process_handle.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        # All processes of the group have already exited.
+        pass
+
+
 def time_checked_command(command, shell=False):
     """Runs a command and returns its runtime and its results.
 
@@ -128,77 +1096,163 @@ def time_checked_command(command, shell=False):
         raise RuntimeError(f"Command {e.cmd} failed with return code {e.returncode}.")
 
 
-def parse_args():
-    """Parse command line arguments."""
+def parse_args(argv=None):
+    """Parse command line arguments (argv, or sys.argv if argv is None)."""
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("program_path", type=program_path,
-                        help="Gobra or Viper program to be profiled")
+                        help="Gobra or Viper program, or directory of a Gobra package, to be profiled")
     parser.add_argument("--silicon_path", type=file_path, required=True,
                         help="path to silicon.sh")
     parser.add_argument("--z3_path", type=file_path, required=True,
                         help="path to Z3 binary")
     parser.add_argument("--gobra_path", type=file_path, required=False,
                         help="path to Gobra jar")
+    parser.add_argument("--include_path", type=directory_path, required=False,
+                        help=("directory in which Gobra looks up the packages imported by a Gobra package (defaults "
+                              "to the parent directory of the package)"))
+    parser.add_argument("--output_dir", type=Path, required=False,
+                        help="directory of the CSV file (defaults to the directory of the program)")
+    parser.add_argument("--viperserver_path", type=file_path, required=False,
+                        help=("path to ViperServer jar. If set, all iterations are verified by a single long-lived "
+                              "ViperServer process instead of starting Silicon for every iteration; the time "
+                              "reported by Silicon is recorded as backend_time."))
     parser.add_argument("--iterations", type=positive, required=False, default=1,
                         help="number of times profiling is repeated")
+    parser.add_argument("--target_precision", type=positive_float, required=False,
+                        help=("instead of a fixed number of iterations, run iterations until the width of the 95%% "
+                              "confidence interval of the median execution time is at most this fraction of the "
+                              "median (e.g., 0.05). --iterations is ignored in this case."))
+    parser.add_argument("--precision_qi", action="store_true", required=False,
+                        help=("with --target_precision, also require the median number of instantiations of every "
+                              "quantifier to be precise enough."))
+    parser.add_argument("--min_iterations", type=positive, required=False, default=10,
+                        help="minimum number of iterations with --target_precision")
+    parser.add_argument("--max_iterations", type=positive, required=False, default=100,
+                        help="maximum number of iterations with --target_precision")
+    parser.add_argument("--jobs", type=positive, required=False, default=1,
+                        help=("number of iterations run in parallel. Each worker is pinned to its own core; the "
+                              "worker and core are recorded for every iteration."))
+    parser.add_argument("--parallel_verifiers", type=positive, required=False, default=1,
+                        help="number of verifiers Silicon runs in parallel (--numberOfParallelVerifiers)")
+    parser.add_argument("--parallelize_branches", action="store_true", required=False,
+                        help="let Silicon verify the branches of a method in parallel (--parallelizeBranches).")
+    parser.add_argument("--warmup", type=non_negative, required=False, default=0,
+                        help="number of iterations run and discarded before the measured ones")
+    parser.add_argument("--check_environment", action="store_true", required=False,
+                        help=("before every iteration, warn if the frequency governor is not performance or the "
+                              "machine runs on battery, and wait until the CPU is idle (see --max_load). The measured "
+                              "load is recorded for every iteration."))
+    parser.add_argument("--max_load", type=positive_float, required=False, default=0.2,
+                        help=("with --check_environment, the fraction of time the core of an iteration (or, if it is "
+                              "not pinned, the whole machine) may be busy before the iteration is started"))
+    parser.add_argument("--load_timeout", type=positive_float, required=False, default=30,
+                        help=("with --check_environment, the maximum number of seconds to wait for the CPU to become "
+                              "idle before running an iteration anyway"))
     parser.add_argument("--granularity", type=positive, required=False, default=1,
                         help="granularity of quantifier reporting")
+    parser.add_argument("--timeline", action="store_true", required=False,
+                        help=("keep every report of the number of instantiations instead of only the last one and "
+                              "write them to a .timeline.jsonl.gz file next to the CSV file."))
+    parser.add_argument("--members", action="store_true", required=False,
+                        help=("record the verification time and the instantiations of every member (method, function, "
+                              "predicate) and write them to a .members.csv file next to the CSV file. Requires "
+                              "--viperserver_path, as only ViperServer reports the results of members, --granularity "
+                              "1, and a single verifier without branch parallelization."))
+    parser.add_argument("--timeout", type=positive_float, required=False,
+                        help=("wall-clock budget of an iteration in seconds. Iterations that exceed it are killed and "
+                              "recorded as censored rows."))
+    parser.add_argument("--max_qi_rate", type=positive_float, required=False,
+                        help=("maximum number of instantiations per second of a single quantifier. Iterations that "
+                              "exceed it (e.g., due to a matching loop) are killed and recorded as censored rows."))
+    parser.add_argument("--resource_interval", type=non_negative_float, required=False, default=0.1,
+                        help=("interval in seconds at which the CPU times and memory of Silicon's JVM and Z3 are "
+                              "sampled. 0 disables sampling, which adds load to the machine."))
+    parser.add_argument("--cache_dir", type=Path, required=False,
+                        help=("directory of a cache for tool versions, Gobra to Viper translations and completed "
+                              "iterations. Iterations that have already been run with the same program, tools and "
+                              "settings are not run again."))
+    parser.add_argument("--cache_max_size", type=positive, required=False, default=1024,
+                        help="maximum size of the cache in MiB. The least recently used entries are evicted first.")
+    parser.add_argument("--store", type=Path, required=False,
+                        help=("directory of a columnar store (see store.py) to which the results are appended in "
+                              "addition to the CSV file. Requires pyarrow."))
     parser.add_argument("--z3RandomizeSeeds", action="store_true", required=False,
                         help=("set various Z3 random seeds to random values. Note that "
                               "profiling may be non-deterministic even if this setting "
                               "is set to False."))
     parser.add_argument("--disableSetAxiomatization", action="store_true", required=False,
                         help="disable the axiomatization of set operations.")
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.target_precision is not None:
+        if args.min_iterations > args.max_iterations:
+            parser.error("--min_iterations must not be larger than --max_iterations")
+        # Used as the upper bound when logging iterations.
+        args.iterations = args.max_iterations
+    if args.members and args.viperserver_path is None:
+        parser.error("--members requires --viperserver_path")
+    if args.members and args.granularity != 1:
+        parser.error("--members attributes every instantiation to a member, so it requires --granularity 1")
+    if args.members and (args.parallel_verifiers > 1 or args.parallelize_branches):
+        parser.error("--members attributes the time to one member verified at a time, so it cannot be combined with "
+                     "--parallel_verifiers or --parallelize_branches")
+    if args.viperserver_path is not None and args.jobs > 1:
+        parser.error("--viperserver_path cannot be combined with --jobs")
+    if args.jobs > 1 and (args.parallel_verifiers > 1 or args.parallelize_branches):
+        parser.error("--jobs pins every iteration to a single core, so it cannot be combined with "
+                     "--parallel_verifiers or --parallelize_branches")
+    if args.viperserver_path is not None and (args.timeout or args.max_qi_rate):
+        parser.error("--viperserver_path cannot be combined with --timeout or --max_qi_rate")
+    return args
+
 
+def generate_metadata(args, cache=None):
+    """Generate metadata for the CSV file.
 
-def generate_metadata(args):
-    """Generate metadata for the CSV file."""
+    If cache is not None, the versions of Z3 and Gobra are only probed if the tools have changed since the last probe.
+    """
     logging.info("Generating metadata.")
     metadata = {"program_path": args.program_path}
     logging.info(f"Program path: {metadata['program_path']}")
 
     logging.info("Getting version of Silicon.")
-    command = [args.silicon_path]
-    logging.debug(f"Running {command}")
-    # This shouldn't be checked, as Silicon will return a non-zero exit code (no option for version).
-    command_stdout = subprocess.run(command, capture_output=True, text=True).stdout
-    # Convert
-    # Silicon 1.1-SNAPSHOT (7fea2aa7+)
-    #   Command-line interface: Required option 'file' not found.
-    # Run with just --help for usage and options
-    # to
-    # 7fea2aa7
-    metadata["silicon_version"] = command_stdout.splitlines()[0].split()[-1][1:-2]
+    # silicon.sh stays the same when the Silicon jar is rebuilt, so its version is probed every time.
+    metadata["silicon_version"] = silicon_version(args.silicon_path)
     logging.info(f"Silicon version: {metadata['silicon_version']}")
 
     logging.info("Getting version of Z3.")
-    command = [args.z3_path, "-version"]
-    command, _ = time_checked_command(command)
-    # Convert "Z3 version 4.8.7 - 64 bit" to "4_8_7".
-    metadata["z3_version"] = command.stdout.split()[2].replace('.', '_')
+    metadata["z3_version"] = cached_version(cache, args.z3_path, z3_version)
     logging.info(f"Z3 version: {metadata['z3_version']}")
 
     # Get version of Gobra if applicable.
     if args.gobra_path is not None:
         logging.info("Getting version of Gobra.")
-        # TODO Refactor this so we can pass it using shell=False
-        command = f"java -jar {args.gobra_path} --version"
-        command, _ = time_checked_command(command, shell=True)
-        # Convert
-        #
-        #  Gobra (c) Copyright ETH Zurich 2012 - 2022
-        #    version 1.1-SNAPSHOT (529d2a49@(detached))
-        #
-        # to
-        # 529d2a49
-        metadata["gobra_version"] = command.stdout.splitlines()[2].split()[-1].partition("@")[0][1:]
+        metadata["gobra_version"] = cached_version(cache, args.gobra_path, gobra_version)
         logging.info(f"Gobra version: {metadata['gobra_version']}")
     else:
         logging.info("Getting Gobra version not required. Continuing.")
 
+    # With --target_precision, the number of iterations and the reason for stopping are only known after profiling.
     metadata["iterations"] = args.iterations
-    logging.info(f"Iterations: {metadata['iterations']}")
+    metadata["target_precision"] = args.target_precision
+    if args.target_precision is None:
+        logging.info(f"Iterations: {metadata['iterations']}")
+    else:
+        logging.info(f"Target precision: {metadata['target_precision']} "
+                     f"({args.min_iterations} to {args.max_iterations} iterations)")
+
+    metadata["viperserver"] = args.viperserver_path is not None
+    logging.info(f"ViperServer: {metadata['viperserver']}")
+
+    metadata["jobs"] = args.jobs
+    logging.info(f"Jobs: {metadata['jobs']}")
+    # Iterations are pinned to a core with --jobs, and so are all iterations in a pinned worker of batch.py.
+    metadata["pinned"] = args.jobs > 1 or worker_cpu is not None
+    logging.info(f"Pinned: {metadata['pinned']}")
+
+    metadata["parallel_verifiers"] = args.parallel_verifiers
+    logging.info(f"Parallel verifiers: {metadata['parallel_verifiers']}")
+    metadata["parallelize_branches"] = args.parallelize_branches
+    logging.info(f"Parallelize branches: {metadata['parallelize_branches']}")
 
     metadata["granularity"] = args.granularity
     logging.info(f"Granularity: {metadata['granularity']}")
@@ -211,6 +1265,57 @@ def generate_metadata(args):
     return metadata
 
 
+def cached_version(cache, path, probe):
+    """Returns the version of the tool at path as determined by probe, reusing an earlier result if possible."""
+    if cache is None:
+        return probe(path)
+
+    key = ["version", probe.__name__, file_identity(path)]
+    version = cache.get(key)
+    if version is None:
+        version = probe(path)
+        cache.put(key, version)
+    return version
+
+
+def silicon_version(silicon_path):
+    """Returns the version of Silicon."""
+    command = [silicon_path]
+    logging.debug(f"Running {command}")
+    # This shouldn't be checked, as Silicon will return a non-zero exit code (no option for version).
+    command_stdout = subprocess.run(command, capture_output=True, text=True).stdout
+    # Convert
+    # Silicon 1.1-SNAPSHOT (7fea2aa7+)
+    #   Command-line interface: Required option 'file' not found.
+    # Run with just --help for usage and options
+    # to
+    # 7fea2aa7
+    return command_stdout.splitlines()[0].split()[-1][1:-2]
+
+
+def z3_version(z3_path):
+    """Returns the version of Z3."""
+    command = [z3_path, "-version"]
+    command, _ = time_checked_command(command)
+    # Convert "Z3 version 4.8.7 - 64 bit" to "4_8_7".
+    return command.stdout.split()[2].replace('.', '_')
+
+
+def gobra_version(gobra_path):
+    """Returns the version of Gobra."""
+    # TODO Refactor this so we can pass it using shell=False
+    command = f"java -jar {gobra_path} --version"
+    command, _ = time_checked_command(command, shell=True)
+    # Convert
+    #
+    #  Gobra (c) Copyright ETH Zurich 2012 - 2022
+    #    version 1.1-SNAPSHOT (529d2a49@(detached))
+    #
+    # to
+    # 529d2a49
+    return command.stdout.splitlines()[2].split()[-1].partition("@")[0][1:]
+
+
 def format_metadata(metadata):
     """Format the metadata into a single string.
 
@@ -221,8 +1326,21 @@ def format_metadata(metadata):
         result += "-rand"
     if metadata["disableSetAxiomatization"]:
         result += "-no_set_axiom"
+    if metadata["viperserver"]:
+        result += "-server"
     result += f'-iter_{metadata["iterations"]}'
+    if metadata.get("stopping_reason") is not None:
+        result += f'_{metadata["stopping_reason"]}'
     result += f'-gran_{metadata["granularity"]}'
+    # Only mark parallel runs, so that the names of serial runs stay unchanged.
+    if metadata["jobs"] > 1:
+        result += f'-jobs_{metadata["jobs"]}'
+    elif metadata.get("pinned"):
+        result += "-pinned"
+    if metadata["parallel_verifiers"] > 1:
+        result += f'-par_{metadata["parallel_verifiers"]}'
+    if metadata["parallelize_branches"]:
+        result += "-branches"
     result += f'-sil_ver_{metadata["silicon_version"]}'
     result += f'-z3_ver_{metadata["z3_version"]}'
     if "gobra_version" in metadata:
@@ -231,21 +1349,211 @@ def format_metadata(metadata):
     return result
 
 
+def parse_metadata(csv_path):
+    """Returns the metadata encoded in the name of a CSV file by format_metadata, or None if it is not such a name."""
+    match = CSV_NAME.match(csv_path.stem)
+    if match is None:
+        return None
+
+    metadata = {"program_path": csv_path.with_name(match["program"]),
+                "silicon_version": match["silicon_version"],
+                "z3_version": match["z3_version"],
+                "iterations": int(match["iterations"]),
+                "stopping_reason": match["stopping_reason"],
+                "viperserver": match["viperserver"] is not None,
+                "jobs": int(match["jobs"] or 1),
+                "pinned": match["jobs"] is not None or match["pinned"] is not None,
+                "parallel_verifiers": int(match["parallel_verifiers"] or 1),
+                "parallelize_branches": match["parallelize_branches"] is not None,
+                "granularity": int(match["granularity"]),
+                "z3RandomizeSeeds": match["z3RandomizeSeeds"] is not None,
+                "disableSetAxiomatization": match["disableSetAxiomatization"] is not None}
+    if match["gobra_version"] is not None:
+        metadata["gobra_version"] = match["gobra_version"]
+    return metadata
+
+
+def environment_fingerprint(args, metadata, cache=None):
+    """Returns a description of the machine and its environment, so that results measured on different machines or
+    under different conditions can be told apart. Values that cannot be determined on this platform are None."""
+    fingerprint = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                   "hostname": platform.node(),
+                   "platform": platform.platform(),
+                   "python_version": platform.python_version(),
+                   "cpu_model": None,
+                   "cpu_count": os.cpu_count(),
+                   "available_cpus": available_cpus(),
+                   "governors": sorted(cpu_governors()),
+                   "boost": None,
+                   "memory_total_mib": None,
+                   "on_battery": on_battery(),
+                   "load_average": list(os.getloadavg()) if hasattr(os, "getloadavg") else None}
+    try:
+        with open("/proc/cpuinfo") as cpuinfo_file:
+            for line in cpuinfo_file:
+                key, _, value = line.partition(":")
+                if key.strip() == "model name":
+                    fingerprint["cpu_model"] = value.strip()
+                    break
+        with open("/proc/meminfo") as meminfo_file:
+            for line in meminfo_file:
+                key, _, value = line.partition(":")
+                if key == "MemTotal":
+                    fingerprint["memory_total_mib"] = int(value.split()[0]) // 1024
+    except OSError:
+        pass
+    # Turbo boost makes the speed of a core depend on the load of the others.
+    for boost_path, enabled in (("/sys/devices/system/cpu/cpufreq/boost", "1"),
+                                ("/sys/devices/system/cpu/intel_pstate/no_turbo", "0")):
+        try:
+            with open(boost_path) as boost_file:
+                fingerprint["boost"] = boost_file.read().strip() == enabled
+        except OSError:
+            pass
+
+    java_path = shutil.which("java")
+    fingerprint["java_version"] = None if java_path is None else cached_version(cache, java_path, java_version)
+    fingerprint.update((key, value) for key, value in metadata.items() if key.endswith("_version"))
+    fingerprint["arguments"] = {key: str(value) if isinstance(value, Path) else value
+                                for key, value in vars(args).items()}
+    return fingerprint
+
+
+def java_version(java_path):
+    """Returns the first line of the version of Java, e.g., 'openjdk version "17.0.9" 2023-10-17'."""
+    command, _ = time_checked_command([java_path, "-version"])
+    # Java prints its version to stderr.
+    return (command.stderr or command.stdout).strip().splitlines()[0]
+
+
+def write_fingerprint(fingerprint, fingerprint_path):
+    """Write the fingerprint of the environment to a JSON file."""
+    logging.info(f"Writing {fingerprint_path}.")
+    with open(fingerprint_path, "w") as fingerprint_file:
+        json.dump(fingerprint, fingerprint_file, indent=2)
+
+
 def write_to_csv(data, csv_path):
-    """Write the data to a CSV file."""
+    """Write the data to a CSV file.
+
+    The columns are the union of the keys of all data points, as, e.g., a censored iteration may not have reached every
+    quantifier. Quantifiers missing from a data point have not been instantiated in that iteration. Returns whether the
+    file was written, i.e., whether it did not already exist with the same contents.
+    """
     logging.info(f"Writing {csv_path}.")
-    with open(csv_path, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=data[0].keys())
-        writer.writeheader()
+    fieldnames = list(dict.fromkeys(key for data_point in data for key in data_point))
+    csvfile = io.StringIO(newline='')
+    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    writer.writeheader()
+
+    for data_point in data:
+        writer.writerow({key: data_point.get(key, 0 if key.startswith("qi-") else "") for key in fieldnames})
 
-        for data_point in data:
-            writer.writerow(data_point)
+    # Leave an identical file untouched (e.g., if all iterations were taken from the cache), so that its modification
+    # time can be used to decide whether it needs to be plotted again.
+    if csv_path.is_file():
+        with open(csv_path, newline='') as existing:
+            if existing.read() == csvfile.getvalue():
+                logging.info(f"{csv_path} is unchanged.")
+                return False
+
+    with open(csv_path, 'w', newline='') as existing:
+        existing.write(csvfile.getvalue())
 
     logging.info(f"Data written to {csv_path}.")
+    return True
+
+
+def write_timelines(timelines, timeline_path):
+    """Write the timelines of all iterations to a gzipped JSON Lines file with one record per iteration and quantifier.
+
+    Every record contains the arrays of deltas of one quantifier (see Timeline); the cumulative sums of the arrays are
+    the sequence numbers, the numbers of instantiations and the times of the reports.
+    """
+    logging.info(f"Writing {timeline_path}.")
+    with gzip.open(timeline_path, "wt") as timeline_file:
+        for iteration, timeline in enumerate(timelines):
+            for record in timeline.to_records(iteration):
+                timeline_file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    logging.info(f"Timelines written to {timeline_path}.")
+
+
+def write_members(members, locations, members_path):
+    """Write the results of the members of all iterations to a CSV file with one row per iteration and member.
+
+    Besides the Viper name of a member, every row contains the name and source location of the Gobra member it most
+    likely stems from (see gobra_member), its verification time, its total number of instantiations, and the quantifier
+    instantiated most often while verifying it.
+    """
+    rows = []
+    for iteration, iteration_members in enumerate(members):
+        for member in iteration_members:
+            name, location = gobra_member(member["member"], locations)
+            instantiations = member["instantiations"]
+            top_quantifier = max(instantiations, key=instantiations.get, default=None)
+            rows.append({"iteration": iteration,
+                         "member": name,
+                         "location": location,
+                         "viper_member": member["member"],
+                         "type": member["type"],
+                         "time": member["time"],
+                         "instantiations": sum(instantiations.values()),
+                         "top_quantifier": "" if top_quantifier is None else top_quantifier.removeprefix("qi-"),
+                         "top_quantifier_instantiations": instantiations.get(top_quantifier, "")})
+    write_to_csv(rows, members_path)
+
+
+# Declarations of functions, methods and predicates in Gobra files, e.g., "pure func (s Set) Contains(e int) bool".
+GOBRA_MEMBER = re.compile(r"\b(?:func|pred)\s+(?:\([^)]*\)\s*)?(\w+)\s*[\[(]")
+
+
+def member_locations(args):
+    """Returns a dictionary that maps the names of the members declared in the profiled Gobra program or package to
+    their locations (file:line). Returns an empty dictionary for Viper programs.
+    """
+    if not is_gobra(args.program_path):
+        return {}
+
+    files = sorted(args.program_path.glob("*.gobra")) if args.program_path.is_dir() else [args.program_path]
+    locations = {}
+    for file in files:
+        with open(file) as gobra_file:
+            for line_number, line in enumerate(gobra_file, start=1):
+                for match in GOBRA_MEMBER.finditer(line):
+                    locations.setdefault(match[1], f"{file.name}:{line_number}")
+    return locations
+
+
+def gobra_member(viper_name, locations):
+    """Returns the name and location of the Gobra member the Viper member most likely stems from.
+
+    Gobra mangles names, e.g., by appending a hash and the kind of the member ("Contains_a1b2c3d_PF") or by prefixing
+    the receiver type. The longest suffix (split at underscores) of the name without the hash that is declared in the
+    program is taken; if there is none, the Viper name is returned with an empty location.
+    """
+    name = re.sub(r"_[0-9a-f]{6,}_[A-Za-z]+$", "", viper_name)
+    parts = name.split("_")
+    for i in range(len(parts)):
+        candidate = "_".join(parts[i:])
+        if candidate in locations:
+            return candidate, locations[candidate]
+    return viper_name, ""
+
+
+def is_gobra(path):
+    """Checks whether the program at path (see program_path) is a Gobra program or package."""
+    return path.is_dir() or path.suffix == ".gobra"
 
 
 def program_path(string):
-    """Checks that the string is a valid path to either a Viper or Gobra program."""
+    """Checks that the string is a valid path to either a Viper or Gobra program, or to a Gobra package."""
+    if os.path.isdir(string):
+        path = directory_path(string)
+        if not any(path.glob("*.gobra")):
+            raise argparse.ArgumentTypeError(f"{path} is not a valid path to a Gobra package")
+        return path.resolve()
+
     path = file_path(string)
     if path.suffix not in [".gobra", ".vpr"]:
         raise argparse.ArgumentTypeError(f"Wrong suffix: {path} is not a valid path to a program")
@@ -257,6 +1565,22 @@ def program_path(string):
     return path
 
 
+def positive_float(string):
+    """Checks that the string is a positive number."""
+    value = float(string)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"{value} is not larger than 0")
+    return value
+
+
+def non_negative_float(string):
+    """Checks that the string is a non-negative number."""
+    value = float(string)
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"{value} is smaller than 0")
+    return value
+
+
 def positive(string):
     """Checks that the string is a positive integer."""
     value = int(string)
@@ -265,5 +1589,13 @@ def positive(string):
     return value
 
 
+def non_negative(string):
+    """Checks that the string is a non-negative integer."""
+    value = int(string)
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"{value} is smaller than 0")
+    return value
+
+
 if __name__ == "__main__":
     main()
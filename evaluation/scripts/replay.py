@@ -0,0 +1,204 @@
+"""
+Module for sampling Z3's variance by replaying the SMT-LIB queries of a Viper or Gobra program with many random seeds.
+
+Silicon is run only once to dump its interaction with Z3. Afterward, Z3 is run directly on the dumped queries, which
+avoids paying for the translation from Gobra, the JVM startup, and Silicon's symbolic execution for every sample.
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import hash_file
+from profile import (gobra_version, is_gobra, positive, process_output, program_path, silicon_arguments,
+                     silicon_version, time_checked_stream, translate, write_to_csv, z3_version)
+from util import file_path
+
+# Options with which Silicon fixes Z3's random seeds in its preamble. They are removed from the dumped queries, so
+# that the seeds passed on the command line take effect.
+SEED_OPTION = re.compile(r"^\s*\(set-option\s+:(smt\.random_seed|sat\.random_seed|nlsat\.seed|random_seed)\s+\d+\)\s*$")
+
+# Name of the file in the dump directory that records which Viper file was dumped with which version and arguments of
+# Silicon.
+DUMP_STAMP = "dump.json"
+
+
+def main():
+    """Main function of the replayer."""
+    # Set up logging.
+    logging.basicConfig(level=logging.DEBUG)
+
+    args = parse_args()
+
+    # Set Z3 environment for Gobra and Silicon.
+    os.environ["Z3_EXE"] = str(args.z3_path)
+
+    metadata = {"program_path": args.program_path,
+                "silicon_version": silicon_version(args.silicon_path),
+                "z3_version": z3_version(args.z3_path)}
+    if is_gobra(args.program_path):
+        if args.gobra_path is None:
+            logging.error("Path to Gobra jar is required for Gobra files.")
+            raise ValueError("Path to Gobra jar is required for Gobra files.")
+        metadata["gobra_version"] = gobra_version(args.gobra_path)
+        vpr_file_path = translate(args, metadata)
+    # Due to program_path(), this is a Viper file.
+    else:
+        vpr_file_path = args.program_path
+
+    queries = dump_queries(args, vpr_file_path, metadata)
+    seeds = range(args.first_seed, args.first_seed + args.seeds)
+    data = replay(args, queries, seeds)
+
+    # Write one CSV per query and one with the sums over all queries.
+    for query in queries:
+        write_to_csv(data[query], csv_path(metadata, args, query.stem))
+
+    aggregated = []
+    for i, seed in enumerate(seeds):
+        data_point = {}
+        for query in queries:
+            for key, value in data[query][i].items():
+                if key != "seed":
+                    data_point[key] = data_point.get(key, 0) + value
+        data_point["seed"] = seed
+        aggregated.append(data_point)
+    write_to_csv(aggregated, csv_path(metadata, args))
+
+
+def dump_queries(args, vpr_file_path, metadata):
+    """Run Silicon once to dump its interaction with Z3 and return the paths to the dumped queries.
+
+    Silicon writes one file per prover it uses. The dumps are reused on later runs, unless args.redump is set or the
+    Viper file, the version of Silicon (in metadata) or its arguments have changed since (see DUMP_STAMP).
+    """
+    dump_dir = vpr_file_path.parent / f"{vpr_file_path.stem.replace('.', '_')}-smt2"
+    if args.disableSetAxiomatization:
+        dump_dir = dump_dir.with_name(dump_dir.name + "-no_set_axiom")
+
+    arguments = silicon_arguments(args, vpr_file_path)
+    stamp = {"vpr_hash": hash_file(vpr_file_path), "silicon_version": metadata["silicon_version"],
+             "silicon_arguments": [str(argument) for argument in arguments]}
+    stamp_path = dump_dir / DUMP_STAMP
+    queries = sorted(dump_dir.glob("*.smt2"))
+    if queries and not args.redump:
+        if stamp_path.is_file() and json.loads(stamp_path.read_text()) == stamp:
+            logging.info(f"Using {len(queries)} queries dumped to {dump_dir}.")
+            return queries
+        logging.info(f"The queries dumped to {dump_dir} are outdated.")
+
+    dump_dir.mkdir(exist_ok=True)
+    stamp_path.unlink(missing_ok=True)
+    for query in queries:
+        query.unlink()
+
+    command = [args.silicon_path] + arguments + ["--z3LogFile", dump_dir / "query"]
+    logging.info(f"Dumping the queries of {vpr_file_path} to {dump_dir}.")
+    time_checked_stream(command, process_output)
+
+    queries = sorted(dump_dir.glob("*.smt2"))
+    if not queries:
+        logging.error(f"Silicon did not dump any queries to {dump_dir}.")
+        raise RuntimeError(f"Silicon did not dump any queries to {dump_dir}.")
+
+    for query in queries:
+        remove_seed_options(query)
+    # The stamp is only written once the dump is complete.
+    stamp_path.write_text(json.dumps(stamp))
+    logging.info(f"Dumped {len(queries)} queries.")
+    return queries
+
+
+def remove_seed_options(query):
+    """Remove the options fixing Z3's random seeds from a dumped query, line by line."""
+    with open(query) as original, tempfile.NamedTemporaryFile("w", dir=query.parent, delete=False) as stripped:
+        for line in original:
+            if not SEED_OPTION.match(line):
+                stripped.write(line)
+    os.replace(stripped.name, query)
+
+
+def replay(args, queries, seeds):
+    """Run Z3 on every query with every seed, using args.jobs Z3 processes in parallel.
+
+    Returns a dictionary that maps every query to its list of data points, one per seed, in the format of profile.py.
+    """
+    logging.info(f"Replaying {len(queries)} queries with {len(seeds)} seeds on {args.jobs} workers.")
+    # The work happens in the Z3 processes, so threads are enough to keep args.jobs of them busy.
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {query: [executor.submit(run_z3, args, query, seed) for seed in seeds] for query in queries}
+        return {query: [future.result() for future in query_futures] for query, query_futures in futures.items()}
+
+
+def run_z3(args, query, seed):
+    """Run Z3 with profiling on a query with the given seed and return the resulting data point."""
+    command = [args.z3_path, "-smt2", "smt.qi.profile=true", f"smt.qi.profile_freq={args.granularity}",
+               f"smt.random_seed={seed}", f"sat.random_seed={seed}", f"nlsat.seed={seed}", query]
+
+    logging.info(f"Running Z3 on {query.name} with seed {seed}.")
+    # Z3 prints its profiling output to stderr.
+    data_point, execution_time = time_checked_stream(command, process_output, merge_stderr=True)
+    logging.info(f"Z3 finished in {execution_time} seconds.")
+
+    data_point["execution_time"] = execution_time
+    data_point["seed"] = seed
+    return data_point
+
+
+def csv_path(metadata, args, query=None):
+    """Returns the path of the CSV file for a query or, if query is None, for the sums over all queries."""
+    result = f'{metadata["program_path"].stem.replace(".", "_")}-replay'
+    if query is not None:
+        result += f'-{query}'
+    if args.disableSetAxiomatization:
+        result += "-no_set_axiom"
+    result += f'-seeds_{args.first_seed}_{args.first_seed + args.seeds - 1}'
+    result += f'-gran_{args.granularity}'
+    result += f'-sil_ver_{metadata["silicon_version"]}'
+    result += f'-z3_ver_{metadata["z3_version"]}'
+    if "gobra_version" in metadata:
+        result += f'-gobra_ver_{metadata["gobra_version"]}'
+
+    return (metadata["program_path"].parent / result).with_suffix(".csv")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("program_path", type=program_path,
+                        help="Gobra or Viper program whose queries are replayed")
+    parser.add_argument("--silicon_path", type=file_path, required=True,
+                        help="path to silicon.sh, used once to dump the queries")
+    parser.add_argument("--z3_path", type=file_path, required=os.environ.get("Z3_EXE") is None,
+                        default=os.environ.get("Z3_EXE"),
+                        help="path to Z3 binary (defaults to Z3_EXE)")
+    parser.add_argument("--gobra_path", type=file_path, required=False,
+                        help="path to Gobra jar")
+    parser.add_argument("--seeds", type=positive, required=False, default=30,
+                        help="number of seeds every query is replayed with")
+    parser.add_argument("--first_seed", type=int, required=False, default=0,
+                        help="first seed; the seeds are consecutive")
+    parser.add_argument("--jobs", type=positive, required=False, default=os.cpu_count(),
+                        help="number of Z3 processes run in parallel")
+    parser.add_argument("--granularity", type=positive, required=False, default=1,
+                        help="granularity of quantifier reporting")
+    parser.add_argument("--disableSetAxiomatization", action="store_true", required=False,
+                        help="disable the axiomatization of set operations when dumping the queries.")
+    parser.add_argument("--redump", action="store_true", required=False,
+                        help="dump the queries again even if they have been dumped before.")
+    # The seeds are set by the replay itself; Gobra packages are translated as by profile.py.
+    parser.set_defaults(z3RandomizeSeeds=False, include_path=None, output_dir=None, parallel_verifiers=1,
+                        parallelize_branches=False)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Module for measuring how the verification of a program or package scales with the parallelism of Silicon.
+
+Silicon can verify several members at once (--numberOfParallelVerifiers) and the branches of a method in parallel
+(--parallelizeBranches). profile.py uses a single verifier without branch parallelization by default, and so does the
+CI of the library. This module profiles the program with every configuration of a grid of both settings, one
+configuration after another, so that the configurations do not compete for cores. For every configuration, it records
+the median wall time, the median CPU time of Silicon's JVM and Z3 (see profile.ResourceMonitor), the average number of
+busy cores (CPU time over wall time), and the speedup and efficiency (speedup per verifier) relative to the serial
+baseline, i.e., a single verifier without branch parallelization, which is always part of the grid. The results are
+written to a table and plotted as scaling curves, e.g., to size CI runners and verification servers.
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import argparse
+import csv
+import logging
+import os
+import statistics
+from pathlib import Path
+
+import profile
+
+BRANCH_MODES = {"off": [False], "on": [True], "both": [False, True]}
+
+SUMMARY_COLUMNS = ["parallel_verifiers", "parallelize_branches", "status", "iterations", "censored", "median_wall_time",
+                   "median_cpu_time", "busy_cores", "speedup", "efficiency", "csv"]
+
+
+def main():
+    """Main function of the scaling sweep."""
+    # Set up logging.
+    logging.basicConfig(level=logging.DEBUG)
+
+    args, profile_args = parse_args()
+    cpus = profile.available_cpus()
+    cores = len(cpus) if cpus is not None else os.cpu_count()
+    if max(args.parallel_verifiers) > cores:
+        logging.warning(f"Only {cores} cores are available for up to {max(args.parallel_verifiers)} parallel "
+                        f"verifiers; the speedup of the larger configurations will be limited by the cores.")
+
+    # The serial baseline comes first, so that the sweep fails early if the program does not verify.
+    configurations = [(verifiers, branches) for branches in BRANCH_MODES[args.parallelize_branches]
+                      for verifiers in args.parallel_verifiers]
+    configurations = [(1, False)] + [configuration for configuration in configurations if configuration != (1, False)]
+    jobs = {}
+    for verifiers, branches in configurations:
+        argv = ([str(args.program_path), "--parallel_verifiers", str(verifiers), "--output_dir", str(args.output_dir)]
+                + profile_args)
+        if branches:
+            argv.append("--parallelize_branches")
+        jobs[verifiers, branches] = argv
+        # Check the command line before profiling anything.
+        profile.parse_args(argv)
+
+    rows = []
+    for (verifiers, branches), argv in jobs.items():
+        logging.info(f"Profiling with {verifiers} parallel verifiers, branch parallelization "
+                     f"{'on' if branches else 'off'}.")
+        try:
+            csv_path = profile.profile_program(profile.parse_args(argv))
+        except (RuntimeError, ValueError) as e:
+            if not rows:
+                logging.error(f"The serial baseline does not verify: {e}")
+                raise RuntimeError("The serial baseline does not verify.")
+            logging.warning(f"Profiling with {verifiers} parallel verifiers failed: {e}")
+            rows.append({"parallel_verifiers": verifiers, "parallelize_branches": branches, "status": "failed"})
+            continue
+        rows.append({"parallel_verifiers": verifiers, "parallelize_branches": branches}
+                    | summarize(csv_path, args.output_dir))
+
+    baseline = rows[0]
+    if baseline["status"] != "ok":
+        logging.error("All iterations of the serial baseline were killed.")
+        raise RuntimeError("All iterations of the serial baseline were killed.")
+    for row in rows:
+        if row["status"] == "ok":
+            row["speedup"] = baseline["median_wall_time"] / row["median_wall_time"]
+            row["efficiency"] = row["speedup"] / row["parallel_verifiers"]
+            logging.info(f"{row['parallel_verifiers']} verifiers, branch parallelization "
+                         f"{'on' if row['parallelize_branches'] else 'off'}: {row['median_wall_time']} s, "
+                         f"speedup {row['speedup']:.2f}, efficiency {row['efficiency']:.2f}.")
+
+    rows.sort(key=lambda row: (row["parallelize_branches"], row["parallel_verifiers"]))
+    table_path = args.output_dir / f"{args.program_path.stem}-scaling.csv"
+    profile.write_to_csv([dict.fromkeys(SUMMARY_COLUMNS, "") | row for row in rows], table_path)
+
+    if not args.skip_plot:
+        # pandas, seaborn and matplotlib are only needed for plotting, so they are only imported once profiling is done.
+        import plot
+        plot.plot_scaling(table_path, args.scaling_size)
+
+
+def summarize(csv_path, output_dir):
+    """Summarize the CSV file of profiling a configuration in a row of the results table.
+
+    The CPU time is the sum of the user and system time of Silicon and all its child processes. CSV files written
+    without these columns (e.g., with ViperServer) only get a wall time, which is then the execution time. Iterations
+    killed by the watchdog of profile.py are only counted, as in suite.summarize.
+    """
+    with open(csv_path, newline="") as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    completed = [row for row in rows if not row.get("censored")]
+
+    summary = {"status": "ok" if completed else "killed",
+               "iterations": len(rows),
+               "censored": len(rows) - len(completed),
+               "csv": csv_path.relative_to(output_dir)}
+    if not completed:
+        return summary
+
+    summary["median_wall_time"] = statistics.median(float(row.get("wall_time") or row["execution_time"])
+                                                    for row in completed)
+    if completed[0].get("user_time"):
+        summary["median_cpu_time"] = statistics.median(float(row["user_time"]) + float(row["system_time"])
+                                                       for row in completed)
+        summary["busy_cores"] = summary["median_cpu_time"] / summary["median_wall_time"]
+    return summary
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns the parsed arguments and the remaining arguments, which are passed to profile.py for every configuration.
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, allow_abbrev=False,
+                                     epilog=("All other arguments (e.g., --silicon_path or --iterations) are passed to "
+                                             "profile.py for every configuration."))
+    parser.add_argument("program_path", type=profile.program_path,
+                        help="Gobra or Viper program, or Gobra package, whose verification is profiled")
+    parser.add_argument("--parallel_verifiers", type=profile.positive, nargs="+", required=False,
+                        default=[1, 2, 4, 8],
+                        help="numbers of parallel verifiers of Silicon to be profiled")
+    parser.add_argument("--parallelize_branches", choices=BRANCH_MODES, required=False, default="both",
+                        help="whether to profile every number of verifiers with or without branch parallelization")
+    parser.add_argument("--output_dir", type=Path, required=False,
+                        help="directory of the CSV files and the results table (defaults to <program>-scaling)")
+    parser.add_argument("--scaling_size", type=int, nargs=2, required=False, default=[9, 4],
+                        help="size of the plot of the speedup and efficiency (width height)")
+    parser.add_argument("--skip_plot", action="store_true", required=False,
+                        help="do not plot the results table.")
+    args, profile_args = parser.parse_known_args()
+    # Parallel iterations would compete with the parallel verifiers for the cores.
+    if any(argument == "--jobs" or argument.startswith("--jobs=") for argument in profile_args):
+        parser.error("--jobs cannot be passed to profile.py, as the configurations are profiled one after another")
+    if args.output_dir is None:
+        args.output_dir = args.program_path.parent / f"{args.program_path.stem}-scaling"
+    return args, profile_args
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Module for an append-only, columnar store of profiling results in Parquet files.
+
+A store is a directory with two datasets, each consisting of one Parquet file per run:
+- iterations/: one row per iteration with the columns of the CSV files of profile.py (except for the quantifier
+  instantiations), the run_id, and the metadata of the run (e.g., z3_version) as real columns.
+- instantiations/: one row per (run_id, iteration, quantifier) with the number of instantiations.
+Appending a run only adds files, so runs of different tool versions and settings can be collected in one store and
+selected by their metadata when plotting, without parsing every file.
+
+Used as a script, it imports CSV files written by profile.py into a store:
+
+    python3 store.py STORE_DIR CSV_FILE...
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import argparse
+import csv
+import logging
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs
+import pyarrow.parquet as pq
+
+from profile import parse_metadata
+from util import file_path
+
+ITERATIONS = "iterations"
+INSTANTIATIONS = "instantiations"
+
+
+def main():
+    """Import CSV files into a store."""
+    # Set up logging.
+    logging.basicConfig(level=logging.DEBUG)
+
+    args = parse_args()
+    for csv_path in args.csv_path:
+        metadata = parse_metadata(csv_path)
+        if metadata is None:
+            logging.warning(f"Skipping {csv_path}: its name was not written by profile.py.")
+            continue
+
+        with open(csv_path, newline="") as csv_file:
+            data = [{key: parse_value(value) for key, value in row.items()} for row in csv.DictReader(csv_file)]
+        run_id = append_run(args.store_dir, metadata, data, csv_path.stem)
+        logging.info(f"Imported {csv_path} as run {run_id}.")
+
+
+def append_run(store_dir, metadata, data, label):
+    """Append a run, i.e., the data points of all its iterations, to the store and return the id of the run.
+
+    metadata is the metadata of profile.py; label is a human-readable name of the run (e.g., the name of its CSV file).
+    """
+    store_dir = Path(store_dir)
+    run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    run = {"run_id": run_id, "label": label, "timestamp": time.time(),
+           "program": Path(metadata["program_path"]).stem, "program_path": str(metadata["program_path"])}
+    run.update((key, value) for key, value in metadata.items() if key != "program_path")
+
+    iterations = []
+    instantiations = []
+    for i, data_point in enumerate(data):
+        iteration = dict(run, iteration=i)
+        for key, value in data_point.items():
+            if key.startswith("qi-"):
+                instantiations.append({"run_id": run_id, "iteration": i, "quantifier": key.removeprefix("qi-"),
+                                       "instantiations": value})
+            else:
+                # Empty cells of the CSV files (e.g., the core of an unpinned iteration) are missing values.
+                iteration[key] = None if value == "" else value
+        iterations.append(iteration)
+
+    # The iterations are written last, so that a run only becomes visible once all of its files exist.
+    if instantiations:
+        write_table(store_dir / INSTANTIATIONS, run_id, pa.Table.from_pylist(instantiations))
+    write_table(store_dir / ITERATIONS, run_id, pa.Table.from_pylist(iterations))
+    logging.info(f"Stored {len(data)} iterations as run {run_id} in {store_dir}.")
+    return run_id
+
+
+def write_table(directory, run_id, table):
+    """Write the table of a run atomically to directory."""
+    directory.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False) as table_file:
+        pq.write_table(table, table_file)
+    os.replace(table_file.name, directory / f"{run_id}.parquet")
+
+
+def load_runs(store_dir, filters=None):
+    """Load all runs whose metadata matches filters, a dictionary from column names to values (given as strings).
+
+    Only the matching Parquet files are read (using their statistics), and they are memory-mapped. Returns a list of
+    (label, DataFrame) pairs, one per run in the order in which they were stored, where each DataFrame has the columns
+    of the CSV files of profile.py and the metadata columns of the run.
+    """
+    store_dir = Path(store_dir)
+    filesystem = pyarrow.fs.LocalFileSystem(use_mmap=True)
+    iterations = dataset(store_dir / ITERATIONS, filesystem)
+    if iterations is None:
+        return []
+
+    expression = None
+    for column, value in (filters or {}).items():
+        if column not in iterations.schema.names:
+            logging.error(f"Unknown column {column}; the store has the columns {iterations.schema.names}.")
+            raise ValueError(f"Unknown column {column}.")
+        condition = ds.field(column) == pa.scalar(value).cast(iterations.schema.field(column).type)
+        expression = condition if expression is None else expression & condition
+
+    iterations_df = iterations.to_table(filter=expression).to_pandas()
+    if iterations_df.empty:
+        return []
+    run_ids = list(iterations_df["run_id"].unique())
+
+    instantiations = dataset(store_dir / INSTANTIATIONS, filesystem)
+    if instantiations is not None:
+        instantiations_df = instantiations.to_table(filter=ds.field("run_id").isin(run_ids)).to_pandas()
+    else:
+        instantiations_df = None
+
+    runs = []
+    for run_id, run_df in sorted(iterations_df.groupby("run_id"), key=lambda run: run[1]["timestamp"].iloc[0]):
+        run_df = run_df.set_index("iteration").sort_index()
+        if instantiations_df is not None:
+            # Convert to the wide format of the CSV files; quantifiers that were not instantiated in an iteration have
+            # no row, i.e., zero instantiations.
+            qi_df = instantiations_df[instantiations_df["run_id"] == run_id].pivot_table(
+                index="iteration", columns="quantifier", values="instantiations", aggfunc="sum", fill_value=0)
+            qi_df.columns = "qi-" + qi_df.columns.astype(str)
+            qi_df = qi_df.reindex(run_df.index, fill_value=0)
+            run_df = qi_df.join(run_df)
+        runs.append((run_df["label"].iloc[0], run_df.reset_index(drop=True)))
+    return runs
+
+
+def dataset(directory, filesystem):
+    """Returns the dataset of all Parquet files in directory, or None if there are none.
+
+    Runs may have different columns (e.g., backend_time only exists for runs with ViperServer), so the schema of the
+    dataset is the union of the schemas of the files.
+    """
+    paths = sorted(str(path) for path in Path(directory).glob("*.parquet"))
+    if not paths:
+        return None
+
+    schema = pa.unify_schemas([pq.read_schema(path, memory_map=True) for path in paths],
+                              promote_options="permissive")
+    return ds.dataset(paths, schema=schema, format="parquet", filesystem=filesystem)
+
+
+def parse_value(string):
+    """Convert a cell of a CSV file to an int or float if possible."""
+    for convert in (int, float):
+        try:
+            return convert(string)
+        except ValueError:
+            pass
+    return string
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("store_dir", type=Path,
+                        help="directory of the store")
+    parser.add_argument("csv_path", type=file_path, nargs="+",
+                        help="CSV files written by profile.py to be imported")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
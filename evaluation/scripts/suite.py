@@ -0,0 +1,125 @@
+"""
+Module for benchmarking the verification of every package of gobra-libs on its own.
+
+Every package is profiled by profile.py, and the results are summarized in one table (summary.csv) with a row per
+package: its median wall time, the median total number of quantifier instantiations and its top quantifiers. Running
+the suite for every release gives a baseline to find the packages that make verifying the library slow.
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import argparse
+import csv
+import logging
+import statistics
+from pathlib import Path
+
+import profile
+from util import directory_path
+
+LIBRARY_ROOT = Path(__file__).resolve().parents[2]
+# Directories of the library that do not contain packages.
+EXCLUDED_DIRECTORIES = {"evaluation"}
+
+SUMMARY_COLUMNS = ["package", "status", "iterations", "censored", "median_execution_time", "median_backend_time",
+                   "median_qi_total", "top_quantifiers", "csv"]
+
+
+def main():
+    """Main function of the benchmark suite."""
+    # Set up logging.
+    logging.basicConfig(level=logging.DEBUG)
+
+    args, profile_args = parse_args()
+    packages = args.packages or library_packages(args.library_root)
+
+    argvs = {package: [str(args.library_root / package), "--include_path", str(args.library_root),
+                       "--output_dir", str(args.output_dir / package)] + profile_args
+             for package in packages}
+    # Check all command lines before profiling anything, so that a typo does not stop the suite halfway through.
+    for argv in argvs.values():
+        profile.parse_args(argv)
+
+    summary = []
+    for package, argv in argvs.items():
+        logging.info(f"Benchmarking package {package}.")
+        try:
+            csv_path = profile.profile_program(profile.parse_args(argv))
+        except (RuntimeError, ValueError) as e:
+            # A package that does not verify should not stop the suite.
+            logging.error(f"Benchmarking package {package} failed: {e}")
+            summary.append(dict.fromkeys(SUMMARY_COLUMNS, "") | {"package": package, "status": "failed"})
+            continue
+
+        summary.append(summarize(package, csv_path, args.output_dir, args.top))
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    profile.write_to_csv(summary, args.output_dir / "summary.csv")
+    for row in summary:
+        if row["status"] == "ok":
+            logging.info(f"{row['package']}: {row['median_execution_time']} s, {row['median_qi_total']} instantiations")
+        else:
+            logging.info(f"{row['package']}: {row['status']}")
+
+
+def library_packages(library_root):
+    """Returns the names of all packages of the library, i.e., of the directories that directly contain Gobra files."""
+    return sorted(directory.name for directory in library_root.iterdir()
+                  if directory.is_dir() and not directory.name.startswith(".")
+                  and directory.name not in EXCLUDED_DIRECTORIES and any(directory.glob("*.gobra")))
+
+
+def summarize(package, csv_path, output_dir, top):
+    """Summarize the CSV file of profiling a package in a row of the results table.
+
+    Iterations killed by the watchdog of profile.py are only counted; their times and counts are lower bounds and
+    therefore excluded from the medians.
+    """
+    with open(csv_path, newline="") as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    completed = [row for row in rows if not row.get("censored")]
+
+    summary = dict.fromkeys(SUMMARY_COLUMNS, "")
+    summary.update({"package": package,
+                    "status": "ok" if completed else "killed",
+                    "iterations": len(rows),
+                    "censored": len(rows) - len(completed),
+                    "csv": csv_path.relative_to(output_dir)})
+    if not completed:
+        return summary
+
+    quantifiers = [key for key in completed[0] if key.startswith("qi-")]
+    summary["median_execution_time"] = statistics.median(float(row["execution_time"]) for row in completed)
+    if completed[0].get("backend_time"):
+        summary["median_backend_time"] = statistics.median(float(row["backend_time"]) for row in completed)
+    summary["median_qi_total"] = statistics.median(sum(int(row[key]) for key in quantifiers) for row in completed)
+
+    medians = {key.removeprefix("qi-"): statistics.median(int(row[key]) for row in completed) for key in quantifiers}
+    top_quantifiers = sorted(medians.items(), key=lambda item: item[1], reverse=True)[:top]
+    summary["top_quantifiers"] = "; ".join(f"{name} ({count})" for name, count in top_quantifiers)
+    return summary
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns the parsed arguments and the remaining arguments, which are passed to profile.py for every package.
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, allow_abbrev=False,
+                                     epilog=("All other arguments (e.g., --silicon_path or --iterations) are passed to "
+                                             "profile.py for every package."))
+    parser.add_argument("--packages", type=str, nargs="+", required=False,
+                        help="packages to benchmark (defaults to all packages of the library)")
+    parser.add_argument("--library_root", type=directory_path, required=False, default=LIBRARY_ROOT,
+                        help="root directory of gobra-libs")
+    parser.add_argument("--output_dir", type=Path, required=False, default=LIBRARY_ROOT / "evaluation" / "suite",
+                        help="directory of the results table and of the CSV files of the packages")
+    parser.add_argument("--top", type=profile.positive, required=False, default=5,
+                        help="number of quantifiers with the most instantiations listed per package")
+    return parser.parse_known_args()
+
+
+if __name__ == "__main__":
+    main()
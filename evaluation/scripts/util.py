@@ -15,3 +15,11 @@ def file_path(string):
         return Path(string)
     else:
         raise argparse.ArgumentTypeError(f"{string} is not a valid path to a file")
+
+
+def directory_path(string):
+    """Checks that the string is a valid path to a directory."""
+    if os.path.isdir(string):
+        return Path(string)
+    else:
+        raise argparse.ArgumentTypeError(f"{string} is not a valid path to a directory")
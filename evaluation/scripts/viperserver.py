@@ -0,0 +1,145 @@
+"""
+Module for verifying Viper programs with a long-lived ViperServer process instead of starting Silicon for every run.
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import codecs
+import json
+import logging
+import socket
+import subprocess
+import tempfile
+import time
+import urllib.request
+
+
+class ViperServer:
+    """A ViperServer process that is started once and then verifies programs over its HTTP API.
+
+    Use it as a context manager, so that the process is shut down again:
+
+        with ViperServer(jar_path) as server:
+            for message in server.verify(["silicon", "program.vpr"]):
+                ...
+    """
+
+    def __init__(self, jar_path, startup_timeout=120):
+        self.jar_path = jar_path
+        self.startup_timeout = startup_timeout
+        self.port = None
+        self.process = None
+        self.log = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Start ViperServer and wait until it accepts connections."""
+        self.port = free_port()
+        command = ["java", "-Xss128m", "-jar", str(self.jar_path), "--serverMode", "HTTP", "--port", str(self.port)]
+        logging.info(f"Starting ViperServer on port {self.port}.")
+        logging.debug(f"Running {command}")
+        # ViperServer's output is only needed if something goes wrong. Writing it to a file instead of a pipe makes
+        # sure that ViperServer never blocks on a full pipe.
+        self.log = tempfile.TemporaryFile(mode="w+")
+        self.process = subprocess.Popen(command, stdout=self.log, stderr=subprocess.STDOUT, text=True)
+
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                self.log.seek(0)
+                logging.error(f"ViperServer exited with return code {self.process.returncode}.")
+                logging.error(f"output: {self.log.read()}")
+                raise RuntimeError(f"ViperServer exited with return code {self.process.returncode}.")
+            try:
+                socket.create_connection(("localhost", self.port), timeout=1).close()
+                logging.info("ViperServer started.")
+                return
+            except OSError:
+                time.sleep(0.1)
+
+        self.stop()
+        raise RuntimeError(f"ViperServer did not start within {self.startup_timeout} seconds.")
+
+    def stop(self):
+        """Ask ViperServer to exit and kill it if it does not."""
+        if self.process is None:
+            return
+
+        if self.process.poll() is None:
+            logging.info("Stopping ViperServer.")
+            try:
+                urllib.request.urlopen(self.url("/exit"), timeout=10).close()
+                self.process.wait(timeout=30)
+            except (OSError, subprocess.TimeoutExpired):
+                logging.warning("ViperServer did not exit. Killing it.")
+                self.process.kill()
+                self.process.wait()
+
+        self.log.close()
+        self.process = None
+
+    def verify(self, arguments):
+        """Verify a program and yield the messages ViperServer reports while doing so.
+
+        arguments is the command line of the verifier, starting with its name, e.g. ["silicon", "program.vpr"]. Each
+        message is a dictionary with the keys "msg_type" and "msg_body". The generator ends when the verification job
+        is done.
+        """
+        request = urllib.request.Request(self.url("/verify"), data=json.dumps({"arg": arg_string(arguments)}).encode(),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            job_id = json.load(response)["id"]
+        logging.debug(f"ViperServer started job {job_id}.")
+
+        with urllib.request.urlopen(self.url(f"/verify/{job_id}")) as response:
+            yield from json_stream(response)
+
+    def url(self, path):
+        return f"http://localhost:{self.port}{path}"
+
+
+def json_stream(response, chunk_size=1 << 16):
+    """Incrementally decode the JSON objects in a response.
+
+    ViperServer streams its messages either as a JSON array or as a sequence of JSON objects; this function handles
+    both by skipping everything between the objects.
+    """
+    decoder = json.JSONDecoder()
+    # A chunk may end in the middle of a multi-byte character.
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    while chunk := response.read1(chunk_size):
+        buffer += utf8.decode(chunk)
+        while True:
+            start = buffer.find("{")
+            if start == -1:
+                buffer = ""
+                break
+            try:
+                message, end = decoder.raw_decode(buffer, start)
+            except json.JSONDecodeError:
+                # The object is not complete yet.
+                buffer = buffer[start:]
+                break
+            yield message
+            buffer = buffer[end:]
+
+
+def arg_string(arguments):
+    """Join command line arguments into the single string expected by ViperServer, quoting those with spaces."""
+    return " ".join(f'"{argument}"' if " " in str(argument) else str(argument) for argument in arguments)
+
+
+def free_port():
+    """Returns a TCP port on localhost that is currently not in use."""
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
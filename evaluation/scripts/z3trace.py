@@ -0,0 +1,512 @@
+"""
+Module for explaining quantifier instantiations with the trace logs of Z3 (trace=true).
+
+The flat counts of smt.qi.profile, as recorded by profile.py, do not tell why a quantifier is instantiated so often.
+A Z3 trace log does: for every instantiation, it records the terms that matched the pattern of the quantifier, and
+for every term, the instantiation that produced it. This module streams trace logs line by line and builds an
+instantiation graph, in which an instantiation is the child of the instantiations that produced the terms it was
+triggered by. Only a few integers are kept per instantiation and per live term, and matches are dropped once they are
+instantiated or their scope is popped, so the memory used is a small fraction of the size of the log, which can run to
+several GB for larger programs.
+
+From the graph, it reports:
+- the longest chains of instantiations, in which repeating parts are abbreviated, e.g., "a -> (b -> c) x 40";
+- likely matching loops, i.e., cycles of quantifiers (possibly of a single one) that instantiate each other along
+  long chains;
+- per quantifier (named as in the CSV files of profile.py, without "qi-"), the number of instantiations and the length
+  of the longest chain ending in it, and, per pair of quantifiers, how often one triggered the other.
+
+The input is either trace logs (.log, optionally gzipped) or a Gobra or Viper program. For a program, Silicon is run
+once to dump its queries (as done by replay.py), and Z3 is run with tracing on every query.
+
+This file is part of gobra-libs which is released under the MIT license.
+See LICENSE or go to https://github.com/viperproject/gobra-libs/blob/main/LICENSE
+for full license details.
+"""
+
+import argparse
+import array
+import collections
+import gzip
+import logging
+import os
+from pathlib import Path
+
+from profile import (gobra_version, is_gobra, positive, process_output, program_path, silicon_version,
+                     time_checked_stream, translate, write_to_csv, z3_version)
+from replay import dump_queries
+from util import file_path
+
+# Name of the edges of the instantiation graph whose source is not an instantiation, e.g., the input of the query.
+ROOT = ""
+
+
+def main():
+    """Main function of the trace analyzer."""
+    # Set up logging.
+    logging.basicConfig(level=logging.DEBUG)
+
+    args = parse_args()
+    analyzer = TraceAnalyzer(args.top)
+
+    if args.trace_path[0].suffix in (".log", ".gz"):
+        name = args.trace_path[0].name.removesuffix(".gz").removesuffix(".log")
+        output_dir = args.output_dir or args.trace_path[0].parent
+        for trace_path in args.trace_path:
+            analyze_file(analyzer, trace_path)
+    else:
+        if len(args.trace_path) > 1:
+            logging.error("Only a single program can be traced at a time.")
+            raise ValueError("Only a single program can be traced at a time.")
+        args.program_path = args.trace_path[0]
+        name = f"{args.program_path.stem.replace('.', '_')}-trace"
+        if args.disableSetAxiomatization:
+            name += "-no_set_axiom"
+        output_dir = args.output_dir or args.program_path.parent
+        trace_program(args, analyzer, output_dir / f"{name}-logs")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    write_to_csv(analyzer.quantifier_table(args.min_loop_depth), output_dir / f"{name}.quantifiers.csv")
+    write_to_csv(analyzer.graph_table(), output_dir / f"{name}.graph.csv")
+    log_report(analyzer, args.min_loop_depth)
+
+
+def trace_program(args, analyzer, log_dir):
+    """Dump the queries of the program, run Z3 with tracing on every query, and analyze the trace logs.
+
+    The trace logs are removed after they have been analyzed, unless args.keep_traces is set.
+    """
+    # Set Z3 environment for Gobra and Silicon.
+    os.environ["Z3_EXE"] = str(args.z3_path)
+
+    metadata = {"program_path": args.program_path,
+                "silicon_version": silicon_version(args.silicon_path),
+                "z3_version": z3_version(args.z3_path)}
+    if is_gobra(args.program_path):
+        if args.gobra_path is None:
+            logging.error("Path to Gobra jar is required for Gobra files.")
+            raise ValueError("Path to Gobra jar is required for Gobra files.")
+        metadata["gobra_version"] = gobra_version(args.gobra_path)
+        vpr_file_path = translate(args, metadata)
+    # Due to program_path(), this is a Viper file.
+    else:
+        vpr_file_path = args.program_path
+
+    log_dir.mkdir(parents=True, exist_ok=True)
+    for query in dump_queries(args, vpr_file_path, metadata):
+        trace_path = log_dir / f"{query.stem}.log"
+        command = [args.z3_path, "-smt2", "trace=true", "proof=true", f"trace_file_name={trace_path}",
+                   f"smt.random_seed={args.seed}", f"sat.random_seed={args.seed}", f"nlsat.seed={args.seed}", query]
+        logging.info(f"Running Z3 with tracing on {query.name}.")
+        _, execution_time = time_checked_stream(command, process_output, merge_stderr=True)
+        logging.info(f"Z3 finished in {execution_time} seconds.")
+
+        analyze_file(analyzer, trace_path)
+        if not args.keep_traces:
+            trace_path.unlink()
+    if not args.keep_traces:
+        log_dir.rmdir()
+
+
+def analyze_file(analyzer, trace_path):
+    """Stream a (possibly gzipped) trace log through the analyzer."""
+    logging.info(f"Analyzing {trace_path}.")
+    opener = gzip.open if trace_path.suffix == ".gz" else open
+    with opener(trace_path, "rt", errors="replace") as trace_file:
+        analyzer.analyze(trace_file, trace_path.name)
+    logging.info(f"{trace_path}: {analyzer.instantiations_of_last_log} instantiations.")
+
+
+class TraceAnalyzer:
+    """Builds the instantiation graph of one or more Z3 trace logs and keeps the results across logs.
+
+    Per log, every instantiation is stored as three integers in arrays: its quantifier, its parent (the instantiation
+    that produced one of its triggering terms and has the longest chain, or -1), and the length of its longest chain.
+    Terms are only mapped to the instantiation that produced them while they exist; Z3 reuses the ids of terms that
+    were deleted when popping a scope, and a new term with a reused id starts without a producer. Matches that have not
+    been instantiated yet are kept per scope and dropped when their scope is popped, as Z3 drops them, too. Across
+    logs, only aggregated results are kept: the counts per quantifier and per pair of quantifiers, the longest chains,
+    and the matching loops.
+    """
+
+    def __init__(self, top):
+        self.top = top
+        # Quantifier names, and their indices in the following lists.
+        self.names = []
+        self.name_indices = {}
+        self.instantiations = []
+        self.roots = []
+        self.max_depths = []
+        # Maps (parent quantifier, child quantifier) to the number of instantiations of the child triggered by a term
+        # produced by an instantiation of the parent. The parent is None for terms not produced by an instantiation.
+        self.edges = collections.Counter()
+        # The longest chains as (length, log, names from the root to the leaf), longest first.
+        self.chains = []
+        # Maps the quantifiers of a matching loop to its longest chain within the loop and its number of instantiations.
+        self.loops = {}
+        self.instantiations_of_last_log = 0
+
+    def quantifier(self, name):
+        """Returns the index of a quantifier name, adding it if it is new."""
+        if name not in self.name_indices:
+            self.name_indices[name] = len(self.names)
+            self.names.append(name)
+            self.instantiations.append(0)
+            self.roots.append(0)
+            self.max_depths.append(0)
+        return self.name_indices[name]
+
+    def analyze(self, lines, log_name):
+        """Analyze the lines of a trace log and add the results to the results of the previous logs."""
+        log = TraceLog(self)
+        for line in lines:
+            if not log.process(line):
+                break
+
+        self.instantiations_of_last_log = len(log.quantifiers)
+        self.add_chains(log, log_name)
+        self.add_loops(log)
+
+    def add_chains(self, log, log_name):
+        """Keep the longest chains of the log: for every quantifier, the longest chain ending in it."""
+        deepest = {}
+        for instance, (quantifier, depth) in enumerate(zip(log.quantifiers, log.depths)):
+            if depth > deepest.get(quantifier, (0, None))[0]:
+                deepest[quantifier] = (depth, instance)
+
+        for depth, instance in deepest.values():
+            self.chains.append((depth, log_name, [self.names[quantifier] for quantifier in log.chain(instance)]))
+        self.chains.sort(key=lambda chain: chain[0], reverse=True)
+        del self.chains[self.top:]
+
+    def add_loops(self, log):
+        """Find the matching loops of the log, i.e., the cycles of the quantifier graph of the log.
+
+        Along the chain of every instantiation, the length of its suffix that stays within the strongly connected
+        component of the quantifier graph containing the instantiation's quantifier is computed; long suffixes show
+        that the quantifiers of the component keep instantiating each other.
+        """
+        successors = collections.defaultdict(set)
+        for parent, child in log.edges:
+            successors[parent].add(child)
+        components = strongly_connected_components(successors)
+        cyclic = {quantifier for quantifier, component in components.items()
+                  if len(component) > 1 or quantifier in successors[quantifier]}
+
+        keys = {quantifier: frozenset(self.names[member] for member in components[quantifier])
+                for quantifier in cyclic}
+        # Maps the keys of the loops to the length of the longest chain within the loop in this log, the instantiation
+        # ending it, and the number of instantiations of the loop's quantifiers.
+        loops = {}
+        loop_depths = array.array("l")
+        for instance, (quantifier, parent) in enumerate(zip(log.quantifiers, log.parents)):
+            if quantifier not in cyclic:
+                loop_depths.append(0)
+                continue
+            if parent != -1 and components[log.quantifiers[parent]] is components[quantifier]:
+                loop_depths.append(loop_depths[parent] + 1)
+            else:
+                loop_depths.append(1)
+
+            depth, deepest, instantiations = loops.get(keys[quantifier], (0, -1, 0))
+            if loop_depths[instance] > depth:
+                depth, deepest = loop_depths[instance], instance
+            loops[keys[quantifier]] = (depth, deepest, instantiations + 1)
+
+        for key, (depth, deepest, instantiations) in loops.items():
+            previous_depth, names, previous_instantiations = self.loops.get(key, (0, [], 0))
+            if depth > previous_depth:
+                names = [self.names[quantifier] for quantifier in log.chain(deepest)[-depth:]]
+            self.loops[key] = (max(depth, previous_depth), names, instantiations + previous_instantiations)
+
+    def quantifier_table(self, min_loop_depth):
+        """Returns one row per quantifier, most instantiated first."""
+        loops = {name: i for i, key in enumerate(self.likely_loops(min_loop_depth)) for name in key}
+        rows = [{"quantifier": name,
+                 "instantiations": self.instantiations[i],
+                 "roots": self.roots[i],
+                 "max_depth": self.max_depths[i],
+                 "loop": loops.get(name, "")} for i, name in enumerate(self.names)]
+        return sorted(rows, key=lambda row: row["instantiations"], reverse=True)
+
+    def graph_table(self):
+        """Returns one row per edge of the quantifier graph, most frequent first."""
+        rows = [{"source": ROOT if parent is None else self.names[parent], "target": self.names[child],
+                 "instantiations": count} for (parent, child), count in self.edges.items()]
+        return sorted(rows, key=lambda row: row["instantiations"], reverse=True)
+
+    def likely_loops(self, min_loop_depth):
+        """Returns the quantifiers of the matching loops with chains of at least min_loop_depth instantiations,
+        longest chains first."""
+        loops = [key for key, (depth, _, _) in self.loops.items() if depth >= min_loop_depth]
+        return sorted(loops, key=lambda key: self.loops[key][0], reverse=True)
+
+
+class TraceLog:
+    """The state of analyzing a single trace log, see TraceAnalyzer."""
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        # Maps the ids of quantifier terms to the indices of their names.
+        self.quantifier_terms = {}
+        # The instantiation that produced every term, indexed by the number of its id, or -1. Ids that are not of the
+        # form #<number> (e.g., of theory terms) are kept in a dictionary instead.
+        self.producers = array.array("l")
+        self.other_producers = {}
+        # Matches that have not been instantiated yet, per scope (push), by their fingerprint: their quantifier, best
+        # parent, and the quantifiers of all parents.
+        self.matches = [{}]
+        self.quantifiers = array.array("l")
+        self.parents = array.array("l")
+        self.depths = array.array("l")
+        # The pairs of quantifiers (parent, child) of this log.
+        self.edges = set()
+        # The instantiation whose terms are currently being created, or -1.
+        self.current = -1
+
+    def process(self, line):
+        """Process a line of the trace log. Returns False at the end of the log."""
+        if not line.startswith("["):
+            return True
+        tag, _, rest = line.partition("]")
+        tokens = rest.split()
+
+        if tag in ("[mk-app", "[mk-var", "[mk-proof", "[mk-lambda") and tokens:
+            # A new term; its id may have been used by a deleted term before.
+            self.set_producer(tokens[0], self.current)
+        elif tag == "[mk-quant" and len(tokens) >= 2:
+            self.set_producer(tokens[0], -1)
+            self.quantifier_terms[tokens[0]] = self.analyzer.quantifier(tokens[1])
+        elif tag == "[attach-enode" and tokens and self.current != -1:
+            self.set_producer(tokens[0], self.current)
+        elif tag == "[new-match" and len(tokens) >= 2:
+            # [new-match] <fingerprint> <quantifier> <pattern> <bindings> ; <triggering terms and (equalities)>
+            _, _, blame = rest.partition(";")
+            self.add_match(tokens[0], tokens[1], blame)
+        elif tag == "[inst-discovered" and len(tokens) >= 3:
+            # [inst-discovered] <method, e.g., MBQI> <fingerprint> <quantifier> ; <bindings>
+            self.add_match(tokens[1], tokens[2], "")
+        elif tag == "[push":
+            self.matches.append({})
+        elif tag == "[pop" and tokens:
+            # [pop] <number of scopes> <scope level>
+            del self.matches[max(1, len(self.matches) - int(tokens[0])):]
+        elif tag == "[instance" and tokens:
+            self.current = self.add_instance(tokens[0])
+        elif tag == "[end-of-instance":
+            self.current = -1
+        elif tag == "[eof":
+            return False
+        return True
+
+    def set_producer(self, term, instance):
+        """Set the instantiation that produced a term."""
+        number = term[1:]
+        if term.startswith("#") and number.isdigit():
+            index = int(number)
+            if index >= len(self.producers):
+                if instance == -1:
+                    return
+                self.producers.extend([-1] * (index + 1 - len(self.producers)))
+            self.producers[index] = instance
+        elif instance == -1:
+            self.other_producers.pop(term, None)
+        else:
+            self.other_producers[term] = instance
+
+    def producer(self, term):
+        """Returns the instantiation that produced a term, or -1."""
+        term = term.strip("()")
+        number = term[1:]
+        if term.startswith("#") and number.isdigit():
+            index = int(number)
+            return self.producers[index] if index < len(self.producers) else -1
+        return self.other_producers.get(term, -1)
+
+    def add_match(self, fingerprint, quantifier_term, blame):
+        """Record a match of a quantifier, whose parents are the producers of the terms it was triggered by."""
+        quantifier = self.quantifier_terms.get(quantifier_term)
+        if quantifier is None:
+            # E.g., a theory axiom.
+            return
+
+        parents = {self.producer(term) for term in blame.split()} - {-1}
+        best_parent = max(parents, key=lambda parent: self.depths[parent], default=-1)
+        self.matches[-1][fingerprint] = (quantifier, best_parent,
+                                         tuple({self.quantifiers[parent] for parent in parents}))
+
+    def add_instance(self, fingerprint):
+        """Record the instantiation of a match and return its index, or -1 if the match is unknown."""
+        # Most matches are instantiated in the scope they were found in.
+        for matches in reversed(self.matches):
+            match = matches.pop(fingerprint, None)
+            if match is not None:
+                break
+        else:
+            return -1
+        quantifier, parent, parent_quantifiers = match
+
+        instance = len(self.quantifiers)
+        depth = 1 if parent == -1 else self.depths[parent] + 1
+        self.quantifiers.append(quantifier)
+        self.parents.append(parent)
+        self.depths.append(depth)
+
+        analyzer = self.analyzer
+        analyzer.instantiations[quantifier] += 1
+        analyzer.max_depths[quantifier] = max(analyzer.max_depths[quantifier], depth)
+        if parent == -1:
+            analyzer.roots[quantifier] += 1
+            analyzer.edges[None, quantifier] += 1
+        for parent_quantifier in parent_quantifiers:
+            analyzer.edges[parent_quantifier, quantifier] += 1
+            self.edges.add((parent_quantifier, quantifier))
+        return instance
+
+    def chain(self, instance):
+        """Returns the quantifiers of the longest chain ending in the instantiation, from the root to the leaf."""
+        quantifiers = []
+        while instance != -1:
+            quantifiers.append(self.quantifiers[instance])
+            instance = self.parents[instance]
+        quantifiers.reverse()
+        return quantifiers
+
+
+def strongly_connected_components(successors):
+    """Returns a dictionary that maps every node of the graph to its strongly connected component (a set of nodes that
+    is shared by all of its members). The graph is given as a dictionary from nodes to sets of successors.
+
+    This is Tarjan's algorithm, with an explicit stack instead of recursion, as chains of quantifiers can be long.
+    """
+    nodes = set(successors) | {node for targets in successors.values() for node in targets}
+    indices, lowlinks, components = {}, {}, {}
+    stack, on_stack = [], set()
+    counter = 0
+    for start in sorted(nodes):
+        if start in indices:
+            continue
+        work = [(start, iter(sorted(successors.get(start, ()))))]
+        indices[start] = lowlinks[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            node, targets = work[-1]
+            target = next(targets, None)
+            if target is None:
+                work.pop()
+                if work:
+                    lowlinks[work[-1][0]] = min(lowlinks[work[-1][0]], lowlinks[node])
+                if lowlinks[node] == indices[node]:
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.add(member)
+                        components[member] = component
+                        if member == node:
+                            break
+            elif target not in indices:
+                indices[target] = lowlinks[target] = counter
+                counter += 1
+                stack.append(target)
+                on_stack.add(target)
+                work.append((target, iter(sorted(successors.get(target, ())))))
+            elif target in on_stack:
+                lowlinks[node] = min(lowlinks[node], indices[target])
+    return components
+
+
+def abbreviate(names, max_length=12):
+    """Format a chain of quantifiers, abbreviating repeated parts, e.g., "a -> (b -> c) x 40 -> d".
+
+    If the abbreviated chain still has more than max_length parts, its middle is elided.
+    """
+    parts = []
+    i = 0
+    while i < len(names):
+        # Find the block of at most 4 quantifiers whose repetitions cover the most of the chain from here.
+        best_length, best_repetitions = 1, 1
+        for length in range(1, 5):
+            repetitions = 1
+            while names[i + repetitions * length:i + (repetitions + 1) * length] == names[i:i + length]:
+                repetitions += 1
+            if repetitions > 1 and length * repetitions > best_length * best_repetitions:
+                best_length, best_repetitions = length, repetitions
+
+        block = " -> ".join(names[i:i + best_length])
+        if best_repetitions == 1:
+            parts.append(block)
+        else:
+            parts.append(f"({block}) x {best_repetitions}" if best_length > 1 else f"{block} x {best_repetitions}")
+        i += best_length * best_repetitions
+
+    if len(parts) > max_length:
+        parts = parts[:max_length // 2] + [f"... ({len(parts) - max_length} more) ..."] + parts[-(max_length // 2):]
+    return " -> ".join(parts)
+
+
+def log_report(analyzer, min_loop_depth):
+    """Log the longest chains and the likely matching loops."""
+    logging.info(f"Longest chains of instantiations ({sum(analyzer.instantiations)} instantiations in total):")
+    for depth, log_name, names in analyzer.chains:
+        logging.info(f"  {depth} instantiations ({log_name}): {abbreviate(names)}")
+
+    loops = analyzer.likely_loops(min_loop_depth)
+    if not loops:
+        logging.info(f"No likely matching loops (no cycle of quantifiers with a chain of at least {min_loop_depth} "
+                     f"instantiations).")
+    for i, key in enumerate(loops):
+        depth, names, instantiations = analyzer.loops[key]
+        logging.warning(f"Likely matching loop {i}: {', '.join(sorted(key))} ({instantiations} instantiations, chains "
+                        f"of up to {depth} instantiations): {abbreviate(names)}")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("trace_path", type=trace_or_program_path, nargs="+",
+                        help=("Z3 trace logs (.log or .log.gz) to be analyzed, or a single Gobra or Viper program "
+                              "whose queries are traced"))
+    parser.add_argument("--silicon_path", type=file_path, required=False,
+                        help="path to silicon.sh, used once to dump the queries of a program")
+    parser.add_argument("--z3_path", type=file_path, required=False, default=os.environ.get("Z3_EXE"),
+                        help="path to Z3 binary, used to trace the queries of a program (defaults to Z3_EXE)")
+    parser.add_argument("--gobra_path", type=file_path, required=False,
+                        help="path to Gobra jar")
+    parser.add_argument("--disableSetAxiomatization", action="store_true", required=False,
+                        help="disable the axiomatization of set operations when dumping the queries.")
+    parser.add_argument("--redump", action="store_true", required=False,
+                        help="dump the queries again even if they have been dumped before.")
+    parser.add_argument("--seed", type=int, required=False, default=0,
+                        help="random seed of Z3 when tracing the queries")
+    parser.add_argument("--keep_traces", action="store_true", required=False,
+                        help="keep the trace logs of the queries, which may be large.")
+    parser.add_argument("--output_dir", type=Path, required=False,
+                        help="directory of the results (defaults to the directory of the first trace log or program)")
+    parser.add_argument("--top", type=positive, required=False, default=10,
+                        help="number of longest chains that are reported")
+    parser.add_argument("--min_loop_depth", type=positive, required=False, default=10,
+                        help=("minimum length of a chain of instantiations within a cycle of quantifiers for the "
+                              "cycle to be reported as a likely matching loop"))
+    # The queries are dumped as by replay.py, and Gobra packages are translated as by profile.py.
+    parser.set_defaults(z3RandomizeSeeds=False, granularity=1, include_path=None, parallel_verifiers=1,
+                        parallelize_branches=False)
+    args = parser.parse_args()
+    if args.trace_path[0].suffix not in (".log", ".gz") and (args.silicon_path is None or args.z3_path is None):
+        parser.error("tracing a program requires --silicon_path and --z3_path")
+    return args
+
+
+def trace_or_program_path(string):
+    """Checks that the string is a valid path to a trace log or a Gobra or Viper program."""
+    path = Path(string)
+    if path.suffix in (".log", ".gz"):
+        return file_path(string)
+
+    return program_path(string)
+
+
+if __name__ == "__main__":
+    main()